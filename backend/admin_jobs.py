@@ -0,0 +1,150 @@
+"""
+Background admin jobs: bulk plan changes applied in bounded chunks with progress
+
+A job runs in the worker that accepted it; its status and progress are
+written to the jobs collection after every chunk, so any worker can answer a
+poll. A worker that shuts down records its unfinished jobs as cancelled.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Optional, List, Callable, AsyncIterator, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class AdminJob:
+    def __init__(self, kind: str, owner_id: str, params: dict):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.owner_id = owner_id
+        self.params = params
+        self.status = "queued"
+        self.total: Optional[int] = None
+        self.processed = 0
+        self.modified = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": min(1.0, self.processed / self.total) if self.total else (1.0 if self.status == "completed" else 0.0),
+            "processed": self.processed,
+            "modified": self.modified,
+            "total": self.total,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    def to_doc(self, retention: float) -> dict:
+        """Stored form: the polled view plus what the jobs collection is queried and expired by"""
+        return dict(self.to_dict(), owner_id=self.owner_id,
+                    expires_at=datetime.utcfromtimestamp(self.created_at + retention))
+
+
+async def _chunked(ids: AsyncIterator[str], size: int) -> AsyncIterator[List[str]]:
+    chunk = []
+    async for user_id in ids:
+        chunk.append(user_id)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class AdminJobManager:
+    KINDS = ["plan_change"]
+
+    def __init__(self, users_repo, jobs_repo, on_users_changed: Callable[[List[str]], None],
+                 chunk_size: int = 1000, retention: float = 86400):
+        self.users_repo = users_repo
+        self.repository = jobs_repo
+        self.on_users_changed = on_users_changed
+        self.chunk_size = chunk_size
+        self.retention = retention
+        # Only the jobs running in this worker; finished ones live in the jobs collection
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def _track(self, job: AdminJob, work) -> AdminJob:
+        await self.repository.create(job.to_doc(self.retention))
+        self._tasks[job.id] = asyncio.create_task(self._run(job, work))
+        return job
+
+    async def _save(self, job: AdminJob):
+        # A lost progress write must not fail the job itself; the next one catches up
+        try:
+            await self.repository.update(job.id, job.to_dict())
+        except Exception:
+            logger.exception("Failed to record progress of admin job %s", job.id)
+
+    async def _run(self, job: AdminJob, work):
+        job.status = "running"
+        try:
+            await self._save(job)
+            await work(job)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.error = "interrupted by a worker shutdown"
+            raise
+        except Exception as e:
+            logger.exception("Admin job %s failed", job.id)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+            await self._save(job)
+
+    async def change_plans(self, owner_id: str, new_plan: str, user_ids: Optional[List[str]] = None,
+                     query: Optional[dict] = None) -> AdminJob:
+        """Move the listed users, or everyone matching query, to new_plan"""
+        params = {"new_plan": new_plan}
+        params.update({"user_count": len(user_ids)} if user_ids is not None else {"filter": query})
+        job = AdminJob("plan_change", owner_id, params)
+
+        async def work(job: AdminJob):
+            if user_ids is not None:
+                unique_ids = list(dict.fromkeys(user_ids))
+                job.total = len(unique_ids)
+
+                async def ids():
+                    for user_id in unique_ids:
+                        yield user_id
+            else:
+                job.total = await self.users_repo.count(query)
+
+                async def ids():
+                    async for user in self.users_repo.iter_users(query, {"_id": 0, "id": 1}, batch_size=self.chunk_size):
+                        yield user["id"]
+
+            await self._save(job)
+            async for chunk in _chunked(ids(), self.chunk_size):
+                # Stamped per chunk: other workers evict cached principals by updated_at
+                fields = {"user_type": new_plan, "updated_at": datetime.utcnow()}
+                job.modified += await self.users_repo.update_many_by_ids(chunk, fields, unless={"user_type": new_plan})
+                job.processed += len(chunk)
+                # One eviction call per chunk, right after its write
+                self.on_users_changed(chunk)
+                await self._save(job)
+
+        return await self._track(job, work)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.repository.get(job_id, self.KINDS)
+
+    async def shutdown(self):
+        """Cancel the jobs running here and wait until each has recorded its final state"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
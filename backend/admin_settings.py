@@ -0,0 +1,134 @@
+"""
+Admin settings held in memory as an immutable, versioned snapshot
+
+Loaded once at startup; reads are a reference lookup. Every write increments
+the stored version, and each worker polls that version (an index-only query)
+to pick up changes made by its peers.
+"""
+import asyncio
+import copy
+import logging
+import os
+from types import MappingProxyType
+from typing import Optional, Mapping, Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "basic_plan_price": 29.99,
+    "premium_plan_price": 99.99,
+    "trading_api_keys": {},
+    "payment_api_keys": {},
+}
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class SettingsSnapshot:
+    """Read-only view of one settings version; replaced wholesale, never mutated"""
+
+    __slots__ = ("version", "values")
+
+    def __init__(self, document: dict):
+        self.version: int = document.get("version", 0)
+        self.values: Mapping[str, Any] = _freeze(document)
+
+    def __getitem__(self, key: str):
+        return self.values[key]
+
+    def get(self, key: str, default=None):
+        return self.values.get(key, default)
+
+    def to_dict(self) -> dict:
+        return _thaw(self.values)
+
+
+class SettingsService:
+    def __init__(self, repository, settings_type: str = "general", poll_interval: float = 5.0):
+        self.repository = repository
+        self.settings_type = settings_type
+        self.poll_interval = poll_interval
+        self._snapshot = SettingsSnapshot(dict(copy.deepcopy(DEFAULT_SETTINGS), type=settings_type, version=0))
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, repository) -> "SettingsService":
+        return cls(repository, poll_interval=float(os.getenv("SETTINGS_POLL_INTERVAL", "5")))
+
+    @property
+    def snapshot(self) -> SettingsSnapshot:
+        return self._snapshot
+
+    def _swap(self, document: dict):
+        snapshot = SettingsSnapshot(document)
+        # Versions only move forward, so a slow reload cannot undo a newer write
+        if snapshot.version >= self._snapshot.version:
+            self._snapshot = snapshot
+
+    async def load(self):
+        """Read the stored settings, creating the defaults document if it does not exist yet"""
+        try:
+            document = await self.repository.ensure_defaults(DEFAULT_SETTINGS, self.settings_type)
+        except Exception:
+            logger.exception("Failed to load admin settings; serving defaults until the next poll")
+            return
+        self._swap(document)
+        self._loaded = True
+
+    async def update(self, fields: dict) -> SettingsSnapshot:
+        document = await self.repository.update(fields, self.settings_type)
+        self._swap(document)
+        return self._snapshot
+
+    async def refresh(self) -> bool:
+        """Reload if another worker wrote a newer version; True if the snapshot changed"""
+        if not self._loaded:
+            previous = self._snapshot
+            await self.load()
+            return self._snapshot is not previous
+        version = await self.repository.get_version(self.settings_type)
+        if version is None or version == self._snapshot.version:
+            return False
+        document = await self.repository.get(self.settings_type)
+        if document is None:
+            return False
+        previous = self._snapshot
+        self._swap(document)
+        return self._snapshot is not previous
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if await self.refresh():
+                    logger.info("Admin settings reloaded at version %s", self._snapshot.version)
+            except Exception:
+                logger.exception("Admin settings poll failed")
+
+    def start(self):
+        if self._task is None and self.poll_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
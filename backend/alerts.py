@@ -0,0 +1,320 @@
+"""
+Price alerts: per-symbol sorted threshold indexes evaluated on every market tick
+
+Active alerts are held in one ThresholdIndex per (symbol, metric, condition).
+A tick looks up the entries it crosses with one bisect per index and removes
+them with a slice deletion, so evaluation costs O(log n + k) for k fired
+alerts no matter how many are armed. Alerts are one-shot: once fired they are
+recorded as triggered in MongoDB and never re-armed.
+
+The engine runs in the primary worker only. It loads the active alerts at
+startup and follows changes made through any worker by polling the
+collection on updated_at.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from collections import deque
+from typing import Optional, Dict, List, Callable, Tuple, Iterable, Deque, Set
+
+from metrics import ALERTS_TRIGGERED, STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+ABOVE, BELOW = "above", "below"
+METRICS = ("price", "change_24h_pct")
+
+# Below this many new entries, inserting one by one beats re-sorting the index
+BULK_INSERT_MIN = 64
+# Fired alerts are recorded in updates of at most this many ids
+RECORD_CHUNK = 5000
+
+IndexKey = Tuple[str, str, str]  # (symbol, metric, condition)
+
+
+class Alert:
+    __slots__ = ("id", "user_id", "symbol", "metric", "condition", "threshold")
+
+    def __init__(self, alert_id: str, user_id: str, symbol: str, metric: str, condition: str, threshold: float):
+        self.id = alert_id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.metric = metric
+        self.condition = condition
+        self.threshold = threshold
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Alert":
+        return cls(doc["id"], doc["user_id"], doc["symbol"], doc["metric"], doc["condition"], float(doc["threshold"]))
+
+    @property
+    def index_key(self) -> IndexKey:
+        return self.symbol, self.metric, self.condition
+
+
+def alert_event(alert: dict) -> dict:
+    """Push-channel event for a triggered alert document (or the equivalent fields)"""
+    return {
+        "type": "triggered",
+        "user_id": alert["user_id"],
+        "alert": {
+            "id": alert["id"],
+            "symbol": alert["symbol"],
+            "metric": alert["metric"],
+            "condition": alert["condition"],
+            "threshold": alert["threshold"],
+            "value": alert["triggered_value"],
+            "triggered_at": alert["triggered_at"],
+        },
+    }
+
+
+class ThresholdIndex:
+    """Alerts of one (symbol, metric, condition), ordered so the ones a value crosses form a suffix
+
+    keys are thresholds for "below" alerts and negated thresholds for "above",
+    ascending. A value v crosses every entry whose key >= key(v): one bisect
+    finds them and deleting from the end of a list moves nothing else.
+    Removed alerts are left in place and skipped when popped (dead counts
+    them) until compact() drops them.
+    """
+
+    def __init__(self, condition: str):
+        self.sign = -1.0 if condition == ABOVE else 1.0
+        self.keys: List[float] = []
+        self.ids: List[str] = []
+        self.dead = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, threshold: float, alert_id: str):
+        key = self.sign * threshold
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.ids.insert(i, alert_id)
+
+    def add_many(self, entries: List[Tuple[float, str]]):
+        if len(entries) < BULK_INSERT_MIN:
+            for threshold, alert_id in entries:
+                self.add(threshold, alert_id)
+            return
+        keys = self.keys + [self.sign * threshold for threshold, _ in entries]
+        ids = self.ids + [alert_id for _, alert_id in entries]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.ids = [ids[i] for i in order]
+
+    def pop_crossed(self, value: float) -> List[str]:
+        i = bisect_left(self.keys, self.sign * value)
+        if i == len(self.keys):
+            return []
+        crossed = self.ids[i:]
+        del self.keys[i:]
+        del self.ids[i:]
+        return crossed
+
+    def compact(self, live: Dict[str, Alert]):
+        keep = [i for i, alert_id in enumerate(self.ids) if alert_id in live]
+        self.keys = [self.keys[i] for i in keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.dead = 0
+
+
+class AlertEngine:
+    def __init__(self, repository, sync_interval: float = 2.0, sync_overlap: float = 5.0):
+        self.repository = repository
+        self.sync_interval = sync_interval
+        self.sync_overlap = timedelta(seconds=sync_overlap)
+        self._alerts: Dict[str, Alert] = {}
+        self._indexes: Dict[IndexKey, ThresholdIndex] = {}
+        self._listeners: List[Callable[[dict], None]] = []
+        # Fired ids a lagging read could still report as active, expired a batch at a time
+        self._fired: Set[str] = set()
+        self._fired_batches: Deque[Tuple[float, List[str]]] = deque()
+        self.fired_ttl = max(60.0, 4 * sync_overlap)
+        self._unrecorded: List[Tuple[List[str], float, datetime]] = []
+        self._wakeup = asyncio.Event()
+        self._cursor: Optional[datetime] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # Events ------------------------------------------------------------
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """Register a callback receiving an event per triggered alert"""
+        self._listeners.append(listener)
+
+    def _emit(self, event: dict):
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Alert listener failed")
+
+    # Registration ------------------------------------------------------
+
+    def add(self, alert: Alert) -> bool:
+        if alert.id in self._alerts or alert.id in self._fired:
+            return False
+        self._alerts[alert.id] = alert
+        index = self._indexes.get(alert.index_key)
+        if index is None:
+            index = self._indexes[alert.index_key] = ThresholdIndex(alert.condition)
+        index.add(alert.threshold, alert.id)
+        return True
+
+    def add_many(self, alerts: Iterable[Alert]):
+        """Bulk load: each index is sorted once instead of taking n inserts"""
+        batches: Dict[IndexKey, List[Tuple[float, str]]] = {}
+        for alert in alerts:
+            if alert.id in self._alerts or alert.id in self._fired:
+                continue
+            self._alerts[alert.id] = alert
+            batches.setdefault(alert.index_key, []).append((alert.threshold, alert.id))
+        for key, entries in batches.items():
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = ThresholdIndex(key[2])
+            index.add_many(entries)
+
+    def remove(self, alert_id: str) -> Optional[Alert]:
+        alert = self._alerts.pop(alert_id, None)
+        if alert is not None:
+            index = self._indexes[alert.index_key]
+            index.dead += 1
+            if index.dead * 2 > len(index):
+                index.compact(self._alerts)
+                if not index:
+                    del self._indexes[alert.index_key]
+        return alert
+
+    def apply(self, docs: Iterable[dict]):
+        """Arm active alerts, disarm the rest"""
+        added = []
+        for doc in docs:
+            if doc["status"] == "active":
+                added.append(Alert.from_doc(doc))
+            else:
+                self.remove(doc["id"])
+        self.add_many(added)
+
+    def active_count(self) -> int:
+        return len(self._alerts)
+
+    # Evaluation --------------------------------------------------------
+
+    def evaluate(self, symbol: str, metric: str, value: float) -> List[Alert]:
+        """Pop every alert on symbol/metric that value crosses"""
+        fired = []
+        for condition in (ABOVE, BELOW):
+            key = (symbol, metric, condition)
+            index = self._indexes.get(key)
+            if index is None:
+                continue
+            for alert_id in index.pop_crossed(value):
+                alert = self._alerts.pop(alert_id, None)
+                if alert is None:
+                    index.dead -= 1
+                else:
+                    fired.append(alert)
+            if not index:
+                del self._indexes[key]
+        return fired
+
+    def on_snapshot(self, snapshot):
+        """MarketDataService listener: fire the alerts crossed by the quotes refreshed in this snapshot"""
+        if not self._alerts:
+            return
+        now = datetime.utcnow()
+        with STAGE_DURATION.time(stage="alert_evaluation"):
+            for symbol in snapshot.updated:
+                quote = snapshot.by_symbol[symbol]
+                for metric, value in (("price", quote.price), ("change_24h_pct", quote.change_24h_pct)):
+                    if value is None:
+                        continue
+                    fired = self.evaluate(symbol, metric, value)
+                    if fired:
+                        self._fire(symbol, fired, value, now)
+
+    def _fire(self, symbol: str, fired: List[Alert], value: float, now: datetime):
+        ids = [alert.id for alert in fired]
+        self._fired.update(ids)
+        self._fired_batches.append((time.monotonic(), ids))
+        for start in range(0, len(ids), RECORD_CHUNK):
+            self._unrecorded.append((ids[start:start + RECORD_CHUNK], value, now))
+        self._wakeup.set()
+        ALERTS_TRIGGERED.inc(len(fired), symbol=symbol)
+        for alert in fired:
+            self._emit(alert_event({
+                "id": alert.id, "user_id": alert.user_id, "symbol": alert.symbol, "metric": alert.metric,
+                "condition": alert.condition, "threshold": alert.threshold,
+                "triggered_value": value, "triggered_at": now,
+            }))
+
+    # Persistence -------------------------------------------------------
+
+    async def load(self):
+        """Arm every active alert; changes from here on are picked up by sync()"""
+        started = datetime.utcnow()
+        self.add_many([Alert.from_doc(doc) async for doc in self.repository.iter_active()])
+        self._cursor = started
+        logger.info("Loaded %d active price alerts", len(self._alerts))
+
+    async def sync(self):
+        """Apply alerts created or changed through any worker since the last sync
+
+        Reads overlap the previous window by sync_overlap so writes that commit
+        late are not missed; applying a document twice is harmless.
+        """
+        expired = time.monotonic() - self.fired_ttl
+        while self._fired_batches and self._fired_batches[0][0] < expired:
+            self._fired.difference_update(self._fired_batches.popleft()[1])
+        if self._cursor is None:
+            await self.load()
+            return
+        docs = [doc async for doc in self.repository.changed_since(self._cursor - self.sync_overlap)]
+        if docs:
+            self._cursor = max(self._cursor, max(doc["updated_at"] for doc in docs))
+            self.apply(docs)
+
+    async def flush(self):
+        """Record fired alerts as triggered; failed writes are kept for the next attempt"""
+        while self._unrecorded:
+            ids, value, at = self._unrecorded[0]
+            await self.repository.mark_triggered(ids, value, at)
+            self._unrecorded.pop(0)
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Failed to sync price alerts")
+
+    async def _record_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to record triggered price alerts")
+                await asyncio.sleep(1.0)
+                self._wakeup.set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._sync_loop()), asyncio.create_task(self._record_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to record triggered price alerts on shutdown")
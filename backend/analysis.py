@@ -0,0 +1,334 @@
+"""
+AI market analysis: pluggable LLM providers, request coalescing and a TTL result cache
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Tuple, AsyncIterator, Awaitable, Callable
+
+
+from cache import TTLCache
+from metrics import LLM_PROMPT_CHARS, external_call
+
+logger = logging.getLogger(__name__)
+
+AnalysisKey = Tuple[str, str, str]
+
+
+def build_prompt(symbol: str, timeframe: str, analysis_type: str, market_context: str) -> str:
+    return f"""
+        As a professional trading analyst, analyze the following market data for {symbol}:
+
+        Market Context: {market_context}
+        Timeframe: {timeframe}
+        Analysis Type: {analysis_type}
+
+        Please provide:
+        1. Market Overview
+        2. Technical Analysis (if applicable)
+        3. Key Support/Resistance levels
+        4. Trend Direction
+        5. Risk Assessment
+        6. Trading Recommendations
+
+        Keep the analysis concise but comprehensive.
+        """
+
+
+def format_quote_context(symbol: str, quote) -> str:
+    """Compact one-line market context for a single symbol (quote: a quotes.Quote or None)"""
+    if not quote:
+        return f"No current quote available for {symbol}"
+    if quote.asset_class == "forex":
+        parts = [f"{symbol} rate: {quote.price:.5f}"]
+    else:
+        parts = [f"{symbol} price: ${quote.price}"]
+    if quote.change_24h_pct is not None:
+        parts.append(f"24h change: {quote.change_24h_pct:.2f}%")
+    if quote.market_cap is not None:
+        parts.append(f"market cap: ${quote.market_cap:,.0f}")
+    return ", ".join(parts)
+
+
+def format_indicator_context(indicators: Optional[Dict[str, Any]], timeframe: str) -> str:
+    """Computed indicator values, so the model doesn't have to do the arithmetic, labelled with their bar size"""
+    if not indicators:
+        return f"No {timeframe} indicator history available yet"
+    values = [f"{name}={value}" for name, value in indicators.items() if value is not None]
+    return f"Computed indicators on {timeframe} bars: " + ", ".join(values)
+
+
+class AnalysisProvider:
+    """Interface for LLM backends used by the analysis service"""
+
+    name = "provider"
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield text as it is produced; closing the iterator stops generation"""
+        yield await self.generate(prompt)
+
+    def close(self):
+        pass
+
+
+class GeminiProvider(AnalysisProvider):
+    """Google Gemini; the blocking SDK call runs on a bounded thread pool"""
+
+    name = "Gemini AI"
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash", max_workers: int = 8):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+
+    @property
+    def model(self):
+        # The SDK takes about half a second to import: load it on the first
+        # call (on the pool) instead of at server import
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, prompt: str) -> str:
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self._executor, lambda: self.model.generate_content(prompt))
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # The SDK's streaming iterator is blocking: drain it on the pool and hand
+        # chunks to the loop through a queue. Setting `stopped` ends the upstream read.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, ("chunk", chunk.text))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+
+        loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    break
+        finally:
+            stopped.set()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FakeProvider(AnalysisProvider):
+    """Canned responses for local development and tests"""
+
+    name = "Fake AI"
+
+    def __init__(self, text: str = "Fake market analysis.", delay: float = 0.0):
+        self.text = text
+        self.delay = delay
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return f"{self.text}\n\n{prompt.strip()}"
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        self.calls += 1
+        for word in f"{self.text}\n\n{prompt.strip()}".split(" "):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield word + " "
+
+
+def provider_from_env() -> AnalysisProvider:
+    if os.getenv("ANALYSIS_PROVIDER", "gemini").lower() == "fake":
+        return FakeProvider(delay=float(os.getenv("FAKE_ANALYSIS_DELAY", "0")))
+    return GeminiProvider(
+        api_key=os.getenv("GEMINI_API_KEY"),
+        model_name=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+        max_workers=int(os.getenv("GEMINI_MAX_WORKERS", "8")),
+    )
+
+
+class AnalysisResult:
+    def __init__(self, text: str, generated_at: datetime, analyst: str, cached: bool = False):
+        self.text = text
+        self.generated_at = generated_at
+        self.analyst = analyst
+        self.cached = cached
+
+
+class _ChargeFailed(Exception):
+    """The caller that started an in-flight analysis could not be charged for it"""
+
+    def __init__(self, error: Exception):
+        super().__init__(str(error))
+        self.error = error
+
+
+class AnalysisService:
+    """Runs one upstream call per (symbol, timeframe, analysis_type) per TTL window
+
+    With a store attached, every result is also persisted under a content key
+    (request plus the market context it was generated from). Any worker that
+    sees the same inputs within the TTL answers from storage instead of the model.
+    """
+
+    def __init__(self, provider: AnalysisProvider, ttl: float = 300.0, max_entries: int = 1024,
+                 store=None, retention: float = 7 * 86400):
+        self.provider = provider
+        self.ttl = ttl
+        self.store = store
+        self.retention = retention
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._inflight: Dict[AnalysisKey, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls, store=None) -> "AnalysisService":
+        return cls(
+            provider_from_env(),
+            ttl=float(os.getenv("ANALYSIS_CACHE_TTL", "300")),
+            max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "1024")),
+            store=store,
+            retention=float(os.getenv("ANALYSIS_HISTORY_RETENTION", str(7 * 86400))),
+        )
+
+    @staticmethod
+    def make_key(symbol: str, timeframe: str, analysis_type: str) -> AnalysisKey:
+        return (symbol.upper(), timeframe, analysis_type)
+
+    @staticmethod
+    def make_content_key(key: AnalysisKey, market_context: str) -> str:
+        """Stable across workers and restarts, unlike the in-process snapshot version counter"""
+        return hashlib.sha256("\x1f".join(key + (market_context,)).encode()).hexdigest()
+
+    def get_cached(self, key: AnalysisKey, count: bool = True) -> Optional[AnalysisResult]:
+        """Memory-cached result; repeat checks within one request pass count=False so it counts once"""
+        result = self._cache.get(key) if count else self._cache.peek(key)
+        if result is None:
+            return None
+        return AnalysisResult(result.text, result.generated_at, result.analyst, cached=True)
+
+    async def lookup(self, key: AnalysisKey, content_key: str) -> Optional[AnalysisResult]:
+        """Memory cache first, then a still-valid stored analysis of the same inputs"""
+        cached = self.get_cached(key, count=False)
+        if cached is not None or self.store is None:
+            return cached
+        try:
+            stored = await self.store.find_valid(content_key, datetime.utcnow())
+        except Exception as e:
+            logger.warning("Analysis history lookup failed: %s", e)
+            return None
+        if stored is None:
+            return None
+        result = AnalysisResult(stored["text"], stored["generated_at"], stored["analyst"])
+        remaining = (stored["valid_until"] - datetime.utcnow()).total_seconds()
+        self._cache.set(key, result, ttl=max(remaining, 0.0))
+        return AnalysisResult(result.text, result.generated_at, result.analyst, cached=True)
+
+    async def _record(self, key: AnalysisKey, content_key: Optional[str], result: AnalysisResult):
+        self._cache.set(key, result)
+        if self.store is None or content_key is None:
+            return
+        symbol, timeframe, analysis_type = key
+        try:
+            await self.store.save({
+                "key": content_key,
+                "symbol": symbol,
+                "timeframe": timeframe,
+                "analysis_type": analysis_type,
+                "text": result.text,
+                "analyst": result.analyst,
+                "generated_at": result.generated_at,
+                "valid_until": result.generated_at + timedelta(seconds=self.ttl),
+                "expires_at": result.generated_at + timedelta(seconds=max(self.retention, self.ttl)),
+            })
+        except Exception as e:
+            # The caller still gets its analysis; only cross-worker reuse is lost
+            logger.warning("Saving analysis history failed: %s", e)
+
+    async def _run(self, key: AnalysisKey, prompt: str, content_key: Optional[str],
+                   charge: Optional[Callable[[], Awaitable[None]]]) -> AnalysisResult:
+        try:
+            if charge is not None:
+                try:
+                    await charge()
+                except Exception as e:
+                    raise _ChargeFailed(e)
+            LLM_PROMPT_CHARS.observe(len(prompt))
+            with external_call("llm", "generate"):
+                text = await self.provider.generate(prompt)
+            result = AnalysisResult(text, datetime.utcnow(), self.provider.name)
+            await self._record(key, content_key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def analyze(self, key: AnalysisKey, prompt: str, content_key: Optional[str] = None,
+                      charge: Optional[Callable[[], Awaitable[None]]] = None) -> AnalysisResult:
+        """Serve from cache, join an identical in-flight call, or start a new one
+
+        charge() runs only for the caller that starts the call, before the
+        model is reached; callers joining it pay nothing. If the starter's
+        charge fails, it gets that error and the joined callers start over.
+        """
+        while True:
+            cached = self.get_cached(key, count=False)
+            if cached is not None:
+                return cached
+            task = self._inflight.get(key)
+            started = task is None
+            if started:
+                task = asyncio.create_task(self._run(key, prompt, content_key, charge))
+                self._inflight[key] = task
+            try:
+                # Shield so one disconnecting client doesn't cancel the call for the others
+                return await asyncio.shield(task)
+            except _ChargeFailed as e:
+                if started:
+                    raise e.error
+
+    async def stream(self, key: AnalysisKey, prompt: str, content_key: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream a fresh analysis chunk by chunk; only a run that completes is cached"""
+        parts = []
+        LLM_PROMPT_CHARS.observe(len(prompt))
+        with external_call("llm", "stream"):
+            async with aclosing(self.provider.stream(prompt)) as chunks:
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield chunk
+        await self._record(key, content_key, AnalysisResult("".join(parts), datetime.utcnow(), self.provider.name))
+
+    def cache_stats(self) -> Dict[str, int]:
+        return {"hit": self._cache.hits, "miss": self._cache.misses}
+
+    def close(self):
+        self.provider.close()
+
@@ -0,0 +1,254 @@
+"""
+Backtesting: replays stored candles through the live bot strategies
+
+Signals for every bar are computed in one vectorized pass. The position
+logic is path-dependent, so the simulator jumps from entry to entry and
+searches each holding period for its exit in vectorized windows. Parameter
+sweeps run as background jobs on a process pool; workers memory-map the
+candles themselves instead of receiving them over IPC. Job state is kept in
+the jobs collection so that any worker can answer a poll.
+"""
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional, List, Tuple, Dict
+
+import numpy as np
+
+from candles import CandleStore
+from strategies import BUY_CODE, SELL_CODE, RISK_ALLOCATION, TIMEFRAME_SECONDS, crossover_signals, exit_reason
+
+logger = logging.getLogger(__name__)
+
+MAX_EQUITY_POINTS = 1000
+MAX_TRADES = 1000
+DETAIL_KEYS = ("equity_curve", "drawdown_curve", "trades")
+
+
+def _find_exit(closes: np.ndarray, signals: np.ndarray, entry: int, stop_loss: float,
+               take_profit: float, window: int = 256) -> Optional[int]:
+    """First bar after entry that hits stop-loss/take-profit or a SELL signal"""
+    entry_price = closes[entry]
+    lo = entry + 1
+    while lo < len(closes):
+        hi = min(len(closes), lo + window)
+        change = (closes[lo:hi] - entry_price) / entry_price * 100
+        hit = (change <= -stop_loss) | (change >= take_profit) | (signals[lo:hi] == SELL_CODE)
+        if hit.any():
+            return lo + int(np.argmax(hit))
+        lo = hi
+        window *= 2
+    return None
+
+
+def simulate(times: np.ndarray, closes: np.ndarray, config: dict, initial_capital: float = 10000.0) -> dict:
+    """Run one strategy config over one price series"""
+    n = len(closes)
+    signals = crossover_signals(closes, config["strategy"])
+    amount = config["max_trade_amount"] * RISK_ALLOCATION[config["risk_level"]]
+    buys = np.flatnonzero(signals == BUY_CODE)
+
+    realized_steps = np.zeros(n)
+    unrealized = np.zeros(n)
+    trades: List[dict] = []
+    wins = 0
+    trade_count = 0
+    i = 0
+    while True:
+        k = int(np.searchsorted(buys, i))
+        if k == len(buys):
+            break
+        entry = int(buys[k])
+        entry_price = float(closes[entry])
+        quantity = amount / entry_price
+        exit_index = _find_exit(closes, signals, entry, config["stop_loss"], config["take_profit"])
+        end = exit_index if exit_index is not None else n
+        unrealized[entry:end] = quantity * (closes[entry:end] - entry_price)
+        trade = {"entry_time": int(times[entry]), "entry_price": entry_price, "quantity": quantity}
+        trade_count += 1
+        if exit_index is None:
+            trade.update({"exit_time": None, "exit_price": None, "pnl": float(unrealized[-1]), "reason": "open"})
+            if len(trades) < MAX_TRADES:
+                trades.append(trade)
+            break
+        exit_price = float(closes[exit_index])
+        pnl = quantity * (exit_price - entry_price)
+        realized_steps[exit_index] += pnl
+        wins += pnl > 0
+        trade.update({
+            "exit_time": int(times[exit_index]),
+            "exit_price": exit_price,
+            "pnl": pnl,
+            "reason": exit_reason(entry_price, exit_price, config["stop_loss"], config["take_profit"]) or "signal",
+        })
+        if len(trades) < MAX_TRADES:
+            trades.append(trade)
+        # Like the live engine, no new entry on the bar that closed a position
+        i = exit_index + 1
+
+    equity = initial_capital + np.cumsum(realized_steps) + unrealized
+    if n:
+        peak = np.maximum.accumulate(equity)
+        drawdown = equity / peak - 1
+    else:
+        drawdown = np.zeros(0)
+    points = np.unique(np.linspace(0, n - 1, min(n, MAX_EQUITY_POINTS)).astype(int)) if n else np.zeros(0, dtype=int)
+    closed = trade_count - (1 if trades and trades[-1]["reason"] == "open" else 0)
+    return {
+        "bars": n,
+        "initial_capital": initial_capital,
+        "final_equity": float(equity[-1]) if n else initial_capital,
+        "total_return_pct": float((equity[-1] / initial_capital - 1) * 100) if n else 0.0,
+        "max_drawdown_pct": float(drawdown.min() * 100) if n else 0.0,
+        "total_trades": trade_count,
+        "win_rate_pct": float(wins / closed * 100) if closed else 0.0,
+        "equity_curve": {"time": times[points].tolist(), "equity": equity[points].round(2).tolist()},
+        "drawdown_curve": {"time": times[points].tolist(), "drawdown_pct": (drawdown[points] * 100).round(3).tolist()},
+        "trades": trades,
+    }
+
+
+def run_backtest_task(store_root: str, pair: str, timeframe: str, start: Optional[int], end: Optional[int],
+                      config: dict, initial_capital: float) -> dict:
+    """Process-pool entry point: load candles from disk, resampled to timeframe, and simulate"""
+    symbol = pair.split("/")[0].upper()
+    bars = CandleStore(store_root).closes(symbol, TIMEFRAME_SECONDS[timeframe], start, end)
+    result = simulate(bars["time"], bars["close"], config, initial_capital)
+    result.update({"pair": pair, "stop_loss": config["stop_loss"], "take_profit": config["take_profit"]})
+    return result
+
+
+class BacktestJob:
+    def __init__(self, user_id: str, total: int):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.status = "queued"
+        self.total = total
+        self.completed = 0
+        # Every combination's summary; curves and trades are kept only for the best run so far
+        self.summaries: List[dict] = []
+        self.best: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @staticmethod
+    def _rank(result: dict) -> Tuple[bool, float]:
+        return result["bars"] > 0, result["total_return_pct"]
+
+    def add_result(self, result: dict):
+        self.summaries.append({key: value for key, value in result.items() if key not in DETAIL_KEYS})
+        if self.best is None or self._rank(result) > self._rank(self.best):
+            self.best = result
+        self.completed += 1
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.completed / self.total if self.total else 1.0,
+            "completed": self.completed,
+            "total": self.total,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if include_results and self.status == "completed":
+            data.update({"results": self.summaries, "best": self.best})
+        return data
+
+    def to_doc(self, retention: float) -> dict:
+        """Stored form: the polled view plus what the jobs collection is queried and expired by"""
+        return dict(self.to_dict(), kind="backtest", owner_id=self.user_id,
+                    expires_at=datetime.utcfromtimestamp(self.created_at + retention))
+
+
+class BacktestJobManager:
+    KINDS = ["backtest"]
+
+    def __init__(self, store_root: str, jobs_repo, max_workers: Optional[int] = None,
+                 max_active_per_user: int = 2, retention: float = 86400, progress_interval: float = 1.0):
+        self.store_root = store_root
+        self.repository = jobs_repo
+        self.max_workers = max_workers
+        self.max_active_per_user = max_active_per_user
+        self.retention = retention
+        self.progress_interval = progress_interval
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Only the jobs running in this worker; finished ones live in the jobs collection
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def active_jobs(self, user_id: str) -> int:
+        """Queued or running backtests of this user, across all workers"""
+        return await self.repository.count_active(user_id, "backtest")
+
+    async def submit(self, user_id: str, config: dict, pairs: List[str], stop_losses: List[float],
+               take_profits: List[float], timeframe: str, start: Optional[int], end: Optional[int],
+               initial_capital: float) -> BacktestJob:
+        combos: List[Tuple[str, float, float]] = list(itertools.product(pairs, stop_losses, take_profits))
+        job = BacktestJob(user_id, len(combos))
+        await self.repository.create(job.to_doc(self.retention))
+        self._tasks[job.id] = asyncio.create_task(
+            self._run(job, combos, config, timeframe, start, end, initial_capital))
+        return job
+
+    async def _save(self, job: BacktestJob):
+        # A lost progress write must not fail the job itself; the next one catches up
+        try:
+            await self.repository.update(job.id, job.to_dict())
+        except Exception:
+            logger.exception("Failed to record progress of backtest job %s", job.id)
+
+    async def _run(self, job: BacktestJob, combos, config, timeframe, start, end, initial_capital):
+        loop = asyncio.get_running_loop()
+        job.status = "running"
+        try:
+            await self._save(job)
+            saved_at = time.monotonic()
+            futures = []
+            for pair, stop_loss, take_profit in combos:
+                combo_config = dict(config, stop_loss=stop_loss, take_profit=take_profit)
+                futures.append(loop.run_in_executor(
+                    self._pool(), run_backtest_task,
+                    self.store_root, pair, timeframe, start, end, combo_config, initial_capital,
+                ))
+            for future in asyncio.as_completed(futures):
+                job.add_result(await future)
+                # Large sweeps finish many runs a second; progress is written at most once per interval
+                if time.monotonic() - saved_at >= self.progress_interval:
+                    await self._save(job)
+                    saved_at = time.monotonic()
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.error = "interrupted by a worker shutdown"
+            raise
+        except Exception as e:
+            logger.exception("Backtest job %s failed", job.id)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+            await self._save(job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.repository.get(job_id, self.KINDS)
+
+    async def shutdown(self):
+        """Cancel the jobs running here, wait until each has recorded its final state, stop the pool"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
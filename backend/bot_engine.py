@@ -0,0 +1,279 @@
+"""
+Trading bot engine: runs every active bot on its timeframe tick against the shared market feed
+
+Bots that trade the same pair on the same timeframe are evaluated as one group:
+the price lookup and strategy signal are computed once per group and strategy,
+then applied to each bot's positions. One scheduler task exists per timeframe,
+not per bot.
+
+Strategy signals are taken on bar close only, but stop loss and take profit
+are checked against every market snapshot so exits don't wait for the bar.
+A group's close history is seeded from the candle store when it is created.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, List, Callable, Tuple, Deque
+
+from candles import CandleStore
+from market_data import MarketDataService
+from strategies import (
+    BUY, SELL, RISK_ALLOCATION, TIMEFRAME_SECONDS,
+    crossover_signal, exit_reason, history_needed,
+)
+
+logger = logging.getLogger(__name__)
+
+GroupKey = Tuple[str, str]  # (pair, timeframe)
+
+
+def pair_base(pair: str) -> str:
+    """'BTC/USD' -> 'BTC'"""
+    return pair.split("/")[0].upper()
+
+
+class Position:
+    def __init__(self, pair: str, quantity: float, entry_price: float, amount: float):
+        self.pair = pair
+        self.quantity = quantity
+        self.entry_price = entry_price
+        self.amount = amount
+        self.opened_at = datetime.utcnow()
+
+    def to_dict(self) -> dict:
+        return {
+            "pair": self.pair,
+            "quantity": self.quantity,
+            "entry_price": self.entry_price,
+            "amount": self.amount,
+            "opened_at": self.opened_at,
+        }
+
+
+class BotState:
+    """One user's running bot: config, open positions and trade history"""
+
+    def __init__(self, user_id: str, config: dict, max_trades: int = 100):
+        self.user_id = user_id
+        self.config = config
+        self.positions: Dict[str, Position] = {}
+        self.trades: Deque[dict] = deque(maxlen=max_trades)
+        self.realized_pnl = 0.0
+        self.trade_count = 0
+        self.win_count = 0
+
+    def stats(self) -> dict:
+        return {
+            "total_trades": self.trade_count,
+            "winning_trades": self.win_count,
+            "realized_pnl": round(self.realized_pnl, 2),
+            "active_positions": len(self.positions),
+        }
+
+
+class PaperBroker:
+    """Stand-in broker: fills market orders instantly at the tick price"""
+
+    def buy(self, bot: BotState, pair: str, price: float, amount: float) -> dict:
+        position = Position(pair, amount / price, price, amount)
+        bot.positions[pair] = position
+        trade = {
+            "pair": pair, "side": "BUY", "price": price, "quantity": position.quantity,
+            "amount": amount, "pnl": 0.0, "reason": "signal", "time": position.opened_at,
+        }
+        bot.trades.append(trade)
+        bot.trade_count += 1
+        return trade
+
+    def sell(self, bot: BotState, pair: str, price: float, reason: str) -> dict:
+        position = bot.positions.pop(pair)
+        pnl = (price - position.entry_price) * position.quantity
+        trade = {
+            "pair": pair, "side": "SELL", "price": price, "quantity": position.quantity,
+            "amount": position.quantity * price, "pnl": pnl, "reason": reason, "time": datetime.utcnow(),
+        }
+        bot.trades.append(trade)
+        bot.trade_count += 1
+        bot.realized_pnl += pnl
+        if pnl > 0:
+            bot.win_count += 1
+        return trade
+
+
+class BotEngine:
+    def __init__(self, market_data: MarketDataService, broker: Optional[PaperBroker] = None, history_size: int = 200,
+                 candle_store: Optional[CandleStore] = None):
+        self.market_data = market_data
+        self.candle_store = candle_store
+        self.broker = broker or PaperBroker()
+        self.history_size = history_size
+        self._bots: Dict[str, BotState] = {}
+        self._groups: Dict[GroupKey, Dict[str, BotState]] = {}
+        self._closes: Dict[GroupKey, Deque[float]] = {}
+        self._listeners: List[Callable[[dict], None]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    # Events ------------------------------------------------------------
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """Register a callback receiving fill / exit / status events"""
+        self._listeners.append(listener)
+
+    def _emit(self, event: dict):
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Bot event listener failed")
+
+    # Registration ------------------------------------------------------
+
+    def get(self, user_id: str) -> Optional[BotState]:
+        return self._bots.get(user_id)
+
+    def activate(self, user_id: str, config: dict) -> BotState:
+        """Start (or reconfigure) a user's bot, keeping any open positions"""
+        previous = self._bots.get(user_id)
+        if previous is not None:
+            self._unregister(previous)
+        bot = BotState(user_id, config)
+        if previous is not None:
+            bot.positions = previous.positions
+            bot.trades = previous.trades
+            bot.realized_pnl = previous.realized_pnl
+            bot.trade_count = previous.trade_count
+            bot.win_count = previous.win_count
+        self._bots[user_id] = bot
+        for pair in config["trading_pairs"]:
+            key = (pair, config["timeframe"])
+            self._groups.setdefault(key, {})[user_id] = bot
+            if key not in self._closes:
+                self._closes[key] = self._stored_closes(pair, config["timeframe"])
+        self._emit({"type": "status", "user_id": user_id, "active": True})
+        return bot
+
+    def deactivate(self, user_id: str) -> Optional[BotState]:
+        bot = self._bots.pop(user_id, None)
+        if bot is not None:
+            self._unregister(bot)
+            self._emit({"type": "status", "user_id": user_id, "active": False})
+        return bot
+
+    def _unregister(self, bot: BotState):
+        for pair in bot.config["trading_pairs"]:
+            key = (pair, bot.config["timeframe"])
+            group = self._groups.get(key)
+            if group is not None:
+                group.pop(bot.user_id, None)
+                if not group:
+                    del self._groups[key]
+                    self._closes.pop(key, None)
+
+    def sync(self, configs: Dict[str, dict]):
+        """Make the running set match configs (user id -> config), touching only what changed"""
+        for user_id in [user_id for user_id in self._bots if user_id not in configs]:
+            self.deactivate(user_id)
+        for user_id, config in configs.items():
+            bot = self._bots.get(user_id)
+            if bot is None or bot.config != config:
+                self.activate(user_id, config)
+
+    def active_count(self) -> int:
+        return len(self._bots)
+
+    def _stored_closes(self, pair: str, timeframe: str) -> Deque[float]:
+        """Recent closes of pair on timeframe, resampled from the stored series"""
+        closes: Deque[float] = deque(maxlen=self.history_size)
+        if self.candle_store is None:
+            return closes
+        bars = self.candle_store.closes(pair_base(pair), TIMEFRAME_SECONDS[timeframe], limit=self.history_size)
+        closes.extend(bars["close"].tolist())
+        return closes
+
+    # Evaluation --------------------------------------------------------
+
+    def on_snapshot(self, snapshot):
+        """MarketDataService listener: close the positions whose stop loss or take profit the refreshed quotes hit"""
+        if not self._bots:
+            return
+        for bot in list(self._bots.values()):
+            for pair, position in list(bot.positions.items()):
+                base = pair_base(pair)
+                if base not in snapshot.updated:
+                    continue
+                price = snapshot.by_symbol[base].price
+                if price is None:
+                    continue
+                reason = exit_reason(position.entry_price, price, bot.config["stop_loss"], bot.config["take_profit"])
+                if reason is not None:
+                    self._exit(bot, pair, price, reason)
+
+    def _exit(self, bot: BotState, pair: str, price: float, reason: str):
+        trade = self.broker.sell(bot, pair, price, reason)
+        event_type = reason if reason != "signal" else "fill"
+        self._emit({"type": event_type, "user_id": bot.user_id, "trade": trade})
+
+    def tick(self, timeframe: str, prices: Dict[str, float]):
+        """Evaluate every group on this timeframe against the latest prices by ticker"""
+        for (pair, group_timeframe), group in list(self._groups.items()):
+            if group_timeframe != timeframe:
+                continue
+            price = prices.get(pair_base(pair))
+            if price is None:
+                continue
+            key = (pair, timeframe)
+            closes = self._closes.get(key)
+            if closes is None:
+                closes = self._closes[key] = deque(maxlen=self.history_size)
+            closes.append(price)
+            self._evaluate_group(pair, price, closes, group)
+
+    def _evaluate_group(self, pair: str, price: float, closes: Deque[float], group: Dict[str, BotState]):
+        signals: Dict[str, Optional[str]] = {}
+        history = list(closes)
+        for bot in list(group.values()):
+            config = bot.config
+            strategy = config["strategy"]
+            if strategy not in signals:
+                signals[strategy] = crossover_signal(history[-history_needed(strategy):], strategy)
+            signal = signals[strategy]
+
+            position = bot.positions.get(pair)
+            if position is not None:
+                reason = exit_reason(position.entry_price, price, config["stop_loss"], config["take_profit"])
+                if reason is None and signal == SELL:
+                    reason = "signal"
+                if reason is not None:
+                    self._exit(bot, pair, price, reason)
+            elif signal == BUY:
+                amount = config["max_trade_amount"] * RISK_ALLOCATION[config["risk_level"]]
+                trade = self.broker.buy(bot, pair, price, amount)
+                self._emit({"type": "fill", "user_id": bot.user_id, "trade": trade})
+
+    # Scheduling --------------------------------------------------------
+
+    async def _timeframe_loop(self, timeframe: str):
+        interval = TIMEFRAME_SECONDS[timeframe]
+        while True:
+            # Sleep to the next wall-clock boundary of this timeframe
+            await asyncio.sleep(interval - (time.time() % interval))
+            snapshot = self.market_data.snapshot
+            if snapshot is None or not self._bots:
+                continue
+            prices = {ticker: quote.price for ticker, quote in snapshot.by_symbol.items()}
+            try:
+                self.tick(timeframe, prices)
+            except Exception:
+                logger.exception("Bot tick failed for %s", timeframe)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._timeframe_loop(tf)) for tf in TIMEFRAME_SECONDS]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,239 @@
+"""
+Columnar OHLCV candle storage
+
+Each (symbol, timeframe) series is a directory of append-only column files of
+fixed-width values (time: int64 epoch seconds of the bar open; open, high,
+low, close, volume: float64). Reads memory-map the columns and binary-search
+the time column, so a range query only touches the pages it returns.
+"""
+import logging
+import os
+import re
+from typing import Optional, Dict, List, Callable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    ("time", np.int64),
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("volume", np.float64),
+)
+
+# Stored timeframes: ticks build 1m bars, which roll up into the others
+TIMEFRAMES = {"1m": 60, "1h": 3600, "1d": 86400}
+
+# Series directories are named after the ticker; nothing else is a valid path component
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9]+$")
+
+
+def base_timeframe(seconds: int) -> Optional[str]:
+    """Coarsest stored timeframe whose bars tile bars of `seconds` (1h for 4h, 1m for 5m); None if none does"""
+    tiling = [name for name, step in TIMEFRAMES.items() if seconds % step == 0]
+    return max(tiling, key=TIMEFRAMES.get) if tiling else None
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+
+
+class Candle:
+    """A bar being built (mutable until closed)"""
+
+    def __init__(self, time: int, open: float, high: float, low: float, close: float, volume: float = 0.0):
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def merge(self, high: float, low: float, close: float, volume: float):
+        self.high = max(self.high, high)
+        self.low = min(self.low, low)
+        self.close = close
+        self.volume += volume
+
+    def values(self) -> Tuple:
+        return (self.time, self.open, self.high, self.low, self.close, self.volume)
+
+
+class CandleSeries:
+    """One symbol/timeframe: append-only column files, memory-mapped for reads
+
+    The directory is only created by the first append; reads of a series that
+    was never written return no bars.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._paths = {name: os.path.join(directory, f"{name}.bin") for name, _ in COLUMNS}
+        self._writable = False
+
+    def __len__(self) -> int:
+        # A crash mid-append can leave columns of unequal length; readers use the shortest
+        return min(
+            (os.path.getsize(path) if os.path.exists(path) else 0) // np.dtype(dtype).itemsize
+            for (name, dtype), path in zip(COLUMNS, self._paths.values())
+        )
+
+    def _open_for_append(self):
+        """Cut every column back to the shortest so rows line up again after a partial append"""
+        os.makedirs(self.directory, exist_ok=True)
+        count = len(self)
+        for name, dtype in COLUMNS:
+            path = self._paths[name]
+            if os.path.exists(path) and os.path.getsize(path) > count * np.dtype(dtype).itemsize:
+                logger.warning("Truncating %s to %d rows after a partial append", path, count)
+                os.truncate(path, count * np.dtype(dtype).itemsize)
+        self._writable = True
+
+    def append(self, candle: Candle):
+        if not self._writable:
+            self._open_for_append()
+        # Value columns first, time last: readers size the series by the shortest column
+        values = dict(zip((name for name, _ in COLUMNS), candle.values()))
+        for name, dtype in COLUMNS[1:] + COLUMNS[:1]:
+            with open(self._paths[name], "ab") as f:
+                f.write(np.array([values[name]], dtype=dtype).tobytes())
+
+    def _column(self, name: str, dtype, count: int) -> np.ndarray:
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._paths[name], dtype=dtype, mode="r", shape=(count,))
+
+    def last_time(self) -> Optional[int]:
+        count = len(self)
+        return int(self._column("time", np.int64, count)[-1]) if count else None
+
+    def range(self, start: Optional[int] = None, end: Optional[int] = None, limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Bars with start <= time < end; with limit, the most recent `limit` of them"""
+        count = len(self)
+        if count == 0:
+            return _empty_columns()
+        times = self._column("time", np.int64, count)
+        lo = int(np.searchsorted(times, start, side="left")) if start is not None else 0
+        hi = int(np.searchsorted(times, end, side="left")) if end is not None else count
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        # np.array copies just the selected slice out of the mapping
+        return {name: np.array(self._column(name, dtype, count)[lo:hi]) for name, dtype in COLUMNS}
+
+
+class CandleStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._series: Dict[Tuple[str, str], CandleSeries] = {}
+
+    @staticmethod
+    def is_valid(symbol: str, timeframe: str) -> bool:
+        return bool(SYMBOL_PATTERN.match(symbol)) and timeframe in TIMEFRAMES
+
+    def series(self, symbol: str, timeframe: str) -> CandleSeries:
+        key = (symbol.upper(), timeframe)
+        if not self.is_valid(*key):
+            raise ValueError(f"Invalid candle series: {symbol!r} {timeframe!r}")
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = CandleSeries(os.path.join(self.root, key[0], timeframe))
+        return series
+
+    def append(self, symbol: str, timeframe: str, candle: Candle):
+        self.series(symbol, timeframe).append(candle)
+
+    def query(self, symbol: str, timeframe: str, start: Optional[int] = None,
+              end: Optional[int] = None, limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Bars of a stored series; unknown or never-written series have none"""
+        key = (symbol.upper(), timeframe)
+        if not self.is_valid(*key):
+            return _empty_columns()
+        series = self._series.get(key)
+        if series is None:
+            # Only series that exist on disk are cached, so junk lookups don't accumulate
+            directory = os.path.join(self.root, key[0], timeframe)
+            if not os.path.isdir(directory):
+                return _empty_columns()
+            series = self._series[key] = CandleSeries(directory)
+        return series.range(start, end, limit)
+
+    def closes(self, symbol: str, seconds: int, start: Optional[int] = None, end: Optional[int] = None,
+               limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Open times and closes of bars of `seconds`, resampled from the coarsest stored series that tiles them"""
+        timeframe = base_timeframe(seconds)
+        if timeframe is None:
+            return {name: column for name, column in _empty_columns().items() if name in ("time", "close")}
+        step = TIMEFRAMES[timeframe]
+        bars = self.query(symbol, timeframe, start, end, None if limit is None else limit * (seconds // step))
+        # A stored bar's close is a resampled bar's close when the stored bar ends on its boundary
+        last = (bars["time"] + step) % seconds == 0
+        return {"time": bars["time"][last] + step - seconds, "close": bars["close"][last]}
+
+    def symbols(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if SYMBOL_PATTERN.match(name) and os.path.isdir(os.path.join(self.root, name))
+        )
+
+
+class CandleBuilder:
+    """Aggregates polled ticks into 1m bars and rolls closed 1m bars up to 1h/1d"""
+
+    def __init__(self, store: CandleStore, persist: bool = True):
+        self.store = store
+        # With several workers only one of them writes the candle files
+        self.persist = persist
+        self._open: Dict[Tuple[str, str], Candle] = {}
+        self._listeners: List[Callable[[str, str, Candle], None]] = []
+
+    def add_listener(self, listener: Callable[[str, str, Candle], None]):
+        """Call listener(symbol, timeframe, candle) whenever a bar closes"""
+        self._listeners.append(listener)
+
+    def _close(self, symbol: str, timeframe: str, candle: Candle):
+        if self.persist:
+            try:
+                self.store.append(symbol, timeframe, candle)
+            except OSError:
+                logger.exception("Failed to persist %s %s candle", symbol, timeframe)
+        for listener in self._listeners:
+            try:
+                listener(symbol, timeframe, candle)
+            except Exception:
+                logger.exception("Candle listener failed")
+
+    def _merge(self, symbol: str, timeframe: str, time: int, high: float, low: float, close: float,
+               volume: float, open_price: float) -> Optional[Candle]:
+        """Fold a price/bar into the open bar; returns the bar it closed, if any"""
+        seconds = TIMEFRAMES[timeframe]
+        bucket = time - time % seconds
+        key = (symbol, timeframe)
+        current = self._open.get(key)
+        if current is not None and bucket <= current.time:
+            current.merge(high, low, close, volume)
+            return None
+        self._open[key] = Candle(bucket, open_price, high, low, close, volume)
+        if current is not None:
+            self._close(symbol, timeframe, current)
+        return current
+
+    def add_tick(self, symbol: str, price: float, timestamp: float, volume: float = 0.0):
+        closed = self._merge(symbol, "1m", int(timestamp), price, price, price, volume, price)
+        if closed is not None:
+            for timeframe in TIMEFRAMES:
+                if timeframe != "1m":
+                    self._merge(symbol, timeframe, closed.time, closed.high, closed.low,
+                                closed.close, closed.volume, closed.open)
+
+    def open_candle(self, symbol: str, timeframe: str) -> Optional[Candle]:
+        return self._open.get((symbol.upper(), timeframe))
+
+    def on_snapshot(self, snapshot):
+        """MarketDataService listener; spot feeds carry no trade volume, so volume stays 0"""
+        for symbol in snapshot.updated:
+            self.add_tick(symbol, snapshot.by_symbol[symbol].price, snapshot.fetched_at)
@@ -0,0 +1,338 @@
+"""
+Technical indicators on OHLCV arrays
+
+The batch functions take arrays shaped (n_bars,) or (n_symbols, n_bars) and
+compute along the last axis, so many symbols are processed in one call. Values
+are NaN until enough bars exist. StreamingIndicators keeps O(1) state per
+symbol and produces the same numbers one candle at a time.
+"""
+from collections import deque
+from typing import Optional, Dict, Deque
+
+import numpy as np
+
+SMA_PERIOD = 20
+EMA_PERIOD = 20
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BOLLINGER_PERIOD, BOLLINGER_STD = 20, 2.0
+ATR_PERIOD = 14
+PIVOT_LOOKBACK = 20
+
+
+# Batch (vectorized across symbols) -------------------------------------
+
+def _as_2d(x) -> np.ndarray:
+    return np.atleast_2d(np.asarray(x, dtype=np.float64))
+
+
+def _restore(result: np.ndarray, like) -> np.ndarray:
+    return result[0] if np.ndim(like) == 1 else result
+
+
+def sma(x, period: int) -> np.ndarray:
+    values = _as_2d(x)
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] >= period:
+        csum = np.cumsum(np.insert(values, 0, 0.0, axis=1), axis=1)
+        out[:, period - 1:] = (csum[:, period:] - csum[:, :-period]) / period
+    return _restore(out, x)
+
+
+def _smooth(values: np.ndarray, alpha: float, period: int) -> np.ndarray:
+    """Exponential smoothing seeded with the SMA of the first full window"""
+    out = np.full(values.shape, np.nan)
+    valid = np.where(~np.isnan(values).any(axis=0))[0]
+    if len(valid) == 0:
+        return out
+    start = valid[0]
+    seed = start + period - 1
+    if seed >= values.shape[1]:
+        return out
+    out[:, seed] = values[:, start:seed + 1].mean(axis=1)
+    for t in range(seed + 1, values.shape[1]):
+        out[:, t] = alpha * values[:, t] + (1 - alpha) * out[:, t - 1]
+    return out
+
+
+def ema(x, period: int) -> np.ndarray:
+    return _restore(_smooth(_as_2d(x), 2.0 / (period + 1), period), x)
+
+
+def rsi(close, period: int = RSI_PERIOD) -> np.ndarray:
+    values = _as_2d(close)
+    delta = np.diff(values, axis=1)
+    avg_gain = _smooth(np.clip(delta, 0, None), 1.0 / period, period)
+    avg_loss = _smooth(np.clip(-delta, 0, None), 1.0 / period, period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+    out = np.where(np.isnan(avg_gain), np.nan, out)
+    out = np.concatenate([np.full((values.shape[0], 1), np.nan), out], axis=1)
+    return _restore(out, close)
+
+
+def macd(close, fast: int = MACD_FAST, slow: int = MACD_SLOW, signal: int = MACD_SIGNAL):
+    """Returns (macd_line, signal_line, histogram)"""
+    values = _as_2d(close)
+    line = _smooth(values, 2.0 / (fast + 1), fast) - _smooth(values, 2.0 / (slow + 1), slow)
+    signal_line = _smooth(line, 2.0 / (signal + 1), signal)
+    return _restore(line, close), _restore(signal_line, close), _restore(line - signal_line, close)
+
+
+def bollinger(close, period: int = BOLLINGER_PERIOD, num_std: float = BOLLINGER_STD):
+    """Returns (upper, middle, lower) using the population standard deviation"""
+    values = _as_2d(close)
+    middle = _as_2d(sma(values, period))
+    mean_sq = _as_2d(sma(values ** 2, period))
+    std = np.sqrt(np.maximum(mean_sq - middle ** 2, 0.0))
+    return (
+        _restore(middle + num_std * std, close),
+        _restore(middle, close),
+        _restore(middle - num_std * std, close),
+    )
+
+
+def true_range(high, low, close) -> np.ndarray:
+    high, low, close = _as_2d(high), _as_2d(low), _as_2d(close)
+    prev_close = np.concatenate([close[:, :1], close[:, :-1]], axis=1)
+    tr = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+    tr[:, 0] = high[:, 0] - low[:, 0]
+    return tr
+
+
+def atr(high, low, close, period: int = ATR_PERIOD) -> np.ndarray:
+    return _restore(_smooth(true_range(high, low, close), 1.0 / period, period), close)
+
+
+def pivot_levels(high, low, close, lookback: int = PIVOT_LOOKBACK) -> Dict[str, np.ndarray]:
+    """Floor-trader pivots from the high/low of the last `lookback` bars and the latest close"""
+    high, low, close = _as_2d(high), _as_2d(low), _as_2d(close)
+    period_high = high[:, -lookback:].max(axis=1)
+    period_low = low[:, -lookback:].min(axis=1)
+    last_close = close[:, -1]
+    pivot = (period_high + period_low + last_close) / 3
+    return {
+        "pivot": pivot,
+        "resistance_1": 2 * pivot - period_low,
+        "support_1": 2 * pivot - period_high,
+        "resistance_2": pivot + (period_high - period_low),
+        "support_2": pivot - (period_high - period_low),
+    }
+
+
+def summarize(high, low, close) -> Dict[str, np.ndarray]:
+    """Latest value of every indicator for each symbol row"""
+    high, low, close = _as_2d(high), _as_2d(low), _as_2d(close)
+    macd_line, signal_line, histogram = macd(close)
+    upper, middle, lower = bollinger(close)
+    result = {
+        "close": close[:, -1],
+        "sma_20": sma(close, SMA_PERIOD)[:, -1],
+        "ema_20": ema(close, EMA_PERIOD)[:, -1],
+        "rsi_14": rsi(close)[:, -1],
+        "macd": macd_line[:, -1],
+        "macd_signal": signal_line[:, -1],
+        "macd_histogram": histogram[:, -1],
+        "bollinger_upper": upper[:, -1],
+        "bollinger_middle": middle[:, -1],
+        "bollinger_lower": lower[:, -1],
+        "atr_14": atr(high, low, close)[:, -1],
+    }
+    result.update(pivot_levels(high, low, close))
+    return result
+
+
+# Streaming (O(1) per candle) -------------------------------------------
+
+class _Smoother:
+    """Incremental twin of _smooth: SMA seed, then exponential updates"""
+
+    def __init__(self, alpha: float, period: int):
+        self.alpha = alpha
+        self.period = period
+        self._seed_sum = 0.0
+        self._seen = 0
+        self.value = np.nan
+
+    def update(self, x: float) -> float:
+        if self._seen < self.period:
+            self._seen += 1
+            self._seed_sum += x
+            if self._seen == self.period:
+                self.value = self._seed_sum / self.period
+        else:
+            self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+
+class _RollingWindow:
+    def __init__(self, period: int):
+        self.period = period
+        self._values: Deque[float] = deque()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def update(self, x: float):
+        self._values.append(x)
+        self._sum += x
+        self._sum_sq += x * x
+        if len(self._values) > self.period:
+            old = self._values.popleft()
+            self._sum -= old
+            self._sum_sq -= old * old
+
+    @property
+    def full(self) -> bool:
+        return len(self._values) == self.period
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self.period if self.full else np.nan
+
+    @property
+    def std(self) -> float:
+        if not self.full:
+            return np.nan
+        return float(np.sqrt(max(self._sum_sq / self.period - self.mean ** 2, 0.0)))
+
+
+class _RollingExtreme:
+    """Rolling max (or min) in amortized O(1) with a monotonic deque"""
+
+    def __init__(self, period: int, is_max: bool):
+        self.period = period
+        self.is_max = is_max
+        self._index = 0
+        self._candidates: Deque = deque()
+
+    def update(self, x: float) -> float:
+        better = (lambda a, b: a >= b) if self.is_max else (lambda a, b: a <= b)
+        while self._candidates and better(x, self._candidates[-1][1]):
+            self._candidates.pop()
+        self._candidates.append((self._index, x))
+        if self._candidates[0][0] <= self._index - self.period:
+            self._candidates.popleft()
+        self._index += 1
+        return self._candidates[0][1]
+
+
+class StreamingIndicators:
+    """Per-symbol indicator state updated one candle at a time"""
+
+    def __init__(self):
+        self._sma = _RollingWindow(SMA_PERIOD)
+        self._bollinger = _RollingWindow(BOLLINGER_PERIOD)
+        self._ema = _Smoother(2.0 / (EMA_PERIOD + 1), EMA_PERIOD)
+        self._macd_fast = _Smoother(2.0 / (MACD_FAST + 1), MACD_FAST)
+        self._macd_slow = _Smoother(2.0 / (MACD_SLOW + 1), MACD_SLOW)
+        self._macd_signal = _Smoother(2.0 / (MACD_SIGNAL + 1), MACD_SIGNAL)
+        self._avg_gain = _Smoother(1.0 / RSI_PERIOD, RSI_PERIOD)
+        self._avg_loss = _Smoother(1.0 / RSI_PERIOD, RSI_PERIOD)
+        self._atr = _Smoother(1.0 / ATR_PERIOD, ATR_PERIOD)
+        self._period_high = _RollingExtreme(PIVOT_LOOKBACK, is_max=True)
+        self._period_low = _RollingExtreme(PIVOT_LOOKBACK, is_max=False)
+        self._prev_close: Optional[float] = None
+        self._latest: Dict[str, float] = {}
+        self.count = 0
+
+    @classmethod
+    def from_history(cls, high, low, close) -> "StreamingIndicators":
+        state = cls()
+        for h, l, c in zip(high, low, close):
+            state.update(float(h), float(l), float(c))
+        return state
+
+    def update(self, high: float, low: float, close: float) -> Dict[str, float]:
+        self.count += 1
+        prev_close = self._prev_close
+        self._sma.update(close)
+        self._bollinger.update(close)
+        ema_value = self._ema.update(close)
+
+        fast = self._macd_fast.update(close)
+        slow = self._macd_slow.update(close)
+        macd_line = fast - slow
+        signal_line = self._macd_signal.update(macd_line) if not np.isnan(macd_line) else np.nan
+
+        rsi_value = np.nan
+        if prev_close is not None:
+            change = close - prev_close
+            avg_gain = self._avg_gain.update(max(change, 0.0))
+            avg_loss = self._avg_loss.update(max(-change, 0.0))
+            if not np.isnan(avg_gain):
+                rsi_value = 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+        if prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        atr_value = self._atr.update(tr)
+
+        period_high = self._period_high.update(high)
+        period_low = self._period_low.update(low)
+        pivot = (period_high + period_low + close) / 3
+        self._prev_close = close
+
+        middle, std = self._bollinger.mean, self._bollinger.std
+        self._latest = {
+            "close": close,
+            "sma_20": self._sma.mean,
+            "ema_20": ema_value,
+            "rsi_14": rsi_value,
+            "macd": macd_line,
+            "macd_signal": signal_line,
+            "macd_histogram": macd_line - signal_line,
+            "bollinger_upper": middle + BOLLINGER_STD * std,
+            "bollinger_middle": middle,
+            "bollinger_lower": middle - BOLLINGER_STD * std,
+            "atr_14": atr_value,
+            "pivot": pivot,
+            "resistance_1": 2 * pivot - period_low,
+            "support_1": 2 * pivot - period_high,
+            "resistance_2": pivot + (period_high - period_low),
+            "support_2": pivot - (period_high - period_low),
+        }
+        return self._latest
+
+    def latest(self) -> Dict[str, Optional[float]]:
+        """Latest values with NaN (not enough history yet) mapped to None"""
+        return {
+            name: (None if value is None or np.isnan(value) else round(float(value), 6))
+            for name, value in self._latest.items()
+        }
+
+
+class IndicatorTracker:
+    """Keeps StreamingIndicators per symbol, fed by closed candles of one timeframe"""
+
+    def __init__(self, timeframe: str = "1m", warmup_bars: int = 500):
+        self.timeframe = timeframe
+        self.warmup_bars = warmup_bars
+        self._states: Dict[str, StreamingIndicators] = {}
+
+    def update(self, symbol: str, high: float, low: float, close: float):
+        state = self._states.get(symbol)
+        if state is None:
+            state = self._states[symbol] = StreamingIndicators()
+        state.update(high, low, close)
+
+    def on_candle(self, symbol: str, timeframe: str, candle):
+        """CandleBuilder listener"""
+        if timeframe == self.timeframe:
+            self.update(symbol, candle.high, candle.low, candle.close)
+
+    def warm_up(self, store):
+        """Seed state from stored history so indicators are ready right after a restart"""
+        for symbol in store.symbols():
+            bars = store.query(symbol, self.timeframe, limit=self.warmup_bars)
+            if len(bars["close"]):
+                self._states[symbol] = StreamingIndicators.from_history(bars["high"], bars["low"], bars["close"])
+
+    def latest(self, symbol: str) -> Optional[Dict[str, Optional[float]]]:
+        state = self._states.get(symbol.upper())
+        if state is None:
+            return None
+        return dict(state.latest(), bars=state.count)
+
+    def symbols(self):
+        return list(self._states)
@@ -0,0 +1,173 @@
+"""
+Market data service: one background poller feeding an in-process price snapshot
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, Dict, Any, List, Callable, Iterable
+
+from quotes import Quote, QuoteAggregator
+from symbols import SymbolRegistry, default_registry
+
+logger = logging.getLogger(__name__)
+
+
+class MarketDataUnavailable(Exception):
+    """Raised when no snapshot has ever been fetched successfully"""
+
+
+class MarketSnapshot:
+    """An immutable set of normalized quotes by ticker
+
+    data is the crypto subset in the CoinGecko shape (keyed by coin id) that
+    /api/market/crypto-prices has always served. updated names the tickers
+    whose quotes came from this fetch; the rest were carried over.
+    """
+
+    def __init__(self, quotes: Dict[str, Quote], fetched_at: float, version: int, registry: SymbolRegistry,
+                 updated: Optional[Iterable[str]] = None):
+        self.by_symbol = quotes
+        self.updated = frozenset(quotes if updated is None else updated)
+        self.fetched_at = fetched_at
+        self.version = version
+        self.data: Dict[str, Dict[str, Any]] = {}
+        for ticker, quote in quotes.items():
+            info = registry.get(ticker)
+            if info is not None and info.asset_class == "crypto":
+                self.data[info.provider_id] = quote.coingecko_view()
+
+    def quote(self, symbol: str) -> Optional[Quote]:
+        return self.by_symbol.get(symbol.upper())
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.fetched_at
+
+
+class MarketDataService:
+    """Polls the quote providers on an interval and serves the latest good snapshot"""
+
+    def __init__(
+        self,
+        aggregator: QuoteAggregator,
+        registry: Optional[SymbolRegistry] = None,
+        poll_interval: float = 30.0,
+        ttl: float = 120.0,
+        failure_backoff: float = 10.0,
+    ):
+        self.aggregator = aggregator
+        self.registry = registry or default_registry()
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        # Before the first good snapshot, a failed fetch is remembered this long
+        # so requests fail fast instead of each waiting out the feed timeout
+        self.failure_backoff = failure_backoff
+        self._snapshot: Optional[MarketSnapshot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self._listeners: List[Callable[[MarketSnapshot], None]] = []
+
+    @classmethod
+    def from_env(cls) -> "MarketDataService":
+        return cls(
+            QuoteAggregator.from_env(),
+            poll_interval=float(os.getenv("MARKET_POLL_INTERVAL", "30")),
+            ttl=float(os.getenv("MARKET_CACHE_TTL", "120")),
+            failure_backoff=float(os.getenv("MARKET_FAILURE_BACKOFF", "10")),
+        )
+
+    async def refresh(self, only_if_missing: bool = False) -> Optional[MarketSnapshot]:
+        """Fetch a new snapshot; on failure keep serving the last good one
+
+        Symbols no provider answered for this time keep their previous quote
+        (its as_of shows how old it is).
+        """
+        async with self._refresh_lock:
+            if only_if_missing and (self._snapshot is not None or self._recently_failed()):
+                return self._snapshot
+            try:
+                quotes = await self.aggregator.fetch(self.registry)
+            except Exception as e:
+                self.last_error = str(e)
+                self.last_error_at = time.time()
+                logger.warning("Market feed refresh failed: %s", e)
+                return self._snapshot
+            updated = list(quotes)
+            if self._snapshot is not None:
+                quotes = dict(self._snapshot.by_symbol, **quotes)
+            version = self._snapshot.version + 1 if self._snapshot else 1
+            self._snapshot = MarketSnapshot(quotes, time.time(), version, self.registry, updated)
+            self.last_error = None
+            self._notify(self._snapshot)
+            return self._snapshot
+
+    def add_listener(self, listener: Callable[[MarketSnapshot], None]):
+        """Call listener(snapshot) on the event loop after every successful refresh"""
+        self._listeners.append(listener)
+
+    def _notify(self, snapshot: MarketSnapshot):
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Market snapshot listener failed")
+
+    async def _poll_loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.aggregator.close()
+
+    @property
+    def snapshot(self) -> Optional[MarketSnapshot]:
+        return self._snapshot
+
+    def is_stale(self, now: Optional[float] = None) -> bool:
+        return self._snapshot is None or self._snapshot.age(now) > self.ttl
+
+    def _recently_failed(self) -> bool:
+        return self.last_error_at is not None and time.time() - self.last_error_at < self.failure_backoff
+
+    async def get_snapshot(self) -> MarketSnapshot:
+        """Latest snapshot; only waits on the feed before the first successful poll
+
+        While the feed is down and nothing was ever fetched, requests fail
+        straight away for failure_backoff seconds after each failed attempt.
+        """
+        if self._snapshot is None and not self._recently_failed():
+            await self.refresh(only_if_missing=True)
+        if self._snapshot is None:
+            raise MarketDataUnavailable(self.last_error or "No market data available yet")
+        return self._snapshot
+
+    async def get_quote(self, symbol: str) -> Optional[Quote]:
+        """One symbol's slice of the latest snapshot"""
+        return (await self.get_snapshot()).quote(symbol)
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else 0,
+            "fetched_at": snapshot.fetched_at if snapshot else None,
+            "age_seconds": round(snapshot.age(), 3) if snapshot else None,
+            "ttl_seconds": self.ttl,
+            "stale": self.is_stale(),
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "providers": self.aggregator.status(),
+        }
@@ -0,0 +1,411 @@
+"""
+In-process metrics in the Prometheus text exposition format
+
+Counters and histograms are updated on the hot path. Gauges and cache
+counters owned by other services are read through callbacks at scrape
+time. Values are per worker; Prometheus sums across targets. Also here:
+the HTTP middleware that times every route, a pymongo command listener,
+an event-loop lag monitor and an opt-in sampling profiler for slow requests.
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as Tally, deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Tuple, Sequence, Callable, Iterable, List
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        # pymongo listeners and executor threads update metrics off the event loop
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        lines = []
+        for key, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), counts[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """Values read at scrape time from a callback returning [(labels dict, value), ...]"""
+
+    def __init__(self, name: str, help_text: str, kind: str,
+                 collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        super().__init__(name, help_text)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, kind: str,
+                 collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, kind, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception as e:
+                logger.warning("Collecting metric %s failed: %s", metric.name, e)
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status",
+    ["method", "route", "status"],
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served")
+STAGE_DURATION = REGISTRY.histogram(
+    "stage_duration_seconds", "In-process stages (e.g. JWT decode, principal lookup, alert evaluation)", ["stage"],
+)
+EXTERNAL_CALL_DURATION = REGISTRY.histogram(
+    "external_call_duration_seconds", "Latency of calls to MongoDB, the market feed, the LLM and bcrypt",
+    ["service", "operation"],
+)
+EXTERNAL_CALL_ERRORS = REGISTRY.counter(
+    "external_call_errors_total", "Failed calls to external services", ["service", "operation"],
+)
+LLM_PROMPT_CHARS = REGISTRY.histogram(
+    "llm_prompt_chars", "Size of prompts sent to the analysis model",
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+)
+ALERTS_TRIGGERED = REGISTRY.counter("price_alerts_triggered_total", "Price alerts fired by this worker", ["symbol"])
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer scheduled on it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """Time a call to an external dependency and count it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_CALL_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        EXTERNAL_CALL_DURATION.observe(time.perf_counter() - start, service=service, operation=operation)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo listener timing every command the driver sends; runs on driver threads"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        EXTERNAL_CALL_DURATION.observe(event.duration_micros / 1e6, service="mongo", operation=event.command_name)
+
+    def failed(self, event):
+        EXTERNAL_CALL_DURATION.observe(event.duration_micros / 1e6, service="mongo", operation=event.command_name)
+        EXTERNAL_CALL_ERRORS.inc(service="mongo", operation=event.command_name)
+
+
+class LoopLagMonitor:
+    """Schedules a sleep every interval and records how late it wakes up"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - expected)
+            EVENT_LOOP_LAG.observe(self.last_lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class SlowRequestProfiler:
+    """Samples the event-loop thread's stack; requests slower than threshold get their window dumped
+
+    Dumps are folded stacks ("frame;frame;frame count"), which flamegraph.pl and
+    speedscope read directly. The loop is shared, so a dump shows everything
+    the loop ran while the slow request was open. That includes whatever was
+    blocking it.
+    """
+
+    def __init__(self, threshold: float, output_dir: str, interval: float = 0.005, history: float = 120.0):
+        self.threshold = threshold
+        self.output_dir = output_dir
+        self.interval = interval
+        self._samples: deque = deque(maxlen=max(1, int(history / interval)))
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, default_dir: str) -> Optional["SlowRequestProfiler"]:
+        """Enabled only when PROFILE_SLOW_REQUESTS_MS is set"""
+        threshold_ms = os.getenv("PROFILE_SLOW_REQUESTS_MS")
+        if not threshold_ms:
+            return None
+        return cls(
+            threshold=float(threshold_ms) / 1000,
+            output_dir=os.getenv("PROFILE_DIR", default_dir),
+            interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+        )
+
+    def start(self):
+        """Call from the event-loop thread"""
+        self._target = threading.get_ident()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self._samples.append((time.monotonic(), self._fold(frame)))
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def dump(self, label: str, start: float, end: float) -> Optional[str]:
+        """Write the folded stacks sampled between start and end (monotonic); returns the file path"""
+        stacks = Tally(stack for sampled_at, stack in list(self._samples) if start <= sampled_at <= end)
+        if not stacks:
+            return None
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")
+        path = os.path.join(self.output_dir, f"{int(time.time() * 1000)}-{name}.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class MetricsMiddleware:
+    """ASGI middleware: latency histogram per (method, route template, status)"""
+
+    def __init__(self, app, profiler: Optional[SlowRequestProfiler] = None):
+        self.app = app
+        self.profiler = profiler
+        self._route_paths: Optional[Dict[object, str]] = None
+        self._in_flight = 0
+
+    def _route_label(self, scope: dict) -> str:
+        # Templates, not raw paths, so ids in URLs don't explode label cardinality
+        application = scope.get("app")
+        if application is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {route.endpoint: route.path for route in application.routes if hasattr(route, "endpoint")}
+        endpoint = scope.get("endpoint")
+        if endpoint in self._route_paths:
+            return self._route_paths[endpoint]
+        # Rejected before routing (e.g. rate limited): match the route ourselves
+        for route in application.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+        start = time.monotonic()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self._in_flight += 1
+        HTTP_IN_FLIGHT.set(self._in_flight)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._in_flight -= 1
+            HTTP_IN_FLIGHT.set(self._in_flight)
+            end = time.monotonic()
+            route = self._route_label(scope)
+            HTTP_REQUEST_DURATION.observe(end - start, method=scope["method"], route=route, status=str(status_code))
+            if self.profiler is not None and end - start >= self.profiler.threshold:
+                try:
+                    path = await asyncio.to_thread(self.profiler.dump, f"{scope['method']} {route}", start, end)
+                    if path:
+                        logger.warning("Slow request %s %s took %.3fs, stacks in %s",
+                                       scope["method"], scope["path"], end - start, path)
+                except Exception as e:
+                    logger.warning("Profiler dump failed: %s", e)
@@ -0,0 +1,79 @@
+"""
+Password hashing on a bounded worker pool, so bcrypt never runs on the event loop
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Tuple
+
+from passlib.context import CryptContext
+
+from metrics import STAGE_DURATION, external_call
+
+
+class PasswordHasher:
+    """bcrypt hash/verify offloaded to threads (bcrypt releases the GIL)
+
+    Hashes whose cost differs from the configured rounds are flagged for a
+    transparent rehash when the user next logs in.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: Optional[int] = None):
+        self.rounds = rounds
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        self._in_flight = 0
+        self._queued = 0
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        max_workers = os.getenv("BCRYPT_MAX_WORKERS")
+        return cls(
+            rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+            max_workers=int(max_workers) if max_workers else None,
+        )
+
+    async def _run(self, func, *args):
+        self._queued += 1
+        try:
+            with STAGE_DURATION.time(stage="bcrypt_queue"):
+                await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with external_call("bcrypt", func.__name__):
+                return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Returns (valid, new_hash); new_hash is set when the stored cost is out of date"""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rounds": self.rounds,
+            "max_concurrency": self.max_workers,
+            "in_flight": self._in_flight,
+            "queue_depth": self._queued,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,216 @@
+"""
+Bulk user provisioning: validate rows, hash passwords on a process pool, insert in unordered batches
+
+Shared by the admin import endpoint and the create_demo_users.py seeding CLI.
+A bad row is reported with its line number and never aborts the batch.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator, Iterable
+
+from passlib.context import CryptContext
+from pydantic import EmailStr, TypeAdapter, ValidationError
+
+PLANS = ("basic", "premium", "admin")
+HASH_CHUNK_SIZE = 32
+MAX_REPORTED_ERRORS = 1000
+
+_email = TypeAdapter(EmailStr)
+# Accepts true/false, 1/0, "true"/"false", "yes"/"no", "on"/"off"; rejects anything else
+_flag = TypeAdapter(bool)
+# A complete bcrypt hash: variant, cost 04-31, then 22 salt and 31 checksum characters
+_bcrypt_hash = re.compile(r"\$2[aby]\$(0[4-9]|[12][0-9]|3[01])\$[./A-Za-z0-9]{53}")
+
+# (line number, parsed row or None, parse error or None)
+RawRow = Tuple[int, Optional[dict], Optional[str]]
+
+
+def hash_passwords(passwords: List[str], rounds: int) -> List[str]:
+    """Process-pool entry point: bcrypt a chunk of passwords"""
+    context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds)
+    return [context.hash(password) for password in passwords]
+
+
+def build_user(row: dict, default_plan: str = "basic") -> Tuple[dict, Optional[str]]:
+    """User document without its password hash, plus the plaintext password to hash (None if pre-hashed)
+
+    Raises ValueError on an invalid row.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("row must be a JSON object")
+    try:
+        email = _email.validate_python(row.get("email"))
+    except ValidationError:
+        raise ValueError("invalid email")
+    user_type = row.get("user_type") or default_plan
+    if user_type not in PLANS:
+        raise ValueError(f"invalid user_type {user_type!r}")
+    is_active = row.get("is_active")
+    try:
+        is_active = True if is_active is None else _flag.validate_python(is_active)
+    except ValidationError:
+        raise ValueError(f"invalid is_active {is_active!r}")
+    user = {
+        "id": str(uuid.uuid4()),
+        "email": email,
+        "full_name": str(row.get("full_name") or ""),
+        "user_type": user_type,
+        "is_active": is_active,
+        "created_at": datetime.utcnow(),
+    }
+    # Fixtures may carry bcrypt hashes so seeding skips the expensive part
+    password_hash = row.get("password_hash")
+    if password_hash is not None:
+        # Stored verbatim, so anything else would lock the account out for good
+        if not isinstance(password_hash, str) or not _bcrypt_hash.fullmatch(password_hash):
+            raise ValueError("invalid password_hash")
+        user["password"] = password_hash
+        return user, None
+    password = row.get("password")
+    if not isinstance(password, str) or not password:
+        raise ValueError("password is required")
+    return user, password
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[RawRow]:
+    """Parse an NDJSON byte stream incrementally; blank lines are skipped"""
+    buffer = b""
+    line_number = 0
+
+    def parse(line: bytes) -> RawRow:
+        try:
+            return line_number, json.loads(line), None
+        except ValueError as e:
+            return line_number, None, f"invalid JSON: {e}"
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield parse(line)
+    if buffer.strip():
+        line_number += 1
+        yield parse(buffer)
+
+
+async def iter_rows(rows: Iterable[dict]) -> AsyncIterator[RawRow]:
+    for line_number, row in enumerate(rows, 1):
+        yield line_number, row, None
+
+
+class UserImporter:
+    def __init__(self, users_repo, rounds: int = 12, batch_size: int = 1000, max_workers: Optional[int] = None):
+        self.users_repo = users_repo
+        self.rounds = rounds
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls, users_repo, rounds: int) -> "UserImporter":
+        max_workers = os.getenv("BULK_IMPORT_WORKERS")
+        return cls(
+            users_repo,
+            rounds=rounds,
+            batch_size=int(os.getenv("BULK_IMPORT_BATCH_SIZE", "1000")),
+            max_workers=int(max_workers) if max_workers else None,
+        )
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def _hash(self, passwords: List[str]) -> List[str]:
+        if not passwords:
+            return []
+        loop = asyncio.get_running_loop()
+        chunks = [passwords[i:i + HASH_CHUNK_SIZE] for i in range(0, len(passwords), HASH_CHUNK_SIZE)]
+        hashed = await asyncio.gather(*(
+            loop.run_in_executor(self._pool(), hash_passwords, chunk, self.rounds) for chunk in chunks
+        ))
+        return [password_hash for chunk in hashed for password_hash in chunk]
+
+    async def _hash_batch(self, batch: List[Tuple[int, dict, Optional[str]]]):
+        plain = [(i, password) for i, (_line, _user, password) in enumerate(batch) if password is not None]
+        hashes = await self._hash([password for _i, password in plain])
+        for (i, _password), password_hash in zip(plain, hashes):
+            batch[i][1]["password"] = password_hash
+
+    async def _insert_batch(self, batch: List[Tuple[int, dict, Optional[str]]], report: dict):
+        failures = await self.users_repo.insert_many([user for _line, user, _password in batch])
+        failed = set()
+        for index, error in failures:
+            line, user, _password = batch[index]
+            failed.add(index)
+            self._error(report, line, error, user["email"])
+        for index, (_line, user, _password) in enumerate(batch):
+            if index not in failed:
+                report["inserted"] += 1
+                report["by_plan"][user["user_type"]] = report["by_plan"].get(user["user_type"], 0) + 1
+
+    @staticmethod
+    def _error(report: dict, line: int, error: str, email: Any = None):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            # Rows are reported as received, and a bad row's email may not be a string at all
+            if email is not None and not isinstance(email, str):
+                email = json.dumps(email)
+            report["errors"].append({"line": line, "email": email, "error": error})
+
+    async def import_rows(self, rows: AsyncIterator[RawRow], default_plan: str = "basic") -> Dict[str, Any]:
+        """Validate, hash and insert; each batch is hashed while the previous one is being inserted"""
+        started = time.monotonic()
+        report: Dict[str, Any] = {"received": 0, "inserted": 0, "failed": 0, "by_plan": {}, "errors": []}
+        batch: List[Tuple[int, dict, Optional[str]]] = []
+        seen_emails = set()
+        pending: Optional[asyncio.Task] = None
+
+        async def flush():
+            nonlocal batch, pending
+            if not batch:
+                return
+            current, batch = batch, []
+            await self._hash_batch(current)
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(self._insert_batch(current, report))
+
+        try:
+            async for line, row, parse_error in rows:
+                report["received"] += 1
+                if parse_error:
+                    self._error(report, line, parse_error)
+                    continue
+                try:
+                    user, password = build_user(row, default_plan)
+                except ValueError as e:
+                    self._error(report, line, str(e), row.get("email") if isinstance(row, dict) else None)
+                    continue
+                if user["email"] in seen_emails:
+                    self._error(report, line, "duplicate email in import", user["email"])
+                    continue
+                seen_emails.add(user["email"])
+                batch.append((line, user, password))
+                if len(batch) >= self.batch_size:
+                    await flush()
+            await flush()
+            if pending is not None:
+                await pending
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+        report["elapsed_s"] = round(time.monotonic() - started, 3)
+        return report
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
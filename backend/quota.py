@@ -0,0 +1,61 @@
+"""
+Per-user, per-plan usage quotas backed by atomic MongoDB counters
+"""
+import os
+import time
+from datetime import datetime
+from typing import Optional, Dict
+
+from repository import UsageRepository
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, limit: int, reset_at: float):
+        super().__init__(f"Quota of {limit} exceeded")
+        self.limit = limit
+        self.reset_at = reset_at
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, int(self.reset_at - time.time()) + 1)
+
+
+class UsageQuota:
+    """Fixed-window counter per user; limits are per plan, None means unlimited
+
+    Every worker increments the same counter document, so the limit holds
+    across processes without any lock held on our side.
+    """
+
+    def __init__(self, repository: UsageRepository, name: str, limits: Dict[str, Optional[int]], window: int = 86400):
+        self.repository = repository
+        self.name = name
+        self.limits = limits
+        self.window = window
+
+    @classmethod
+    def from_env(cls, repository: UsageRepository, name: str, defaults: Dict[str, int]) -> "UsageQuota":
+        """Reads <NAME>_QUOTA_<PLAN> for each plan (0 = unlimited) and <NAME>_QUOTA_WINDOW seconds"""
+        prefix = f"{name.upper()}_QUOTA"
+        limits = {}
+        for plan, default in defaults.items():
+            limit = int(os.getenv(f"{prefix}_{plan.upper()}", str(default)))
+            limits[plan] = limit or None
+        return cls(repository, name, limits, window=int(os.getenv(f"{prefix}_WINDOW", "86400")))
+
+    def limit_for(self, user: dict) -> Optional[int]:
+        return self.limits.get(user.get("user_type"))
+
+    async def consume(self, user: dict) -> Optional[Dict[str, float]]:
+        """Count one use; raises QuotaExceeded at the limit, returns None for unlimited plans"""
+        limit = self.limit_for(user)
+        if limit is None:
+            return None
+        window_start = int(time.time()) // self.window * self.window
+        reset_at = window_start + self.window
+        count = await self.repository.increment(
+            f"{self.name}:{user['id']}:{window_start}", limit, datetime.utcfromtimestamp(reset_at)
+        )
+        if count is None:
+            raise QuotaExceeded(limit, reset_at)
+        return {"limit": limit, "remaining": limit - count, "reset_at": reset_at}
@@ -0,0 +1,399 @@
+"""
+Quote providers behind one aggregator: pooled async HTTP, hedged requests and per-provider circuit breakers
+
+Providers are grouped by asset class and tried in priority order. The first
+provider is called right away. A redundant one is called when the earlier
+calls are still pending after hedge_delay, or straight away when one fails.
+Whatever arrives before the deadline is merged per symbol into one Quote.
+Every URL is configurable, so the whole chain can run against local stub servers.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Optional, Dict, List, Iterable, Tuple
+
+import httpx
+
+from metrics import external_call
+from symbols import SymbolInfo, SymbolRegistry
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_URL = "https://api.coingecko.com/api/v3/simple/price"
+COINCAP_URL = "https://api.coincap.io/v2/assets"
+FRANKFURTER_URL = "https://api.frankfurter.app/latest"
+OPEN_ER_API_URL = "https://open.er-api.com/v6/latest"
+
+
+class Quote:
+    """One symbol's price, normalized across providers (price is in the pair's quote currency, USD for crypto)"""
+
+    __slots__ = ("symbol", "asset_class", "price", "change_24h_pct", "market_cap", "sources", "as_of")
+
+    def __init__(self, symbol: str, asset_class: str, price: float, change_24h_pct: Optional[float] = None,
+                 market_cap: Optional[float] = None, sources: Tuple[str, ...] = (), as_of: Optional[float] = None):
+        self.symbol = symbol
+        self.asset_class = asset_class
+        self.price = price
+        self.change_24h_pct = change_24h_pct
+        self.market_cap = market_cap
+        self.sources = sources
+        self.as_of = as_of if as_of is not None else time.time()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Quote):
+            return NotImplemented
+        return (self.symbol, self.price, self.change_24h_pct, self.market_cap) == \
+            (other.symbol, other.price, other.change_24h_pct, other.market_cap)
+
+    __hash__ = None
+
+    def merged(self, other: "Quote") -> "Quote":
+        """This quote's price, with fields it lacks filled in from a lower-priority provider's quote"""
+        change = self.change_24h_pct if self.change_24h_pct is not None else other.change_24h_pct
+        market_cap = self.market_cap if self.market_cap is not None else other.market_cap
+        sources = self.sources
+        if change is not self.change_24h_pct or market_cap is not self.market_cap:
+            sources += tuple(source for source in other.sources if source not in sources)
+        return Quote(self.symbol, self.asset_class, self.price, change, market_cap, sources, self.as_of)
+
+    def to_dict(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "asset_class": self.asset_class,
+            "price": self.price,
+            "change_24h_pct": self.change_24h_pct,
+            "market_cap": self.market_cap,
+            "sources": list(self.sources),
+            "as_of": self.as_of,
+        }
+
+    def coingecko_view(self) -> dict:
+        """The /simple/price shape the crypto endpoints have always returned"""
+        return {"usd": self.price, "usd_24h_change": self.change_24h_pct, "usd_market_cap": self.market_cap}
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderError(Exception):
+    pass
+
+
+class CircuitOpen(ProviderError):
+    pass
+
+
+class QuoteProvider:
+    """One upstream; fetch() returns quotes by ticker for whichever of the symbols it knows"""
+
+    name = "provider"
+    asset_class = "crypto"
+
+    def __init__(self, url: str):
+        self.url = url
+
+    async def fetch(self, client: httpx.AsyncClient, symbols: List[SymbolInfo]) -> Dict[str, Quote]:
+        raise NotImplementedError
+
+    async def _get_json(self, client: httpx.AsyncClient, url: str, params: Optional[dict] = None):
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+class CoinGeckoProvider(QuoteProvider):
+    name = "coingecko"
+
+    async def fetch(self, client, symbols):
+        by_id = {info.provider_id: info.ticker for info in symbols}
+        data = await self._get_json(client, self.url, {
+            "ids": ",".join(by_id),
+            "vs_currencies": "usd",
+            "include_24hr_change": "true",
+            "include_market_cap": "true",
+        })
+        quotes = {}
+        for coin_id, values in data.items():
+            ticker = by_id.get(coin_id)
+            price = _float(values.get("usd"))
+            if ticker and price is not None:
+                quotes[ticker] = Quote(ticker, "crypto", price, _float(values.get("usd_24h_change")),
+                                       _float(values.get("usd_market_cap")), (self.name,))
+        return quotes
+
+
+class CoinCapProvider(QuoteProvider):
+    name = "coincap"
+
+    # CoinCap asset ids that differ from CoinGecko's
+    ID_OVERRIDES = {"BNB": "binance-coin"}
+
+    async def fetch(self, client, symbols):
+        by_id = {self.ID_OVERRIDES.get(info.ticker, info.provider_id): info.ticker for info in symbols}
+        data = await self._get_json(client, self.url, {"ids": ",".join(by_id)})
+        quotes = {}
+        for asset in data.get("data") or []:
+            ticker = by_id.get(asset.get("id"))
+            price = _float(asset.get("priceUsd"))
+            if ticker and price is not None:
+                quotes[ticker] = Quote(ticker, "crypto", price, _float(asset.get("changePercent24Hr")),
+                                       _float(asset.get("marketCapUsd")), (self.name,))
+        return quotes
+
+
+class FrankfurterProvider(QuoteProvider):
+    """ECB reference rates; one request per base currency"""
+
+    name = "frankfurter"
+    asset_class = "forex"
+
+    async def fetch(self, client, symbols):
+        by_base: Dict[str, List[SymbolInfo]] = defaultdict(list)
+        for info in symbols:
+            by_base[info.base].append(info)
+
+        async def one_base(base: str, infos: List[SymbolInfo]) -> Dict[str, Quote]:
+            data = await self._get_json(client, self.url, {
+                "from": base, "to": ",".join(info.quote for info in infos),
+            })
+            rates = data.get("rates") or {}
+            return {
+                info.ticker: Quote(info.ticker, "forex", rate, sources=(self.name,))
+                for info in infos
+                if (rate := _float(rates.get(info.quote))) is not None
+            }
+
+        quotes = {}
+        for result in await asyncio.gather(*(one_base(base, infos) for base, infos in by_base.items())):
+            quotes.update(result)
+        return quotes
+
+
+class OpenErApiProvider(QuoteProvider):
+    """open.er-api.com: every rate against USD in one request; pairs are crossed through USD"""
+
+    name = "open_er_api"
+    asset_class = "forex"
+
+    async def fetch(self, client, symbols):
+        data = await self._get_json(client, f"{self.url.rstrip('/')}/USD")
+        if data.get("result") not in (None, "success"):
+            raise ProviderError(data.get("error-type") or "open.er-api error")
+        rates = dict(data.get("rates") or {}, USD=1.0)
+        quotes = {}
+        for info in symbols:
+            base, quote = _float(rates.get(info.base)), _float(rates.get(info.quote))
+            if base and quote:
+                quotes[info.ticker] = Quote(info.ticker, "forex", quote / base, sources=(self.name,))
+        return quotes
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; after reset_timeout one call is let through to probe
+
+    Callers that are allowed through must end with record_success,
+    record_failure or, for calls abandoned without a verdict, release.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        # A failed probe re-opens straight away
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        self._probing = False
+
+
+class QuoteAggregator:
+    def __init__(self, providers: Iterable[QuoteProvider], hedge_delay: float = 0.5, timeout: float = 5.0,
+                 connect_timeout: float = 2.0, max_connections: int = 20,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.breakers = {
+            provider.name: CircuitBreaker(failure_threshold, reset_timeout) for provider in self.providers
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(cls) -> "QuoteAggregator":
+        """Provider URLs in priority order per asset class; an empty URL disables that provider"""
+        candidates = [
+            (CoinGeckoProvider, os.getenv("MARKET_FEED_URL", COINGECKO_URL)),
+            (CoinCapProvider, os.getenv("MARKET_FALLBACK_FEED_URL", COINCAP_URL)),
+            (FrankfurterProvider, os.getenv("FOREX_FEED_URL", FRANKFURTER_URL)),
+            (OpenErApiProvider, os.getenv("FOREX_FALLBACK_FEED_URL", OPEN_ER_API_URL)),
+        ]
+        return cls(
+            [provider(url) for provider, url in candidates if url],
+            hedge_delay=float(os.getenv("MARKET_HEDGE_DELAY", "0.5")),
+            timeout=float(os.getenv("MARKET_FEED_TIMEOUT", "5")),
+            connect_timeout=float(os.getenv("MARKET_CONNECT_TIMEOUT", "2")),
+            max_connections=int(os.getenv("MARKET_MAX_CONNECTIONS", "20")),
+            failure_threshold=int(os.getenv("MARKET_BREAKER_FAILURES", "3")),
+            reset_timeout=float(os.getenv("MARKET_BREAKER_RESET", "30")),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running loop; kept open for connection reuse
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections, keepalive_expiry=60),
+                headers={"Accept": "application/json"},
+            )
+        return self._client
+
+    async def _call(self, provider: QuoteProvider, symbols: List[SymbolInfo]) -> Dict[str, Quote]:
+        breaker = self.breakers[provider.name]
+        if not breaker.allow():
+            raise CircuitOpen(f"{provider.name} circuit open")
+        try:
+            with external_call(provider.name, "quotes"):
+                quotes = await provider.fetch(self.client, symbols)
+        except asyncio.CancelledError:
+            # Lost a hedge race, or ran out of time: _fetch_class records the latter
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return quotes
+
+    async def _fetch_class(self, providers: List[QuoteProvider], symbols: List[SymbolInfo]) -> Dict[str, Quote]:
+        wanted = {info.ticker for info in symbols}
+        queue = [provider for provider in providers if self.breakers[provider.name].state != "open"]
+        if not queue:
+            raise CircuitOpen(", ".join(provider.name for provider in providers) + " circuits open")
+        responses: Dict[str, Dict[str, Quote]] = {}
+        errors: List[str] = []
+        tasks: Dict[asyncio.Task, QuoteProvider] = {}
+
+        def launch_next():
+            if queue:
+                provider = queue.pop(0)
+                tasks[asyncio.create_task(self._call(provider, symbols))] = provider
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        expired = False
+        launch_next()
+        try:
+            while tasks:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    expired = True
+                    break
+                wait = min(self.hedge_delay, remaining) if queue else remaining
+                done, _pending = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = tasks.pop(task)
+                    try:
+                        responses[provider.name] = task.result()
+                    except Exception as e:
+                        errors.append(f"{provider.name}: {e}")
+                        launch_next()
+                covered = set().union(*responses.values()) if responses else set()
+                if wanted <= covered:
+                    break
+                if not done:
+                    # Hedge: still waiting after hedge_delay, bring in the next provider
+                    launch_next()
+                elif responses and not tasks:
+                    # Partial answer: ask the next provider for the rest
+                    launch_next()
+        finally:
+            for task, provider in tasks.items():
+                task.cancel()
+                if expired:
+                    # A provider that hangs past the deadline is as unhealthy as one that errors
+                    self.breakers[provider.name].record_failure()
+                    errors.append(f"{provider.name}: timed out")
+        if not responses:
+            raise ProviderError("; ".join(errors) or "timed out")
+        return self._merge(providers, responses)
+
+    @staticmethod
+    def _merge(providers: List[QuoteProvider], responses: Dict[str, Dict[str, Quote]]) -> Dict[str, Quote]:
+        """Per symbol: the highest-priority provider's price, gaps filled from the others"""
+        merged: Dict[str, Quote] = {}
+        for provider in providers:
+            for ticker, quote in responses.get(provider.name, {}).items():
+                merged[ticker] = merged[ticker].merged(quote) if ticker in merged else quote
+        return merged
+
+    async def fetch(self, registry: SymbolRegistry) -> Dict[str, Quote]:
+        """Quotes for every registered symbol the providers could answer for
+
+        Raises ProviderError only when no asset class returned anything.
+        """
+        classes = []
+        for asset_class in dict.fromkeys(provider.asset_class for provider in self.providers):
+            symbols = registry.symbols(asset_class)
+            if symbols:
+                providers = [provider for provider in self.providers if provider.asset_class == asset_class]
+                classes.append((asset_class, self._fetch_class(providers, symbols)))
+        results = await asyncio.gather(*(call for _asset_class, call in classes), return_exceptions=True)
+        quotes: Dict[str, Quote] = {}
+        errors = []
+        for (asset_class, _call), result in zip(classes, results):
+            if isinstance(result, BaseException):
+                logger.warning("No %s quotes: %s", asset_class, result)
+                errors.append(f"{asset_class}: {result}")
+            else:
+                quotes.update(result)
+        if not quotes and errors:
+            raise ProviderError("; ".join(errors))
+        return quotes
+
+    def status(self) -> Dict[str, str]:
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
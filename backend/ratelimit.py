@@ -0,0 +1,256 @@
+"""
+Rate limiting and load shedding for expensive routes (ASGI middleware)
+
+Each rule pairs a token bucket per principal with an optional concurrency
+cap shared by everyone hitting the route. Callers over their rate get 429.
+When the route is saturated and its wait queue is full, callers get 503.
+Both responses carry Retry-After. Buckets live in a pluggable backend. The
+in-memory default is per worker; the Mongo backend shares buckets between
+workers.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Tuple, Sequence, Callable, Awaitable
+
+from pymongo import ReturnDocument
+from starlette.datastructures import Headers
+
+logger = logging.getLogger(__name__)
+
+# (principal key, plan) for an authenticated caller, None for anonymous ones
+PrincipalResolver = Callable[[dict], Awaitable[Optional[Tuple[str, str]]]]
+
+
+class RateLimitRule:
+    """Limits for one route group
+
+    rate is tokens per second, burst the bucket size. per="user" keys buckets by
+    the authenticated principal and scales them by plan (None = unlimited).
+    Anonymous callers fall back to their IP. max_concurrent caps in-flight
+    requests across all callers, with up to max_waiting queued for wait_timeout.
+    Paths in exclude are never matched, even when one of paths covers them.
+    """
+
+    def __init__(self, name: str, methods: Sequence[str], paths: Sequence[str], rate: float, burst: float,
+                 per: str = "ip", plan_scale: Optional[Dict[str, Optional[float]]] = None,
+                 max_concurrent: Optional[int] = None, max_waiting: int = 0, wait_timeout: float = 5.0,
+                 exclude: Sequence[str] = ()):
+        self.name = name
+        self.methods = {method.upper() for method in methods}
+        self.paths = tuple(paths)
+        self.exclude = tuple(exclude)
+        self.rate = rate
+        self.burst = burst
+        self.per = per
+        self.plan_scale = plan_scale or {}
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+
+    def matches(self, method: str, path: str) -> bool:
+        if method not in self.methods:
+            return False
+        return self._covers(self.paths, path) and not self._covers(self.exclude, path)
+
+    @staticmethod
+    def _covers(paths: Sequence[str], path: str) -> bool:
+        # Paths ending in "/" are prefixes, anything else must match exactly
+        return any(path == p or (p.endswith("/") and path.startswith(p)) for p in paths)
+
+
+class InMemoryBucketBackend:
+    """Token buckets in a bounded LRU dict; state is local to this worker"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Spend cost tokens; returns 0 when allowed, else seconds until enough have refilled"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class MongoBucketBackend:
+    """Token buckets shared by all workers: one atomic pipeline update per request
+
+    Idle buckets are removed by the TTL index on expires_at.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]},
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=burst / rate + 60),
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (cost - bucket["tokens"]) / rate
+
+
+def backend_from_env(database):
+    """RATE_LIMIT_BACKEND=memory (default) or mongo"""
+    kind = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if kind == "mongo":
+        return MongoBucketBackend(database.rate_limits)
+    if kind != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {kind}")
+    return InMemoryBucketBackend()
+
+
+class ConcurrencyGate:
+    """Semaphore with a bounded wait queue; acquire() fails fast instead of queueing forever"""
+
+    def __init__(self, limit: int, max_waiting: int = 0, timeout: float = 5.0):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self._waiting = 0
+        self._in_flight = 0
+        self.rejected = 0
+
+    async def acquire(self) -> bool:
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending
+            await self._semaphore.acquire()
+            self._in_flight += 1
+            return True
+        if self._waiting >= self.max_waiting:
+            self.rejected += 1
+            return False
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            self._in_flight += 1
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self._waiting -= 1
+
+    def release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "rejected": self.rejected,
+        }
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying the first matching RateLimitRule to each HTTP request"""
+
+    def __init__(self, app, rules: Sequence[RateLimitRule], backend=None,
+                 principal: Optional[PrincipalResolver] = None, trust_forwarded: bool = False,
+                 enabled: bool = True):
+        self.app = app
+        self.rules = list(rules)
+        self.backend = backend or InMemoryBucketBackend()
+        self.principal = principal
+        self.trust_forwarded = trust_forwarded
+        self.enabled = enabled
+        self.gates = {
+            rule.name: ConcurrencyGate(rule.max_concurrent, rule.max_waiting, rule.wait_timeout)
+            for rule in self.rules if rule.max_concurrent
+        }
+
+    def _client_ip(self, scope: dict) -> str:
+        if self.trust_forwarded:
+            forwarded = Headers(scope=scope).get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def _bucket_key(self, rule: RateLimitRule, scope: dict) -> Tuple[str, Optional[str]]:
+        if rule.per == "user" and self.principal is not None:
+            resolved = await self.principal(scope)
+            if resolved is not None:
+                user_key, plan = resolved
+                return f"{rule.name}:user:{user_key}:{plan}", plan
+        return f"{rule.name}:ip:{self._client_ip(scope)}", None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        rule = next((r for r in self.rules if r.matches(scope["method"], scope["path"])), None)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        key, plan = await self._bucket_key(rule, scope)
+        scale = rule.plan_scale.get(plan, 1.0) if plan is not None else 1.0
+        if scale is not None:
+            try:
+                wait = await self.backend.take(key, rule.rate * scale, rule.burst * scale)
+            except Exception as e:
+                # Fail open: a broken limiter backend must not take the API down
+                logger.warning("Rate limit backend failed for %s: %s", rule.name, e)
+                wait = 0.0
+            if wait > 0:
+                await self._reject(send, 429, "Too many requests", wait)
+                return
+
+        gate = self.gates.get(rule.name)
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+        if not await gate.acquire():
+            await self._reject(send, 503, "Server busy, please retry", gate.timeout)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+    @staticmethod
+    async def _reject(send, status_code: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,153 @@
+"""
+WebSocket fan-out of market price diffs, bot events and price alerts
+
+One MarketHub per worker is fed by the shared market poller and the bot
+engine. Publishing never awaits a socket: each connection has its own sender
+task and a bounded mailbox. Price updates coalesce per symbol, so a slow
+client just gets the latest quote. Bot events and triggered alerts queue up
+to a limit, after which the oldest are dropped and the client is told how
+many it missed.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, Set, Any, Deque, Tuple
+
+from fastapi import WebSocket
+
+from quotes import Quote
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+class Subscriber:
+    def __init__(self, websocket: WebSocket, user_id: str, max_events: int = 256):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.symbols: Set[str] = set()
+        self._pending_prices: Dict[str, Any] = {}
+        self._pending_events: Deque[Tuple[str, dict]] = deque(maxlen=max_events)
+        self._dropped_events = 0
+        self._wakeup = asyncio.Event()
+
+    def push_price(self, symbol: str, quote: dict):
+        self._pending_prices[symbol] = quote
+        self._wakeup.set()
+
+    def push_event(self, event: dict, channel: str = "bot"):
+        if len(self._pending_events) == self._pending_events.maxlen:
+            self._dropped_events += 1
+        self._pending_events.append((channel, event))
+        self._wakeup.set()
+
+    async def send_loop(self):
+        """Drain the mailbox to the socket; runs until the connection fails or is cancelled"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._pending_prices:
+                prices, self._pending_prices = self._pending_prices, {}
+                await self._send({"type": "prices", "data": prices})
+            while self._pending_events:
+                channel, event = self._pending_events.popleft()
+                if self._dropped_events:
+                    event = dict(event, dropped_before=self._dropped_events)
+                    self._dropped_events = 0
+                await self._send({"type": channel, "event": event})
+
+    async def _send(self, message: dict):
+        await self.websocket.send_text(json.dumps(message, default=_json_default))
+
+
+class MarketHub:
+    def __init__(self, registry, max_events: int = 256):
+        self.registry = registry
+        self.max_events = max_events
+        self._subscribers: Set[Subscriber] = set()
+        self._by_symbol: Dict[str, Set[Subscriber]] = {}
+        self._by_user: Dict[str, Set[Subscriber]] = {}
+        self._last_quotes: Dict[str, Quote] = {}
+
+    def _quote_message(self, symbol: str, quote) -> dict:
+        # Normalized fields plus the CoinGecko-shaped ones the dashboard merges by id
+        info = self.registry.get(symbol)
+        return dict(quote.to_dict(), **quote.coingecko_view(), id=info.provider_id if info else None)
+
+    def connect(self, websocket: WebSocket, user_id: str) -> Subscriber:
+        subscriber = Subscriber(websocket, user_id, self.max_events)
+        self._subscribers.add(subscriber)
+        self._by_user.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def start_sender(self, subscriber: Subscriber) -> asyncio.Task:
+        """Run the subscriber's send loop; if it dies, log why and stop publishing to it"""
+        sender = asyncio.create_task(subscriber.send_loop())
+        sender.add_done_callback(lambda task: self._sender_done(subscriber, task))
+        return sender
+
+    def _sender_done(self, subscriber: Subscriber, task: asyncio.Task):
+        if task.cancelled():
+            return
+        logger.warning("Stream to user %s stopped: %r", subscriber.user_id, task.exception())
+        self.disconnect(subscriber)
+
+    def disconnect(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        self.unsubscribe(subscriber, list(subscriber.symbols))
+        users = self._by_user.get(subscriber.user_id)
+        if users is not None:
+            users.discard(subscriber)
+            if not users:
+                del self._by_user[subscriber.user_id]
+
+    def subscribe(self, subscriber: Subscriber, symbols):
+        for symbol in symbols:
+            symbol = symbol.upper()
+            subscriber.symbols.add(symbol)
+            self._by_symbol.setdefault(symbol, set()).add(subscriber)
+            # Send the current quote right away so the client doesn't wait a poll interval
+            if symbol in self._last_quotes:
+                subscriber.push_price(symbol, self._quote_message(symbol, self._last_quotes[symbol]))
+
+    def unsubscribe(self, subscriber: Subscriber, symbols):
+        for symbol in symbols:
+            symbol = symbol.upper()
+            subscriber.symbols.discard(symbol)
+            subscribers = self._by_symbol.get(symbol)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_symbol[symbol]
+
+    def on_snapshot(self, snapshot):
+        """MarketDataService listener: publish only the quotes that changed"""
+        for symbol, quote in snapshot.by_symbol.items():
+            if self._last_quotes.get(symbol) == quote:
+                continue
+            self._last_quotes[symbol] = quote
+            subscribers = self._by_symbol.get(symbol)
+            if subscribers:
+                message = self._quote_message(symbol, quote)
+                for subscriber in subscribers:
+                    subscriber.push_price(symbol, message)
+
+    def on_bot_event(self, event: dict):
+        """BotEngine listener: deliver to the owning user's connections"""
+        for subscriber in self._by_user.get(event.get("user_id"), ()):
+            subscriber.push_event(event)
+
+    def on_alert(self, event: dict):
+        """AlertEngine listener: deliver a triggered alert to its owner's connections"""
+        for subscriber in self._by_user.get(event.get("user_id"), ()):
+            subscriber.push_event(event, "alert")
+
+    def connection_count(self) -> int:
+        return len(self._subscribers)
@@ -0,0 +1,460 @@
+"""
+Async MongoDB data access for the MK7 Trading Bot API (motor driver)
+"""
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from metrics import MongoCommandMetrics
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing every query issued by the API: (collection, keys, options)
+INDEXES = [
+    ("users", [("email", ASCENDING)], {"unique": True, "name": "email_unique"}),
+    ("users", [("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+    ("users", [("created_at", ASCENDING), ("id", ASCENDING)], {"name": "created_at_id"}),
+    ("users", [("updated_at", ASCENDING)], {"name": "updated_at"}),
+    ("admin_settings", [("type", ASCENDING), ("version", ASCENDING)], {"name": "type_version"}),
+    ("bots", [("user_id", ASCENDING)], {"unique": True, "name": "user_id_unique"}),
+    ("bots", [("active", ASCENDING)], {"name": "active"}),
+    ("analyses", [("key", ASCENDING), ("valid_until", DESCENDING)], {"name": "key_valid_until"}),
+    ("analyses", [("symbol", ASCENDING), ("generated_at", DESCENDING)], {"name": "symbol_generated_at"}),
+    ("analyses", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("usage_counters", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("rate_limits", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ("price_alerts", [("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+    ("price_alerts", [("user_id", ASCENDING), ("created_at", DESCENDING)], {"name": "user_id_created_at"}),
+    ("price_alerts", [("status", ASCENDING)], {"name": "status"}),
+    ("price_alerts", [("updated_at", ASCENDING)], {"name": "updated_at"}),
+    ("jobs", [("job_id", ASCENDING)], {"unique": True, "name": "job_id_unique"}),
+    ("jobs", [("owner_id", ASCENDING), ("kind", ASCENDING), ("status", ASCENDING)], {"name": "owner_id_kind_status"}),
+    ("jobs", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+]
+
+# Hot-path query shapes that must never plan as a collection scan
+HOT_QUERIES = [
+    ("users", {"email": "probe@example.com"}),
+    ("users", {"id": "probe"}),
+    ("users", {"created_at": {"$gt": datetime(2024, 1, 1)}}),
+    ("users", {"updated_at": {"$gte": datetime(2024, 1, 1)}}),
+    ("admin_settings", {"type": "general"}),
+    ("bots", {"user_id": "probe"}),
+    ("bots", {"active": True}),
+    ("analyses", {"key": "probe", "valid_until": {"$gt": datetime(2024, 1, 1)}}),
+    ("analyses", {"symbol": "BTC"}),
+    ("price_alerts", {"user_id": "probe", "status": "active"}),
+    ("price_alerts", {"status": "active"}),
+    ("price_alerts", {"updated_at": {"$gte": datetime(2024, 1, 1)}}),
+    ("jobs", {"job_id": "probe"}),
+    ("jobs", {"owner_id": "probe", "kind": "backtest", "status": {"$in": ["queued", "running"]}}),
+]
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def pool_options() -> Dict[str, Any]:
+    """Connection pool settings, tunable through environment variables"""
+    return {
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 10),
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 200),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 60000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 10000),
+    }
+
+
+def create_client(mongo_url: str, **overrides) -> AsyncIOMotorClient:
+    """Create a motor client; the pool is opened lazily on first use. Every command is timed
+
+    connect=False keeps construction free of network I/O and background
+    threads, so importing the app is cheap and safe before workers fork.
+    """
+    options = pool_options()
+    options["connect"] = False
+    options["event_listeners"] = [MongoCommandMetrics()]
+    options.update(overrides)
+    return AsyncIOMotorClient(mongo_url, **options)
+
+
+async def ensure_indexes(database: AsyncIOMotorDatabase) -> None:
+    """Startup migration: create missing indexes (no-op when they already exist)"""
+    for collection, keys, options in INDEXES:
+        await database[collection].create_index(keys, **options)
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")]
+    for child in plan.get("inputStages", []) + [plan.get("inputStage") or {}]:
+        if child:
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+async def find_collection_scans(database: AsyncIOMotorDatabase) -> List[str]:
+    """Explain every hot query and return those whose winning plan is a COLLSCAN"""
+    offenders = []
+    for collection, query in HOT_QUERIES:
+        explain = await database.command(
+            "explain", {"find": collection, "filter": query}, verbosity="queryPlanner"
+        )
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        winning_plan = winning_plan.get("queryPlan", winning_plan)  # slot-based engine
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            offenders.append(f"{collection} {query}")
+    return offenders
+
+
+async def migrate(database: AsyncIOMotorDatabase, strict: bool = False) -> None:
+    """Ensure indexes and backfill counters, then verify hot query plans; strict mode raises on COLLSCAN"""
+    await ensure_indexes(database)
+    await AlertRepository(database).backfill_counters()
+    offenders = await find_collection_scans(database)
+    for offender in offenders:
+        logger.error("Hot query plans as COLLSCAN: %s", offender)
+    if offenders and strict:
+        raise RuntimeError(f"Hot queries plan as COLLSCAN: {offenders}")
+
+
+class UserRepository:
+    """Queries against the users collection"""
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.users
+
+    async def find_by_email(self, email: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, projection)
+
+    async def find_by_id(self, user_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id}, projection)
+
+    async def create(self, user: dict) -> None:
+        await self.collection.insert_one(user)
+
+    async def insert_many(self, users: List[dict]) -> List[Tuple[int, str]]:
+        """Unordered bulk insert; returns (index, reason) for every user that was not written"""
+        if not users:
+            return []
+        try:
+            await self.collection.insert_many(users, ordered=False)
+        except BulkWriteError as e:
+            return [
+                (error["index"], "email already registered" if error.get("code") == 11000 else error.get("errmsg", "write failed"))
+                for error in e.details.get("writeErrors", [])
+            ]
+        return []
+
+    @staticmethod
+    def build_filter(
+        user_type: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        email_prefix: Optional[str] = None,
+    ) -> dict:
+        query: Dict[str, Any] = {}
+        if user_type is not None:
+            query["user_type"] = user_type
+        if is_active is not None:
+            query["is_active"] = is_active
+        if email_prefix:
+            # Anchored, escaped prefix regex can use the email index
+            query["email"] = {"$regex": "^" + re.escape(email_prefix)}
+        return query
+
+    async def list_page(
+        self,
+        query: dict,
+        projection: dict,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None,
+    ) -> List[dict]:
+        """One keyset page ordered by (created_at, id), starting after the given key"""
+        if after is not None:
+            created_at, user_id = after
+            query = {"$and": [query, {"$or": [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "id": {"$gt": user_id}},
+            ]}]}
+        cursor = self.collection.find(query, projection).sort(
+            [("created_at", ASCENDING), ("id", ASCENDING)]
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def iter_users(self, query: dict, projection: dict, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Stream matching users without materializing the result set"""
+        cursor = self.collection.find(query, projection).sort(
+            [("created_at", ASCENDING), ("id", ASCENDING)]
+        ).batch_size(batch_size)
+        async for user in cursor:
+            yield user
+
+    async def count(self, query: dict) -> int:
+        return await self.collection.count_documents(query)
+
+    async def changed_since(self, since: datetime) -> AsyncIterator[str]:
+        """Ids of users whose plan or status was written at or after since"""
+        async for user in self.collection.find({"updated_at": {"$gte": since}}, {"_id": 0, "id": 1}):
+            yield user["id"]
+
+    async def update_many_by_ids(self, user_ids: List[str], fields: dict, unless: Optional[dict] = None) -> int:
+        """Set fields on the listed users, skipping any whose `unless` fields already hold those values;
+        returns the number modified"""
+        query: Dict[str, Any] = {"id": {"$in": user_ids}}
+        for key, value in (unless or {}).items():
+            query[key] = {"$ne": value}
+        result = await self.collection.update_many(query, {"$set": fields})
+        return result.modified_count
+
+    async def count_by_plan(self) -> Dict[str, int]:
+        pipeline = [{"$group": {"_id": "$user_type", "count": {"$sum": 1}}}]
+        return {row["_id"]: row["count"] async for row in self.collection.aggregate(pipeline)}
+
+    async def update_fields(self, user_id: str, fields: dict) -> bool:
+        """Set fields on one user; returns False when no user matched"""
+        result = await self.collection.update_one({"id": user_id}, {"$set": fields})
+        return result.matched_count > 0
+
+
+class AdminSettingsRepository:
+    """Queries against the admin_settings collection; every write bumps the document's version"""
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.admin_settings
+
+    async def get(self, settings_type: str = "general") -> Optional[dict]:
+        return await self.collection.find_one({"type": settings_type}, {"_id": 0})
+
+    async def get_version(self, settings_type: str = "general") -> Optional[int]:
+        """Cheap change check: answered from the (type, version) index"""
+        doc = await self.collection.find_one({"type": settings_type}, {"_id": 0, "version": 1})
+        if doc is None:
+            return None
+        return doc.get("version", 0)
+
+    async def ensure_defaults(self, defaults: dict, settings_type: str = "general") -> dict:
+        """Create the settings document if missing (version 0); returns the stored document"""
+        return await self.collection.find_one_and_update(
+            {"type": settings_type},
+            {"$setOnInsert": dict(defaults, version=0, created_at=datetime.utcnow())},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def update(self, fields: dict, settings_type: str = "general") -> dict:
+        """Set fields and increment version atomically; returns the new document"""
+        return await self.collection.find_one_and_update(
+            {"type": settings_type},
+            {"$set": dict(fields, updated_at=datetime.utcnow()), "$inc": {"version": 1}},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+
+class BotRepository:
+    """Per-user trading bot configs and run state"""
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.bots
+
+    async def get(self, user_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"user_id": user_id}, projection or {"_id": 0})
+
+    async def save_config(self, user_id: str, config: dict) -> None:
+        await self.collection.update_one(
+            {"user_id": user_id},
+            {"$set": {"config": config, "updated_at": datetime.utcnow()},
+             "$setOnInsert": {"active": False}},
+            upsert=True
+        )
+
+    async def set_active(self, user_id: str, active: bool) -> None:
+        await self.collection.update_one(
+            {"user_id": user_id},
+            {"$set": {"active": active, "updated_at": datetime.utcnow()}}
+        )
+
+    async def iter_active(self) -> AsyncIterator[dict]:
+        async for bot in self.collection.find({"active": True}, {"_id": 0}):
+            yield bot
+
+
+class AnalysisRepository:
+    """Generated market analyses, deduplicated by content key and expired by a TTL index"""
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.analyses
+
+    async def find_valid(self, key: str, now: datetime) -> Optional[dict]:
+        return await self.collection.find_one(
+            {"key": key, "valid_until": {"$gt": now}}, {"_id": 0},
+            sort=[("valid_until", DESCENDING)]
+        )
+
+    async def save(self, analysis: dict) -> None:
+        await self.collection.insert_one(dict(analysis))
+
+    async def recent(self, symbol: str, limit: int, projection: Optional[dict] = None) -> List[dict]:
+        cursor = self.collection.find({"symbol": symbol}, projection or {"_id": 0}).sort(
+            "generated_at", DESCENDING
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+
+class UsageRepository:
+    """Fixed-window usage counters, one document per (subject, window)"""
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.usage_counters
+
+    async def increment(self, counter_id: str, limit: int, expires_at: datetime) -> Optional[int]:
+        """Atomically count one use unless the counter is at its limit; returns the new count or None"""
+        try:
+            counter = await self.collection.find_one_and_update(
+                {"_id": counter_id, "count": {"$lt": limit}},
+                {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": expires_at}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The counter exists but is full, so the filter missed and the upsert collided
+            return None
+        return counter["count"]
+
+
+class AlertRepository:
+    """User price alerts; updated_at moves on every change so the evaluating worker can follow them
+
+    Each user's active alerts are counted in alert_counters ({_id: user_id,
+    active}). A create reserves a slot with a conditional increment, so
+    concurrent creates through any worker cannot pass the limit; cancelling
+    or triggering an alert gives its slot back. A write that fails between
+    the status change and the release leaves the counter high, never low.
+    """
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.price_alerts
+        self.counters = database.alert_counters
+
+    async def create(self, alert: dict, limit: int) -> bool:
+        """Insert an active alert unless its user already has limit of them; returns False at the limit"""
+        try:
+            await self.counters.find_one_and_update(
+                {"_id": alert["user_id"], "active": {"$lt": limit}},
+                {"$inc": {"active": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The counter exists but is full, so the filter missed and the upsert collided
+            return False
+        try:
+            await self.collection.insert_one(dict(alert))
+        except Exception:
+            await self._release(alert["user_id"], 1)
+            raise
+        return True
+
+    async def _release(self, user_id: str, count: int):
+        await self.counters.update_one({"_id": user_id}, {"$inc": {"active": -count}})
+
+    async def backfill_counters(self):
+        """Create the counters of users whose active alerts predate them; existing counters are left alone"""
+        pipeline = [{"$match": {"status": "active"}}, {"$group": {"_id": "$user_id", "active": {"$sum": 1}}}]
+        async for group in self.collection.aggregate(pipeline):
+            await self.counters.update_one(
+                {"_id": group["_id"]}, {"$setOnInsert": {"active": group["active"]}}, upsert=True
+            )
+
+    async def list_for_user(self, user_id: str, status: Optional[str], limit: int,
+                            projection: Optional[dict] = None) -> List[dict]:
+        query = {"user_id": user_id}
+        if status is not None:
+            query["status"] = status
+        cursor = self.collection.find(query, projection or {"_id": 0}).sort("created_at", DESCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def cancel(self, user_id: str, alert_id: str) -> bool:
+        """Disarm one of the user's active alerts; returns False when none matched"""
+        result = await self.collection.update_one(
+            {"id": alert_id, "user_id": user_id, "status": "active"},
+            {"$set": {"status": "cancelled", "updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            await self._release(user_id, 1)
+        return result.matched_count > 0
+
+    async def iter_active(self, batch_size: int = 10000) -> AsyncIterator[dict]:
+        async for alert in self.collection.find({"status": "active"}, {"_id": 0}).batch_size(batch_size):
+            yield alert
+
+    async def changed_since(self, since: datetime, status: Optional[str] = None) -> AsyncIterator[dict]:
+        query: Dict[str, Any] = {"updated_at": {"$gte": since}}
+        if status is not None:
+            query["status"] = status
+        cursor = self.collection.find(query, {"_id": 0}).sort("updated_at", ASCENDING)
+        async for alert in cursor:
+            yield alert
+
+    async def mark_triggered(self, alert_ids: List[str], value: float, at: datetime) -> int:
+        """Record alerts fired together by one tick; returns the number still active until now
+
+        Alerts this call moved out of active are tagged holds_slot until their
+        users' counters are released, so a retry after a partial failure
+        neither misses nor repeats a release.
+        """
+        result = await self.collection.update_many(
+            {"id": {"$in": alert_ids}, "status": "active"},
+            {"$set": {"status": "triggered", "triggered_value": value, "triggered_at": at, "updated_at": at,
+                      "holds_slot": True}}
+        )
+        pipeline = [
+            {"$match": {"id": {"$in": alert_ids}, "holds_slot": True}},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+        ]
+        released = [group async for group in self.collection.aggregate(pipeline)]
+        if released:
+            # Untag first: a failure after this point leaves counters high rather than releasing twice
+            await self.collection.update_many({"id": {"$in": alert_ids}, "holds_slot": True},
+                                              {"$unset": {"holds_slot": ""}})
+            await self.counters.bulk_write(
+                [UpdateOne({"_id": group["_id"]}, {"$inc": {"active": -group["count"]}}) for group in released],
+                ordered=False,
+            )
+        return result.modified_count
+
+
+class JobRepository:
+    """Background job state (bulk admin changes, backtests), expired by a TTL index
+
+    A job runs in the worker that accepted it, which records its status and
+    progress here; any worker can answer a poll.
+    """
+
+    ACTIVE = ["queued", "running"]
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.collection = database.jobs
+
+    async def create(self, job: dict) -> None:
+        await self.collection.insert_one(dict(job))
+
+    async def update(self, job_id: str, fields: dict) -> None:
+        await self.collection.update_one({"job_id": job_id}, {"$set": fields})
+
+    async def get(self, job_id: str, kinds: List[str]) -> Optional[dict]:
+        return await self.collection.find_one({"job_id": job_id, "kind": {"$in": kinds}}, {"_id": 0})
+
+    async def count_active(self, owner_id: str, kind: str) -> int:
+        return await self.collection.count_documents({"owner_id": owner_id, "kind": kind, "status": {"$in": self.ACTIVE}})
@@ -0,0 +1,41 @@
+"""
+JSON encoding for API responses: orjson with the BSON and numpy types our documents carry
+
+orjson writes datetimes, UUIDs, dataclasses and (with OPT_SERIALIZE_NUMPY)
+numpy arrays and scalars natively. The default hook covers the rest:
+ObjectId, Decimal128 and the read-only mappings served from memory.
+"""
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Any
+
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.responses import ORJSONResponse
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def bson_default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=bson_default, option=OPTIONS)
+
+
+class BSONResponse(ORJSONResponse):
+    """Default response class; bodies of routes with a response_model arrive here already validated"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Launcher for the MK7 Trading Bot API, single or multi-worker
+
+    python serve.py                          # one worker on :8001
+    python serve.py --workers 4              # or WEB_CONCURRENCY=4
+
+Workers are separate processes started by uvicorn, each importing server:app
+and opening its own MongoDB pool, caches and market data poller. Shared
+settings are passed down as environment variables. MONGO_POOL_BUDGET is the
+total number of connections to MongoDB; it is split evenly across workers.
+
+Process-local state that must have a single writer (candle files, the
+trading bot engine) belongs to one primary worker. It is chosen by an
+exclusive lock on a file; see PrimaryLock. The other workers serve the API
+from the shared database.
+
+Background jobs (bulk admin changes, backtests) run in the worker that
+accepted them and record their progress in the jobs collection, so a poll
+can land on any worker. A worker that is killed without shutting down
+leaves its jobs marked running until they expire (JOB_RETENTION).
+"""
+import argparse
+import fcntl
+import logging
+import os
+import sys
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PrimaryLock:
+    """Non-blocking exclusive flock; whoever holds it is the primary worker until it exits"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def worker_environment(workers: int) -> dict:
+    """Per-worker settings derived from the deployment-wide ones"""
+    env = {"WEB_CONCURRENCY": str(workers)}
+    budget = os.getenv("MONGO_POOL_BUDGET")
+    if budget:
+        per_worker = max(1, int(budget) // workers)
+        env["MONGO_MAX_POOL_SIZE"] = str(per_worker)
+        env["MONGO_MIN_POOL_SIZE"] = str(min(int(os.getenv("MONGO_MIN_POOL_SIZE", "10")), per_worker))
+    return env
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+
+    workers = max(1, args.workers)
+    os.environ.update(worker_environment(workers))
+    if workers > 1 and os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "memory":
+        logger.warning("RATE_LIMIT_BACKEND=memory keeps separate buckets per worker: "
+                       "effective limits are %dx the configured ones; use RATE_LIMIT_BACKEND=mongo", workers)
+
+    import uvicorn
+    uvicorn.run(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        log_level=args.log_level,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,316 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
-from pydantic import BaseModel, EmailStr
-from passlib.context import CryptContext
+from starlette.datastructures import Headers
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, TypeAdapter
+from pydantic.alias_generators import to_camel
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
 import uuid
+import json
+import asyncio
+import base64
+import logging
+import time
+from contextlib import aclosing, asynccontextmanager
 from dotenv import load_dotenv
-import google.generativeai as genai
-import requests
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal, Tuple
 
-load_dotenv()
+from repository import (
+    create_client, migrate, UserRepository, AdminSettingsRepository, BotRepository,
+    AnalysisRepository, UsageRepository, AlertRepository, JobRepository,
+)
+from market_data import MarketDataService, MarketDataUnavailable
+from analysis import AnalysisService, build_prompt, format_quote_context, format_indicator_context
+from passwords import PasswordHasher
+from quota import UsageQuota, QuotaExceeded
+from admin_jobs import AdminJobManager
+from admin_settings import SettingsService
+from provisioning import UserImporter, iter_ndjson
+from ratelimit import RateLimitMiddleware, RateLimitRule, backend_from_env
+from cache import TTLCache
+from bot_engine import BotEngine, pair_base
+from strategies import TIMEFRAME_SECONDS
+from alerts import Alert, AlertEngine, alert_event
+from indicators import IndicatorTracker
+from candles import CandleStore, CandleBuilder, TIMEFRAMES as CANDLE_TIMEFRAMES, base_timeframe
+from backtest import BacktestJobManager
+from realtime import MarketHub
+from serve import PrimaryLock
+from responses import BSONResponse, dumps
+from metrics import REGISTRY, STAGE_DURATION, LoopLagMonitor, MetricsMiddleware, SlowRequestProfiler
 
-app = FastAPI(title="MK7 Trading Bot API", version="1.0.0")
+load_dotenv()
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+logger = logging.getLogger(__name__)
 
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher.from_env()
 
 # Environment variables
 MONGO_URL = os.getenv("MONGO_URL")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# Configure Gemini AI
-genai.configure(api_key=GEMINI_API_KEY)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
+MONGO_STRICT_QUERY_PLANS = os.getenv("MONGO_STRICT_QUERY_PLANS", "false").lower() == "true"
+CANDLE_DATA_DIR = os.getenv("CANDLE_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "candles"))
 
-# MongoDB connection
-client = MongoClient(MONGO_URL)
+# MongoDB connection (async motor client with a tunable pool)
+client = create_client(MONGO_URL)
 db = client.get_database()
-users_collection = db.users
-admin_settings_collection = db.admin_settings
+users_repo = UserRepository(db)
+admin_settings = SettingsService.from_env(AdminSettingsRepository(db))
+bots_repo = BotRepository(db)
+analyses_repo = AnalysisRepository(db)
+# Background job state, shared so that any worker can answer a poll
+jobs_repo = JobRepository(db)
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "86400"))
+
+# AI analysis: the model client is created once and shared by all requests.
+# Results are persisted for reuse across workers; model calls count against a per-plan quota.
+analysis_service = AnalysisService.from_env(store=analyses_repo)
+analysis_quota = UsageQuota.from_env(UsageRepository(db), "analysis", {"basic": 20, "premium": 200, "admin": 0})
+
+# Bulk user import: bcrypt on a process pool (BULK_IMPORT_WORKERS), same cost as logins
+user_importer = UserImporter.from_env(users_repo, rounds=password_hasher.rounds)
+
+# Authenticated principals, keyed by user id, cached per process. Writes
+# through this worker evict their entries at once. Every worker also polls for
+# users changed through its peers, so a plan change or deactivation reaches
+# the other workers within PRINCIPAL_SYNC_INTERVAL, not the cache TTL.
+principal_cache = TTLCache(
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "30")),
+)
+PRINCIPAL_SYNC_INTERVAL = float(os.getenv("PRINCIPAL_SYNC_INTERVAL", "2"))
+
+# Bulk admin changes run as background jobs; affected principals are evicted chunk by chunk
+admin_jobs = AdminJobManager(
+    users_repo,
+    jobs_repo,
+    on_users_changed=principal_cache.invalidate_many,
+    chunk_size=int(os.getenv("ADMIN_JOB_CHUNK_SIZE", "1000")),
+    retention=JOB_RETENTION,
+)
+
+# Market data (background poller + snapshot cache)
+market_data = MarketDataService.from_env()
+
+# Price history: polled ticks -> 1m bars -> 1h/1d bars, and indicators on the closed bars of each
+candle_store = CandleStore(CANDLE_DATA_DIR)
+candle_builder = CandleBuilder(candle_store)
+market_data.add_listener(candle_builder.on_snapshot)
+indicator_trackers = {timeframe: IndicatorTracker(timeframe=timeframe) for timeframe in CANDLE_TIMEFRAMES}
+for tracker in indicator_trackers.values():
+    candle_builder.add_listener(tracker.on_candle)
+
+# Backtests run as background jobs on a process pool
+backtest_jobs = BacktestJobManager(
+    CANDLE_DATA_DIR,
+    jobs_repo,
+    max_workers=int(os.getenv("BACKTEST_WORKERS")) if os.getenv("BACKTEST_WORKERS") else None,
+    retention=JOB_RETENTION,
+)
+
+# Trading bots (one scheduler per timeframe, paper broker); stop loss and take
+# profit are checked on every market snapshot, strategy signals on bar close.
+# Only these plans may run one.
+BOT_PLANS = ("premium", "admin")
+bot_engine = BotEngine(market_data, candle_store=candle_store)
+market_data.add_listener(bot_engine.on_snapshot)
+
+# With several workers, candle files and trading bots have a single owner: the
+# worker holding this lock. It runs the bots persisted as active and follows
+# changes made through other workers by polling the bots collection. The lock
+# file sits next to the candle directory, not inside it.
+primary_lock = PrimaryLock(os.getenv("PRIMARY_LOCK_FILE", os.path.normpath(CANDLE_DATA_DIR) + ".lock"))
+BOT_SYNC_INTERVAL = float(os.getenv("BOT_SYNC_INTERVAL", "5"))
+
+# WebSocket fan-out of price diffs and bot events
+market_hub = MarketHub(market_data.registry)
+market_data.add_listener(market_hub.on_snapshot)
+bot_engine.add_listener(market_hub.on_bot_event)
+
+# Price alerts are evaluated on every market tick by the primary worker, which
+# follows alerts created through other workers by polling. The other workers
+# poll for triggered alerts to reach their own WebSocket clients.
+alerts_repo = AlertRepository(db)
+ALERT_SYNC_INTERVAL = float(os.getenv("ALERT_SYNC_INTERVAL", "2"))
+ALERT_MAX_PER_USER = int(os.getenv("ALERT_MAX_PER_USER", "100"))
+price_alerts = AlertEngine(alerts_repo, sync_interval=ALERT_SYNC_INTERVAL)
+market_data.add_listener(price_alerts.on_snapshot)
+price_alerts.add_listener(market_hub.on_alert)
+
+# Metrics: event-loop lag, an opt-in slow request profiler, and state owned by
+# other services read at scrape time
+loop_lag_monitor = LoopLagMonitor(interval=float(os.getenv("LOOP_LAG_INTERVAL", "0.5")))
+slow_request_profiler = SlowRequestProfiler.from_env(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "profiles")
+)
+
+def collect_cache_stats():
+    caches = {
+        "principal": {"hit": principal_cache.hits, "miss": principal_cache.misses},
+        "analysis": analysis_service.cache_stats(),
+    }
+    for cache, counts in caches.items():
+        for result, value in counts.items():
+            yield {"cache": cache, "result": result}, value
+
+def collect_bcrypt_stats():
+    stats = password_hasher.stats()
+    yield {"state": "in_flight"}, stats["in_flight"]
+    yield {"state": "queued"}, stats["queue_depth"]
+
+def collect_market_stats():
+    status = market_data.status()
+    if status["age_seconds"] is not None:
+        yield {}, status["age_seconds"]
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+def collect_provider_stats():
+    for provider, state in market_data.aggregator.status().items():
+        yield {"provider": provider}, BREAKER_STATES[state]
+
+REGISTRY.callback("cache_requests_total", "Lookups in in-process caches", "counter", collect_cache_stats)
+REGISTRY.callback("bcrypt_jobs", "Password hashing jobs running or waiting for a worker", "gauge", collect_bcrypt_stats)
+REGISTRY.callback("market_snapshot_age_seconds", "Age of the cached market snapshot", "gauge", collect_market_stats)
+REGISTRY.callback("market_provider_circuit_state", "Quote provider circuit breaker (0 closed, 1 half-open, 2 open)",
+                  "gauge", collect_provider_stats)
+REGISTRY.callback("websocket_connections", "Open /ws/market connections", "gauge",
+                  lambda: [({}, market_hub.connection_count())])
+REGISTRY.callback("trading_bots_active", "Bots scheduled in this worker", "gauge",
+                  lambda: [({}, bot_engine.active_count())])
+REGISTRY.callback("price_alerts_active", "Price alerts armed in this worker", "gauge",
+                  lambda: [({}, price_alerts.active_count())])
+REGISTRY.callback("admin_settings_version", "Admin settings version served by this worker", "gauge",
+                  lambda: [({}, admin_settings.snapshot.version)])
+
+async def run_migrations():
+    """Create indexes and check hot query plans; strict mode refuses to start on failure"""
+    try:
+        await migrate(db, strict=MONGO_STRICT_QUERY_PLANS)
+    except Exception:
+        logger.exception("MongoDB migration failed")
+        if MONGO_STRICT_QUERY_PLANS:
+            raise
+
+async def sync_active_bots():
+    """Run exactly the bots persisted as active; bots of users no longer on a bot plan are stopped"""
+    configs = {bot["user_id"]: bot["config"] async for bot in bots_repo.iter_active()}
+    eligible = {user["id"] async for user in users_repo.iter_users(
+        {"id": {"$in": list(configs)}, "user_type": {"$in": list(BOT_PLANS)}, "is_active": True}, {"_id": 0, "id": 1}
+    )}
+    for user_id in configs.keys() - eligible:
+        logger.info("Stopping the trading bot of user %s: no longer on a bot plan", user_id)
+        await bots_repo.set_active(user_id, False)
+        del configs[user_id]
+    bot_engine.sync(configs)
+
+async def follow_active_bots():
+    while True:
+        await asyncio.sleep(BOT_SYNC_INTERVAL)
+        try:
+            await sync_active_bots()
+        except Exception:
+            logger.exception("Failed to sync active trading bots")
+
+async def evict_changed_principals(since: datetime) -> datetime:
+    """Drop cached principals of users changed at or after since; returns when this poll started"""
+    polled_at = datetime.utcnow()
+    principal_cache.invalidate_many([user_id async for user_id in users_repo.changed_since(since)])
+    return polled_at
+
+async def follow_user_changes():
+    since = datetime.utcnow()
+    while True:
+        await asyncio.sleep(PRINCIPAL_SYNC_INTERVAL)
+        try:
+            # Overlap the previous window so late commits and clock skew are not missed
+            since = await evict_changed_principals(since - timedelta(seconds=5))
+        except Exception:
+            logger.exception("Failed to follow user changes")
+
+async def follow_triggered_alerts():
+    """Deliver alerts fired by the primary worker to this worker's WebSocket clients"""
+    delivered = TTLCache(max_entries=100000, ttl=60)
+    cursor = datetime.utcnow()
+    while True:
+        await asyncio.sleep(ALERT_SYNC_INTERVAL)
+        try:
+            # Overlap the previous window so late commits are not missed
+            async for alert in alerts_repo.changed_since(cursor - timedelta(seconds=5), status="triggered"):
+                cursor = max(cursor, alert["updated_at"])
+                if delivered.get(alert["id"]) is None:
+                    delivered.set(alert["id"], True)
+                    market_hub.on_alert(alert_event(alert))
+        except Exception:
+            logger.exception("Failed to follow triggered price alerts")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown; the Mongo pool and model SDK are only opened here or on first use"""
+    started = time.monotonic()
+    await run_migrations()
+    # Settings are read from memory; other workers' writes are picked up by version polling
+    await admin_settings.load()
+    admin_settings.start()
+
+    primary = primary_lock.acquire()
+    candle_builder.persist = primary
+    for tracker in indicator_trackers.values():
+        tracker.warm_up(candle_store)
+    market_data.start()
+
+    followers = [asyncio.create_task(follow_user_changes())]
+    if primary:
+        # Resume every bot that was running when the process last stopped
+        try:
+            await sync_active_bots()
+        except Exception:
+            logger.exception("Failed to load active trading bots")
+        bot_engine.start()
+        followers.append(asyncio.create_task(follow_active_bots()))
+        # A failed load is retried by the engine's sync loop
+        try:
+            await price_alerts.load()
+        except Exception:
+            logger.exception("Failed to load active price alerts")
+        price_alerts.start()
+    else:
+        followers.append(asyncio.create_task(follow_triggered_alerts()))
+
+    loop_lag_monitor.start()
+    if slow_request_profiler is not None:
+        slow_request_profiler.start()
+    logger.info("Worker %s started in %.2fs (%s)", os.getpid(), time.monotonic() - started,
+                "primary" if primary else "replica")
+    try:
+        yield
+    finally:
+        await loop_lag_monitor.stop()
+        await admin_settings.stop()
+        if slow_request_profiler is not None:
+            slow_request_profiler.stop()
+        for follower in followers:
+            follower.cancel()
+        await bot_engine.stop()
+        await price_alerts.stop()
+        # Before the client closes: interrupted jobs record their final state
+        await backtest_jobs.shutdown()
+        await admin_jobs.shutdown()
+        user_importer.shutdown()
+        await market_data.stop()
+        analysis_service.close()
+        password_hasher.close()
+        primary_lock.release()
+        client.close()
+
+app = FastAPI(title="MK7 Trading Bot API", version="1.0.0", lifespan=lifespan, default_response_class=BSONResponse)
 
 # Pydantic models
 class UserRegister(BaseModel):
@@ -67,18 +335,266 @@ class MarketAnalysisRequest(BaseModel):
     timeframe: str = "1d"
     analysis_type: str = "technical"
 
+class BotConfig(BaseModel):
+    # camelCase on the wire to match the TradingBot page
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+    
+    strategy: Literal["conservative", "balanced", "aggressive"] = "conservative"
+    risk_level: Literal["low", "medium", "high"] = "low"
+    max_trade_amount: float = Field(100, gt=0)
+    stop_loss: float = Field(5, gt=0, le=100)
+    take_profit: float = Field(10, gt=0)
+    trading_pairs: List[str] = Field(default_factory=lambda: ["BTC/USD", "ETH/USD"], min_length=1)
+    timeframe: Literal["1m", "5m", "15m", "1h", "4h", "1d"] = "1h"
+
+class BacktestRequest(BotConfig):
+    stop_loss_grid: Optional[List[float]] = None
+    take_profit_grid: Optional[List[float]] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+    initial_capital: float = Field(10000, gt=0)
+
+class AlertCreate(BaseModel):
+    symbol: str
+    metric: Literal["price", "change_24h_pct"] = "price"
+    condition: Literal["above", "below"]
+    threshold: float
+
+class UserFilter(BaseModel):
+    user_type: Optional[Literal["basic", "premium", "admin"]] = None
+    is_active: Optional[bool] = None
+    email_prefix: Optional[str] = None
+
+class BulkPlanChange(BaseModel):
+    new_plan: Literal["basic", "premium", "admin"]
+    # Exactly one of these selects the users
+    user_ids: Optional[List[str]] = Field(None, min_length=1, max_length=100000)
+    filter: Optional[UserFilter] = None
+
 class AdminSettings(BaseModel):
     basic_plan_price: float = 29.99
     premium_plan_price: float = 99.99
     trading_api_keys: Dict[str, str] = {}
     payment_api_keys: Dict[str, str] = {}
 
+# Response models: every route declares what it returns, and the Mongo
+# projections below fetch exactly those fields
+class HealthStatus(BaseModel):
+    status: str
+    service: str
+
+class WorkerInfo(BaseModel):
+    pid: int
+    primary: bool
+
+class ReadinessStatus(BaseModel):
+    status: Literal["ready", "unavailable"]
+    checks: Dict[str, str]
+    worker: WorkerInfo
+
+class Message(BaseModel):
+    message: str
+
+class UserSummary(BaseModel):
+    id: str
+    email: str
+    full_name: str
+    user_type: str
+
+class AuthToken(BaseModel):
+    access_token: str
+    token_type: str
+    user: UserSummary
+
+class UserProfile(UserSummary):
+    is_active: bool
+
+class AdminUser(UserProfile):
+    created_at: datetime
+
+class CoinQuote(BaseModel):
+    usd: Optional[float] = None
+    usd_24h_change: Optional[float] = None
+    usd_market_cap: Optional[float] = None
+
+class IndicatorValues(BaseModel):
+    close: Optional[float] = None
+    sma_20: Optional[float] = None
+    ema_20: Optional[float] = None
+    rsi_14: Optional[float] = None
+    macd: Optional[float] = None
+    macd_signal: Optional[float] = None
+    macd_histogram: Optional[float] = None
+    bollinger_upper: Optional[float] = None
+    bollinger_middle: Optional[float] = None
+    bollinger_lower: Optional[float] = None
+    atr_14: Optional[float] = None
+    pivot: Optional[float] = None
+    resistance_1: Optional[float] = None
+    support_1: Optional[float] = None
+    resistance_2: Optional[float] = None
+    support_2: Optional[float] = None
+    bars: int
+
+class CandleColumns(BaseModel):
+    symbol: str
+    timeframe: str
+    time: List[int]
+    open: List[float]
+    high: List[float]
+    low: List[float]
+    close: List[float]
+    volume: List[float]
+
+class MarketStatus(BaseModel):
+    version: int
+    fetched_at: Optional[float]
+    age_seconds: Optional[float]
+    ttl_seconds: float
+    stale: bool
+    last_error: Optional[str]
+    last_error_at: Optional[float]
+    providers: Dict[str, str]
+
+class MarketQuote(BaseModel):
+    symbol: str
+    asset_class: str
+    price: float
+    change_24h_pct: Optional[float]
+    market_cap: Optional[float]
+    sources: List[str]
+    as_of: float
+
+class MarketAnalysis(BaseModel):
+    symbol: str
+    timeframe: str
+    analysis: str
+    generated_at: datetime
+    analyst: str
+    cached: bool
+
+class StoredAnalysis(BaseModel):
+    symbol: str
+    timeframe: str
+    analysis_type: str
+    analysis: str = Field(validation_alias="text")
+    analyst: str
+    generated_at: datetime
+
+class AdminSettingsView(AdminSettings):
+    version: int
+    updated_at: Optional[datetime] = None
+
+class SettingsUpdated(Message):
+    version: int
+
+class ImportRowError(BaseModel):
+    line: int
+    email: Optional[str]
+    error: str
+
+class ImportReport(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    by_plan: Dict[str, int]
+    errors: List[ImportRowError]
+    elapsed_s: float
+
+class UsersSummary(BaseModel):
+    total: int
+    by_plan: Dict[str, int]
+
+class AdminJobView(BaseModel):
+    job_id: str
+    kind: str
+    params: Dict[str, Any]
+    status: str
+    progress: float
+    processed: int
+    modified: int
+    total: Optional[int]
+    error: Optional[str]
+    created_at: float
+    finished_at: Optional[float]
+
+class BotToggle(Message):
+    active: bool
+
+class BotStats(BaseModel):
+    total_trades: int
+    winning_trades: int
+    realized_pnl: float
+    active_positions: int
+
+class BotPosition(BaseModel):
+    pair: str
+    quantity: float
+    entry_price: float
+    amount: float
+    opened_at: datetime
+
+class BotTrade(BaseModel):
+    pair: str
+    side: Literal["BUY", "SELL"]
+    price: float
+    quantity: float
+    amount: float
+    pnl: float
+    reason: str
+    time: datetime
+
+class BotStatus(BaseModel):
+    active: bool
+    stats: Optional[BotStats]
+    positions: List[BotPosition]
+    recent_trades: List[BotTrade]
+
+class BacktestJobView(BaseModel):
+    job_id: str
+    status: str
+    progress: float
+    completed: int
+    total: int
+    error: Optional[str]
+    created_at: float
+    finished_at: Optional[float]
+    # Per-combination summaries, and the best run with its curves and trades
+    results: Optional[List[Dict[str, Any]]] = None
+    best: Optional[Dict[str, Any]] = None
+
+class PriceAlert(BaseModel):
+    id: str
+    symbol: str
+    metric: str
+    condition: str
+    threshold: float
+    status: Literal["active", "triggered", "cancelled"]
+    created_at: datetime
+    triggered_at: Optional[datetime] = None
+    triggered_value: Optional[float] = None
+
+# Projections matching the models above
+ADMIN_USER_PROJECTION = {"_id": 0, **{field: 1 for field in AdminUser.model_fields}}
+PRINCIPAL_PROJECTION = {"_id": 0, **{field: 1 for field in UserProfile.model_fields}}
+LOGIN_PROJECTION = dict(PRINCIPAL_PROJECTION, password=1)
+PRICE_ALERT_PROJECTION = {"_id": 0, **{field: 1 for field in PriceAlert.model_fields}}
+STORED_ANALYSIS_PROJECTION = {
+    "_id": 0, "text": 1, **{field: 1 for field in StoredAnalysis.model_fields if field != "analysis"}
+}
+
 # Utility functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def encode_user_cursor(user: dict) -> str:
+    """Opaque keyset cursor for the (created_at, id) ordering"""
+    raw = json.dumps([user["created_at"].isoformat(), user["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def decode_user_cursor(cursor: str):
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), user_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -90,25 +606,36 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def authenticate_token(token: str) -> dict:
+    """Resolve a bearer JWT to its (active) user; shared by HTTP routes and WebSockets"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET_KEY, algorithms=["HS256"])
+        with STAGE_DURATION.time(stage="jwt_decode"):
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = users_collection.find_one({"id": user_id})
+    user = principal_cache.get(user_id)
     if user is None:
+        with STAGE_DURATION.time(stage="principal_load"):
+            user = await users_repo.find_by_id(user_id, PRINCIPAL_PROJECTION)
+        if user is None:
+            raise credentials_exception
+        principal_cache.set(user_id, user)
+    if not user.get("is_active", True):
         raise credentials_exception
     return user
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await authenticate_token(credentials.credentials)
+
 def require_admin(current_user: dict = Depends(get_current_user)):
     if current_user.get("user_type") != "admin":
         raise HTTPException(
@@ -117,20 +644,95 @@ def require_admin(current_user: dict = Depends(get_current_user)):
         )
     return current_user
 
+async def rate_limit_principal(scope: dict) -> Optional[Tuple[str, str]]:
+    """(user id, user_type) for a valid bearer token; anonymous callers are limited by IP"""
+    authorization = Headers(scope=scope).get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        user = await authenticate_token(authorization[7:])
+    except HTTPException:
+        return None
+    return user["id"], user.get("user_type", "basic")
+
+# Per-principal token buckets (rate per second, burst) and per-route concurrency caps
+RATE_LIMIT_RULES = [
+    RateLimitRule("login", ["POST"], ["/api/auth/login"], rate=10 / 60, burst=10,
+                  max_concurrent=int(os.getenv("LOGIN_MAX_CONCURRENT", "32")), max_waiting=64),
+    RateLimitRule("register", ["POST"], ["/api/auth/register"], rate=5 / 60, burst=5,
+                  max_concurrent=int(os.getenv("LOGIN_MAX_CONCURRENT", "32")), max_waiting=64),
+    RateLimitRule("analysis", ["POST"], ["/api/analysis/gemini", "/api/analysis/gemini/stream"],
+                  rate=10 / 60, burst=5, per="user", plan_scale={"basic": 1, "premium": 3, "admin": None},
+                  max_concurrent=int(os.getenv("ANALYSIS_MAX_CONCURRENT", "16")), max_waiting=32),
+    RateLimitRule("backtest", ["POST"], ["/api/bot/backtest"], rate=6 / 60, burst=3, per="user",
+                  plan_scale={"admin": None}),
+    # Probes and scrapers poll on their own schedule; throttling them would report a healthy worker as down
+    RateLimitRule("api", ["GET", "POST", "PUT", "DELETE"], ["/api/"], rate=20, burst=40, per="user",
+                  plan_scale={"admin": None}, exclude=["/api/health", "/api/health/ready", "/api/metrics"]),
+]
+
+# Middleware (the last one added runs first: CORS headers also go on 429/503 responses,
+# and rejected requests still show up in the latency metrics)
+app.add_middleware(
+    RateLimitMiddleware,
+    rules=RATE_LIMIT_RULES,
+    backend=backend_from_env(db),
+    principal=rate_limit_principal,
+    trust_forwarded=os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true",
+    enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true",
+)
+app.add_middleware(MetricsMiddleware, profiler=slow_request_profiler)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Data-Version", "X-Data-Age", "X-Data-Stale", "X-Quota-Limit",
+                    "X-Quota-Remaining", "Retry-After"],
+)
+
 # API Routes
-@app.get("/api/health")
+@app.get("/api/health", response_model=HealthStatus)
 async def health_check():
+    """Liveness: the process is up and serving; dependencies are not checked"""
     return {"status": "healthy", "service": "MK7 Trading Bot API"}
 
-@app.post("/api/auth/register")
+@app.get("/api/health/ready", response_model=ReadinessStatus)
+async def readiness_check(response: Response):
+    """Readiness: MongoDB answers a ping within READINESS_TIMEOUT; 503 otherwise"""
+    checks = {}
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=READINESS_TIMEOUT)
+        checks["mongodb"] = "ok"
+    except Exception as e:
+        checks["mongodb"] = f"unavailable: {type(e).__name__}"
+    checks["market_data"] = "ok" if market_data.snapshot is not None else "warming up"
+    ready = checks["mongodb"] == "ok"
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ready" if ready else "unavailable",
+        "checks": checks,
+        "worker": {"pid": os.getpid(), "primary": primary_lock.held},
+    }
+
+@app.get("/api/metrics", response_class=Response)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus text exposition of this worker's metrics"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/auth/register", response_model=AuthToken)
 async def register_user(user_data: UserRegister):
     # Check if user already exists
-    if users_collection.find_one({"email": user_data.email}):
+    if await users_repo.find_by_email(user_data.email, {"_id": 0, "id": 1}):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     
     new_user = {
         "id": user_id,
@@ -142,7 +744,7 @@ async def register_user(user_data: UserRegister):
         "created_at": datetime.utcnow()
     }
     
-    users_collection.insert_one(new_user)
+    await users_repo.create(new_user)
     
     # Create access token
     access_token = create_access_token(data={"sub": user_id})
@@ -158,159 +760,533 @@ async def register_user(user_data: UserRegister):
         }
     }
 
-@app.post("/api/auth/login")
+@app.post("/api/auth/login", response_model=AuthToken)
 async def login_user(user_data: UserLogin):
-    user = users_collection.find_one({"email": user_data.email})
-    if not user or not verify_password(user_data.password, user["password"]):
+    user = await users_repo.find_by_email(user_data.email, LOGIN_PROJECTION)
+    if not user:
         raise HTTPException(status_code=400, detail="Invalid email or password")
     
-    if not user.get("is_active", True):
+    active = user.get("is_active", True)
+    if active:
+        valid, new_hash = await password_hasher.verify_and_update(user_data.password, user["password"])
+    else:
+        # Disabled accounts are still verified, so a wrong password reads the same, but never rehashed
+        valid, new_hash = await password_hasher.verify(user_data.password, user["password"]), None
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid email or password")
+    
+    if not active:
         raise HTTPException(status_code=400, detail="Account is disabled")
     
+    if new_hash:
+        # bcrypt cost changed since this hash was made
+        await users_repo.update_fields(user["id"], {"password": new_hash})
+    
     access_token = create_access_token(data={"sub": user["id"]})
     
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": {
-            "id": user["id"],
-            "email": user["email"],
-            "full_name": user["full_name"],
-            "user_type": user["user_type"]
-        }
-    }
+    return {"access_token": access_token, "token_type": "bearer", "user": user}
 
-@app.get("/api/auth/me")
+@app.get("/api/auth/me", response_model=UserProfile)
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
-    return {
-        "id": current_user["id"],
-        "email": current_user["email"],
-        "full_name": current_user["full_name"],
-        "user_type": current_user["user_type"],
-        "is_active": current_user["is_active"]
-    }
+    return current_user
 
-@app.get("/api/market/crypto-prices")
+PRICE_PAYLOAD = TypeAdapter(Dict[str, CoinQuote])
+_encoded_prices: Tuple[int, bytes] = (-1, b"")
+
+def encoded_prices(snapshot) -> bytes:
+    """The price payload only changes when the poller swaps snapshots: validate and encode it once per version"""
+    global _encoded_prices
+    version, body = _encoded_prices
+    if version != snapshot.version:
+        body = PRICE_PAYLOAD.dump_json(PRICE_PAYLOAD.validate_python(snapshot.data))
+        _encoded_prices = (snapshot.version, body)
+    return body
+
+@app.get("/api/market/crypto-prices", response_model=Dict[str, CoinQuote])
 async def get_crypto_prices():
-    """Get cryptocurrency prices from CoinGecko (free API)"""
+    """Get cryptocurrency prices from the cached CoinGecko snapshot"""
     try:
-        url = "https://api.coingecko.com/api/v3/simple/price"
-        params = {
-            "ids": "bitcoin,ethereum,binancecoin,cardano,solana,polygon,chainlink,litecoin",
-            "vs_currencies": "usd",
-            "include_24hr_change": "true",
-            "include_market_cap": "true"
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch crypto prices: {str(e)}")
+        snapshot = await market_data.get_snapshot()
+    except MarketDataUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Failed to fetch crypto prices: {str(e)}")
+    return Response(encoded_prices(snapshot), media_type="application/json", headers={
+        "X-Data-Version": str(snapshot.version),
+        "X-Data-Age": f"{snapshot.age():.3f}",
+        "X-Data-Stale": "true" if market_data.is_stale() else "false",
+    })
 
-@app.post("/api/analysis/gemini")
-async def analyze_market_with_gemini(request: MarketAnalysisRequest, current_user: dict = Depends(get_current_user)):
-    """Use Gemini AI to analyze market data"""
+@app.get("/api/market/quotes", response_model=Dict[str, MarketQuote])
+async def get_market_quotes(symbols: Optional[str] = None):
+    """Latest quote per ticker, crypto and forex alike (comma-separated tickers, default all)"""
     try:
-        # Get market data first
-        if request.symbol.upper() in ["BTC", "ETH", "BNB", "ADA", "SOL"]:
-            # Crypto analysis
-            crypto_data = await get_crypto_prices()
-            market_context = f"Current crypto prices: {crypto_data}"
-        else:
-            # For forex, we'll use a simple context for now
-            market_context = f"Analyzing {request.symbol} in {request.timeframe} timeframe"
-        
-        # Create Gemini model
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Craft analysis prompt
-        prompt = f"""
-        As a professional trading analyst, analyze the following market data for {request.symbol}:
-        
-        Market Context: {market_context}
-        Timeframe: {request.timeframe}
-        Analysis Type: {request.analysis_type}
-        
-        Please provide:
-        1. Market Overview
-        2. Technical Analysis (if applicable)
-        3. Key Support/Resistance levels
-        4. Trend Direction
-        5. Risk Assessment
-        6. Trading Recommendations
-        
-        Keep the analysis concise but comprehensive.
-        """
-        
-        response = model.generate_content(prompt)
+        snapshot = await market_data.get_snapshot()
+    except MarketDataUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Failed to fetch quotes: {str(e)}")
+    tickers = [t.strip().upper() for t in symbols.split(",") if t.strip()] if symbols else list(snapshot.by_symbol)
+    return {ticker: snapshot.by_symbol[ticker].to_dict() for ticker in tickers if ticker in snapshot.by_symbol}
+
+@app.get("/api/market/indicators", response_model=Dict[str, Optional[IndicatorValues]])
+async def get_market_indicators(symbols: Optional[str] = None, timeframe: str = "1m"):
+    """Latest technical indicators per symbol on one stored bar size (comma-separated tickers, default all)"""
+    tracker = indicator_trackers.get(timeframe)
+    if tracker is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported timeframe: {timeframe}")
+    tickers = [t.strip().upper() for t in symbols.split(",") if t.strip()] if symbols else tracker.symbols()
+    return {ticker: tracker.latest(ticker) for ticker in tickers}
+
+@app.get("/api/market/candles", response_model=CandleColumns)
+async def get_market_candles(
+    symbol: str,
+    timeframe: str = "1h",
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    limit: int = Query(500, ge=1, le=10000)
+):
+    """OHLCV bars with start <= time < end (epoch seconds), most recent `limit`, as columns"""
+    if timeframe not in CANDLE_TIMEFRAMES:
+        raise HTTPException(status_code=400, detail=f"Unsupported timeframe: {timeframe}")
+    if market_data.registry.get(symbol) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown symbol: {symbol}")
+    bars = candle_store.query(symbol, timeframe, start, end, limit)
+    # The columns are typed arrays already: encode them directly instead of
+    # going through a list of Python floats per bar
+    return BSONResponse({"symbol": symbol.upper(), "timeframe": timeframe, **bars})
+
+@app.get("/api/market/status", response_model=MarketStatus)
+async def get_market_status():
+    """Freshness metadata for the cached market snapshot"""
+    return market_data.status()
+
+def indicator_timeframe(timeframe: str) -> str:
+    """Stored bar size describing an analysis timeframe: the same one, else the coarsest that tiles it (4h -> 1h)"""
+    seconds = TIMEFRAME_SECONDS.get(timeframe)
+    return (base_timeframe(seconds) if seconds else None) or "1d"
+
+async def build_market_context(request: MarketAnalysisRequest) -> str:
+    """Live market context for registered symbols, a plain description otherwise"""
+    if market_data.registry.get(request.symbol) is not None:
+        bars = indicator_timeframe(request.timeframe)
+        # Only this symbol's slice of the shared snapshot; the analysis still runs without one
+        try:
+            quote = await market_data.get_quote(request.symbol)
+        except MarketDataUnavailable:
+            quote = None
+        return "\n".join([
+            format_quote_context(request.symbol.upper(), quote),
+            format_indicator_context(indicator_trackers[bars].latest(request.symbol), bars),
+        ])
+    return f"Analyzing {request.symbol} in {request.timeframe} timeframe"
+
+async def prepare_analysis(request: MarketAnalysisRequest):
+    """Resolve a request to (key, existing result) or (key, prompt, content key)"""
+    key = analysis_service.make_key(request.symbol, request.timeframe, request.analysis_type)
+    result = analysis_service.get_cached(key)
+    if result is not None:
+        return key, result, None, None
+    market_context = await build_market_context(request)
+    content_key = analysis_service.make_content_key(key, market_context)
+    result = await analysis_service.lookup(key, content_key)
+    if result is not None:
+        return key, result, None, None
+    prompt = build_prompt(request.symbol, request.timeframe, request.analysis_type, market_context)
+    return key, None, prompt, content_key
+
+async def charge_analysis(current_user: dict, headers: dict):
+    """Count one model call against the user's quota; the quota headers are added to headers"""
+    try:
+        usage = await analysis_quota.consume(current_user)
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Analysis quota of {e.limit} per window reached for your plan",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if usage is not None:
+        headers.update({"X-Quota-Limit": str(usage["limit"]), "X-Quota-Remaining": str(usage["remaining"])})
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {dumps(data).decode()}\n\n"
+
+@app.post("/api/analysis/gemini", response_model=MarketAnalysis)
+async def analyze_market_with_gemini(request: MarketAnalysisRequest, response: Response,
+                                     current_user: dict = Depends(get_current_user)):
+    """Use Gemini AI to analyze market data
+
+    Only the request that starts a model call is charged against the user's
+    quota; identical requests joining it, and cache hits, are free.
+    """
+    try:
+        key, result, prompt, content_key = await prepare_analysis(request)
+        if result is None:
+            result = await analysis_service.analyze(
+                key, prompt, content_key, charge=lambda: charge_analysis(current_user, response.headers)
+            )
         
         return {
             "symbol": request.symbol,
             "timeframe": request.timeframe,
-            "analysis": response.text,
-            "generated_at": datetime.utcnow(),
-            "analyst": "Gemini AI"
+            "analysis": result.text,
+            "generated_at": result.generated_at,
+            "analyst": result.analyst,
+            "cached": result.cached
         }
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+@app.post("/api/analysis/gemini/stream", response_class=StreamingResponse)
+async def stream_market_analysis(request: MarketAnalysisRequest, http_request: Request,
+                                 current_user: dict = Depends(get_current_user)):
+    """Server-sent events: `delta` text chunks as they are generated, then a `done` event with metadata
+
+    Cached and stored results are replayed for free. Otherwise every stream is
+    its own model call, charged against the user's quota: streams are never
+    coalesced with identical requests in flight.
+    """
+    try:
+        key, cached, prompt, content_key = await prepare_analysis(request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    quota_headers = {}
+    if cached is None:
+        await charge_analysis(current_user, quota_headers)
+
+    async def events():
+        if cached is not None:
+            yield sse_event({"delta": cached.text})
+        else:
+            try:
+                async with aclosing(analysis_service.stream(key, prompt, content_key)) as chunks:
+                    async for chunk in chunks:
+                        # Stop paying for tokens nobody will read
+                        if await http_request.is_disconnected():
+                            return
+                        yield sse_event({"delta": chunk})
+            except Exception as e:
+                logger.warning("Streaming analysis failed for %s: %s", request.symbol, e)
+                yield sse_event({"detail": f"Analysis failed: {str(e)}"}, event="error")
+                return
+        yield sse_event({
+            "symbol": request.symbol,
+            "timeframe": request.timeframe,
+            "generated_at": cached.generated_at if cached else datetime.utcnow(),
+            "analyst": cached.analyst if cached else analysis_service.provider.name,
+            "cached": cached is not None,
+        }, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **quota_headers})
 
-@app.get("/api/admin/settings")
+@app.get("/api/analysis/history", response_model=List[StoredAnalysis])
+async def get_analysis_history(
+    symbol: str,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+):
+    """Most recent stored analyses for a symbol, newest first"""
+    return await analyses_repo.recent(symbol.upper(), limit, STORED_ANALYSIS_PROJECTION)
+
+@app.get("/api/admin/settings", response_model=AdminSettingsView)
 async def get_admin_settings(current_user: dict = Depends(require_admin)):
     """Get admin settings"""
-    settings = admin_settings_collection.find_one({"type": "general"})
-    if not settings:
-        # Create default settings
-        default_settings = {
-            "type": "general",
-            "basic_plan_price": 29.99,
-            "premium_plan_price": 99.99,
-            "trading_api_keys": {},
-            "payment_api_keys": {},
-            "created_at": datetime.utcnow()
-        }
-        admin_settings_collection.insert_one(default_settings)
-        return default_settings
-    return settings
+    return admin_settings.snapshot.values
 
-@app.put("/api/admin/settings")
+@app.put("/api/admin/settings", response_model=SettingsUpdated)
 async def update_admin_settings(settings: AdminSettings, current_user: dict = Depends(require_admin)):
     """Update admin settings"""
-    admin_settings_collection.update_one(
-        {"type": "general"},
-        {"$set": {
-            "basic_plan_price": settings.basic_plan_price,
-            "premium_plan_price": settings.premium_plan_price,
-            "trading_api_keys": settings.trading_api_keys,
-            "payment_api_keys": settings.payment_api_keys,
-            "updated_at": datetime.utcnow()
-        }},
-        upsert=True
-    )
-    return {"message": "Settings updated successfully"}
+    snapshot = await admin_settings.update({
+        "basic_plan_price": settings.basic_plan_price,
+        "premium_plan_price": settings.premium_plan_price,
+        "trading_api_keys": settings.trading_api_keys,
+        "payment_api_keys": settings.payment_api_keys,
+    })
+    return {"message": "Settings updated successfully", "version": snapshot.version}
 
-@app.get("/api/admin/users")
-async def get_all_users(current_user: dict = Depends(require_admin)):
-    """Get all users for admin"""
-    users = list(users_collection.find({}, {"password": 0}))  # Exclude passwords
+@app.get("/api/admin/users", response_model=List[AdminUser])
+async def get_all_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    user_type: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    email_prefix: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user: dict = Depends(require_admin)
+):
+    """List users for admin, one keyset page at a time (next page cursor in X-Next-Cursor)"""
+    query = users_repo.build_filter(user_type, is_active, email_prefix)
+    
+    if format == "ndjson":
+        # Full export of the filtered set, streamed row by row
+        async def export_rows():
+            async for user in users_repo.iter_users(query, ADMIN_USER_PROJECTION):
+                yield dumps(user) + b"\n"
+        return StreamingResponse(export_rows(), media_type="application/x-ndjson")
+    
+    after = decode_user_cursor(cursor) if cursor else None
+    users = await users_repo.list_page(query, ADMIN_USER_PROJECTION, limit, after)
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = encode_user_cursor(users[-1])
     return users
 
-@app.put("/api/admin/users/{user_id}/upgrade")
+@app.post("/api/admin/users/import", response_model=ImportReport)
+async def import_users(
+    request: Request,
+    default_plan: str = Query("basic", pattern="^(basic|premium|admin)$"),
+    current_user: dict = Depends(require_admin),
+):
+    """Bulk-create users from an NDJSON body: one {"email", "password" | "password_hash", "full_name", "user_type"} per line
+
+    Rows are validated and inserted in unordered batches; the report lists every rejected line.
+    """
+    return await user_importer.import_rows(iter_ndjson(request.stream()), default_plan)
+
+@app.get("/api/admin/users/summary", response_model=UsersSummary)
+async def get_users_summary(current_user: dict = Depends(require_admin)):
+    """User counts per plan for the admin overview"""
+    by_plan = await users_repo.count_by_plan()
+    return {"total": sum(by_plan.values()), "by_plan": by_plan}
+
+@app.put("/api/admin/users/{user_id}/upgrade", response_model=Message)
 async def upgrade_user_plan(user_id: str, new_plan: str, current_user: dict = Depends(require_admin)):
     """Upgrade user plan"""
     if new_plan not in ["basic", "premium", "admin"]:
         raise HTTPException(status_code=400, detail="Invalid plan type")
     
-    result = users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"user_type": new_plan, "updated_at": datetime.utcnow()}}
+    updated = await users_repo.update_fields(
+        user_id,
+        {"user_type": new_plan, "updated_at": datetime.utcnow()}
     )
     
-    if result.matched_count == 0:
+    if not updated:
         raise HTTPException(status_code=404, detail="User not found")
     
+    principal_cache.invalidate(user_id)
     return {"message": f"User plan updated to {new_plan}"}
 
+@app.post("/api/admin/users/plan", response_model=AdminJobView, status_code=status.HTTP_202_ACCEPTED)
+async def bulk_change_plan(request: BulkPlanChange, current_user: dict = Depends(require_admin)):
+    """Change the plan of many users in the background; poll /api/admin/jobs/{job_id} for progress"""
+    if (request.user_ids is None) == (request.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either user_ids or filter")
+    if request.filter is not None:
+        query = users_repo.build_filter(**request.filter.model_dump())
+        if not query:
+            raise HTTPException(status_code=400, detail="Filter must have at least one criterion")
+        job = await admin_jobs.change_plans(current_user["id"], request.new_plan, query=query)
+    else:
+        job = await admin_jobs.change_plans(current_user["id"], request.new_plan, user_ids=request.user_ids)
+    return job.to_dict()
+
+@app.get("/api/admin/jobs/{job_id}", response_model=AdminJobView)
+async def get_admin_job(job_id: str, current_user: dict = Depends(require_admin)):
+    """Status and progress of a bulk admin job"""
+    job = await admin_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.put("/api/admin/users/{user_id}/status", response_model=Message)
+async def set_user_active(user_id: str, is_active: bool, current_user: dict = Depends(require_admin)):
+    """Activate or deactivate a user account"""
+    updated = await users_repo.update_fields(
+        user_id,
+        {"is_active": is_active, "updated_at": datetime.utcnow()}
+    )
+    
+    if not updated:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    principal_cache.invalidate(user_id)
+    return {"message": f"User {'activated' if is_active else 'deactivated'}"}
+
+# Trading bot
+def require_premium(current_user: dict = Depends(get_current_user)):
+    if current_user.get("user_type") not in BOT_PLANS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Trading Bot requires Premium subscription"
+        )
+    return current_user
+
+def check_trading_pairs(pairs: List[str]):
+    """400 unless every pair's base ticker is in the symbol registry"""
+    unknown = [pair for pair in pairs if market_data.registry.get(pair_base(pair)) is None]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown trading pairs: {', '.join(unknown)}")
+
+async def load_bot_config(user_id: str) -> BotConfig:
+    saved = await bots_repo.get(user_id)
+    return BotConfig(**saved["config"]) if saved else BotConfig()
+
+@app.get("/api/bot/config", response_model=BotConfig)
+async def get_bot_config(current_user: dict = Depends(get_current_user)):
+    """Get the user's saved bot configuration (defaults if never saved)"""
+    return await load_bot_config(current_user["id"])
+
+@app.put("/api/bot/config", response_model=Message)
+async def save_bot_config(config: BotConfig, current_user: dict = Depends(get_current_user)):
+    """Save the bot configuration; a running bot picks it up immediately"""
+    check_trading_pairs(config.trading_pairs)
+    await bots_repo.save_config(current_user["id"], config.model_dump())
+    if primary_lock.held and bot_engine.get(current_user["id"]) is not None:
+        bot_engine.activate(current_user["id"], config.model_dump())
+    return {"message": "Bot configuration saved successfully"}
+
+@app.post("/api/bot/start", response_model=BotToggle)
+async def start_bot(current_user: dict = Depends(require_premium)):
+    """Start the user's trading bot"""
+    config = await load_bot_config(current_user["id"])
+    # Configs saved before pairs were validated may still name unknown ones
+    check_trading_pairs(config.trading_pairs)
+    await bots_repo.save_config(current_user["id"], config.model_dump())
+    await bots_repo.set_active(current_user["id"], True)
+    if primary_lock.held:
+        bot_engine.activate(current_user["id"], config.model_dump())
+    return {"message": "Trading Bot started", "active": True}
+
+@app.post("/api/bot/stop", response_model=BotToggle)
+async def stop_bot(current_user: dict = Depends(get_current_user)):
+    """Stop the user's trading bot (open paper positions are kept)"""
+    await bots_repo.set_active(current_user["id"], False)
+    if primary_lock.held:
+        bot_engine.deactivate(current_user["id"])
+    return {"message": "Trading Bot stopped", "active": False}
+
+@app.get("/api/bot/status", response_model=BotStatus)
+async def get_bot_status(current_user: dict = Depends(get_current_user)):
+    """Running state, stats, open positions and recent trades of the user's bot"""
+    if not primary_lock.held:
+        # Bots run in the primary worker; other workers only know the persisted state
+        saved = await bots_repo.get(current_user["id"], {"_id": 0, "active": 1})
+        return {"active": bool(saved and saved.get("active")), "stats": None, "positions": [], "recent_trades": []}
+    bot = bot_engine.get(current_user["id"])
+    if bot is None:
+        return {"active": False, "stats": None, "positions": [], "recent_trades": []}
+    return {
+        "active": True,
+        "stats": bot.stats(),
+        "positions": [position.to_dict() for position in bot.positions.values()],
+        "recent_trades": list(reversed(bot.trades)),
+    }
+
+MAX_BACKTEST_COMBINATIONS = 500
+
+@app.post("/api/bot/backtest", response_model=BacktestJobView, status_code=status.HTTP_202_ACCEPTED)
+async def start_backtest(request: BacktestRequest, current_user: dict = Depends(require_premium)):
+    """Queue a backtest (or a stopLoss x takeProfit x pair sweep) over stored candles"""
+    # Bars are resampled from the stored series; only timeframes they tile can be replayed
+    if base_timeframe(TIMEFRAME_SECONDS[request.timeframe]) is None:
+        supported = [name for name, seconds in TIMEFRAME_SECONDS.items() if base_timeframe(seconds)]
+        raise HTTPException(status_code=400, detail=f"Backtests support the timeframes: {', '.join(supported)}")
+    check_trading_pairs(request.trading_pairs)
+    stop_losses = request.stop_loss_grid or [request.stop_loss]
+    take_profits = request.take_profit_grid or [request.take_profit]
+    if any(value <= 0 for value in stop_losses + take_profits):
+        raise HTTPException(status_code=400, detail="Stop loss and take profit must be positive")
+    combinations = len(request.trading_pairs) * len(stop_losses) * len(take_profits)
+    if combinations > MAX_BACKTEST_COMBINATIONS:
+        raise HTTPException(status_code=400, detail=f"Sweep too large ({combinations} > {MAX_BACKTEST_COMBINATIONS})")
+    if await backtest_jobs.active_jobs(current_user["id"]) >= backtest_jobs.max_active_per_user:
+        raise HTTPException(status_code=429, detail="Too many backtests running")
+    
+    config = request.model_dump(include=set(BotConfig.model_fields))
+    job = await backtest_jobs.submit(
+        current_user["id"], config, request.trading_pairs, stop_losses, take_profits,
+        request.timeframe, request.start, request.end, request.initial_capital,
+    )
+    return job.to_dict(include_results=False)
+
+@app.get("/api/bot/backtest/{job_id}", response_model=BacktestJobView)
+async def get_backtest(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll a backtest job: progress while running, results once completed"""
+    job = await backtest_jobs.get(job_id)
+    if job is None or job["owner_id"] != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+    return job
+
+# Price alerts
+@app.post("/api/alerts", response_model=PriceAlert, status_code=status.HTTP_201_CREATED)
+async def create_price_alert(request: AlertCreate, current_user: dict = Depends(get_current_user)):
+    """Arm a one-shot alert; it fires on the first tick where the value is at or past the threshold"""
+    symbol = request.symbol.upper()
+    if market_data.registry.get(symbol) is None:
+        raise HTTPException(status_code=400, detail=f"Unknown symbol: {request.symbol}")
+    if request.metric == "price" and request.threshold <= 0:
+        raise HTTPException(status_code=400, detail="Price thresholds must be positive")
+    now = datetime.utcnow()
+    alert = {
+        "id": str(uuid.uuid4()),
+        "user_id": current_user["id"],
+        "symbol": symbol,
+        "metric": request.metric,
+        "condition": request.condition,
+        "threshold": request.threshold,
+        "status": "active",
+        "created_at": now,
+        "updated_at": now,
+    }
+    if not await alerts_repo.create(alert, ALERT_MAX_PER_USER):
+        raise HTTPException(status_code=429, detail=f"Too many active alerts (limit {ALERT_MAX_PER_USER})")
+    if primary_lock.held:
+        price_alerts.add(Alert.from_doc(alert))
+    return alert
+
+@app.get("/api/alerts", response_model=List[PriceAlert])
+async def list_price_alerts(
+    alert_status: Optional[Literal["active", "triggered", "cancelled"]] = Query(None, alias="status"),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    """The user's alerts, newest first"""
+    return await alerts_repo.list_for_user(current_user["id"], alert_status, limit, PRICE_ALERT_PROJECTION)
+
+@app.delete("/api/alerts/{alert_id}", response_model=Message)
+async def cancel_price_alert(alert_id: str, current_user: dict = Depends(get_current_user)):
+    """Disarm an active alert (triggered ones stay in the history)"""
+    if not await alerts_repo.cancel(current_user["id"], alert_id):
+        raise HTTPException(status_code=404, detail="Active alert not found")
+    if primary_lock.held:
+        price_alerts.remove(alert_id)
+    return {"message": "Alert cancelled"}
+
+# Streaming
+@app.websocket("/ws/market")
+async def market_stream(websocket: WebSocket, token: Optional[str] = None):
+    """Live price diffs for subscribed symbols plus the user's bot events and triggered alerts
+
+    Authenticate with ?token=<JWT>. Client messages:
+    {"action": "subscribe" | "unsubscribe", "symbols": ["BTC", ...]}
+    """
+    try:
+        user = await authenticate_token(token or "")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    subscriber = market_hub.connect(websocket, user["id"])
+    sender = market_hub.start_sender(subscriber)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                action, symbols = message.get("action"), list(message.get("symbols") or [])
+            except (ValueError, AttributeError, TypeError):
+                continue
+            if action == "subscribe":
+                market_hub.subscribe(subscriber, symbols)
+            elif action == "unsubscribe":
+                market_hub.unsubscribe(subscriber, symbols)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        market_hub.disconnect(subscriber)
+        sender.cancel()
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    import serve
+    serve.main()
\ No newline at end of file
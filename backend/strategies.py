@@ -0,0 +1,81 @@
+"""
+Trading strategies shared by the live bot engine and backtests
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+from indicators import sma
+
+# strategy -> (fast SMA window, slow SMA window)
+STRATEGY_WINDOWS = {
+    "conservative": (10, 30),
+    "balanced": (5, 20),
+    "aggressive": (3, 10),
+}
+
+# Fraction of maxTradeAmount committed per entry
+RISK_ALLOCATION = {
+    "low": 0.5,
+    "medium": 0.75,
+    "high": 1.0,
+}
+
+TIMEFRAME_SECONDS = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "4h": 14400,
+    "1d": 86400,
+}
+
+BUY = "buy"
+SELL = "sell"
+
+# Signal codes used by the vectorized form
+BUY_CODE = 1
+SELL_CODE = -1
+
+
+def history_needed(strategy: str) -> int:
+    """Closes required before a strategy can emit a signal"""
+    return STRATEGY_WINDOWS[strategy][1] + 1
+
+
+def crossover_signal(closes: Sequence[float], strategy: str) -> Optional[str]:
+    """SMA crossover on the latest close: BUY when fast crosses above slow, SELL on the reverse"""
+    fast, slow = STRATEGY_WINDOWS[strategy]
+    if len(closes) < slow + 1:
+        return None
+    prev_fast = sum(closes[-fast - 1:-1]) / fast
+    prev_slow = sum(closes[-slow - 1:-1]) / slow
+    cur_fast = sum(closes[-fast:]) / fast
+    cur_slow = sum(closes[-slow:]) / slow
+    if prev_fast <= prev_slow and cur_fast > cur_slow:
+        return BUY
+    if prev_fast >= prev_slow and cur_fast < cur_slow:
+        return SELL
+    return None
+
+
+def crossover_signals(closes: np.ndarray, strategy: str) -> np.ndarray:
+    """Vectorized crossover_signal over every bar: BUY_CODE, SELL_CODE or 0 per bar"""
+    fast, slow = STRATEGY_WINDOWS[strategy]
+    diff = sma(closes, fast) - sma(closes, slow)
+    signals = np.zeros(len(closes), dtype=np.int8)
+    previous, current = diff[:-1], diff[1:]
+    with np.errstate(invalid="ignore"):
+        signals[1:][(previous <= 0) & (current > 0)] = BUY_CODE
+        signals[1:][(previous >= 0) & (current < 0)] = SELL_CODE
+    return signals
+
+
+def exit_reason(entry_price: float, price: float, stop_loss_pct: float, take_profit_pct: float) -> Optional[str]:
+    """'stop_loss' / 'take_profit' when a long position has hit either level"""
+    change_pct = (price - entry_price) / entry_price * 100
+    if change_pct <= -stop_loss_pct:
+        return "stop_loss"
+    if change_pct >= take_profit_pct:
+        return "take_profit"
+    return None
@@ -0,0 +1,74 @@
+"""
+Symbol registry: maps trading tickers to market data provider IDs
+"""
+from typing import Optional, Dict, List
+
+
+class SymbolInfo:
+    def __init__(self, ticker: str, provider_id: str, asset_class: str = "crypto"):
+        self.ticker = ticker
+        self.provider_id = provider_id
+        self.asset_class = asset_class
+
+    @property
+    def base(self) -> str:
+        """EUR for EURUSD"""
+        return self.ticker[:3]
+
+    @property
+    def quote(self) -> str:
+        """USD for EURUSD"""
+        return self.ticker[3:]
+
+
+class SymbolRegistry:
+    """Lookup in both directions between tickers (BTC) and provider IDs (bitcoin)"""
+
+    def __init__(self):
+        self._by_ticker: Dict[str, SymbolInfo] = {}
+        self._by_provider_id: Dict[str, SymbolInfo] = {}
+
+    def register(self, ticker: str, provider_id: str, asset_class: str = "crypto") -> SymbolInfo:
+        info = SymbolInfo(ticker.upper(), provider_id, asset_class)
+        self._by_ticker[info.ticker] = info
+        self._by_provider_id[provider_id] = info
+        return info
+
+    def get(self, ticker: str) -> Optional[SymbolInfo]:
+        return self._by_ticker.get(ticker.upper())
+
+    def ticker_for(self, provider_id: str) -> Optional[str]:
+        info = self._by_provider_id.get(provider_id)
+        return info.ticker if info else None
+
+    def is_crypto(self, ticker: str) -> bool:
+        info = self.get(ticker)
+        return info is not None and info.asset_class == "crypto"
+
+    def symbols(self, asset_class: str) -> List[SymbolInfo]:
+        return [info for info in self._by_ticker.values() if info.asset_class == asset_class]
+
+    def provider_ids(self, asset_class: str = "crypto") -> List[str]:
+        return [info.provider_id for info in self._by_ticker.values() if info.asset_class == asset_class]
+
+    def tickers(self, asset_class: Optional[str] = None) -> List[str]:
+        return [
+            info.ticker for info in self._by_ticker.values()
+            if asset_class is None or info.asset_class == asset_class
+        ]
+
+
+def default_registry() -> SymbolRegistry:
+    registry = SymbolRegistry()
+    registry.register("BTC", "bitcoin")
+    registry.register("ETH", "ethereum")
+    registry.register("BNB", "binancecoin")
+    registry.register("ADA", "cardano")
+    registry.register("SOL", "solana")
+    registry.register("MATIC", "polygon")
+    registry.register("LINK", "chainlink")
+    registry.register("LTC", "litecoin")
+    # Forex pairs: the ticker doubles as the provider ID
+    for pair in ("EURUSD", "GBPUSD", "USDJPY"):
+        registry.register(pair, pair, "forex")
+    return registry
@@ -0,0 +1,148 @@
+"""
+Shared fixtures: a local stub HTTP server for the market feeds and the app on mongomock
+
+Nothing here reaches the network or a real MongoDB. Run from backend/:
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# server.py reads its configuration at import time
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017/mk7_test")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+os.environ.setdefault("CANDLE_DATA_DIR", os.path.join(tempfile.mkdtemp(prefix="mk7-test-"), "candles"))
+os.environ.setdefault("ANALYSIS_PROVIDER", "fake")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+# Nothing listens on the discard port: a feed the tests forget to stub fails fast
+for name in ("MARKET_FEED_URL", "MARKET_FALLBACK_FEED_URL", "FOREX_FEED_URL", "FOREX_FALLBACK_FEED_URL"):
+    os.environ.setdefault(name, "http://127.0.0.1:9/")
+
+
+class StubServer:
+    """Answers each path with a canned JSON body, status and delay; counts the hits per path"""
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = Counter()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.partition("?")[0]
+                stub.hits[path] += 1
+                status, body, delay = stub.routes.get(path, (404, {"error": "not stubbed"}, 0.0))
+                if delay:
+                    time.sleep(delay)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    # The client gave up on a delayed answer
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+
+    def route(self, path: str, body, status: int = 200, delay: float = 0.0):
+        self.routes[path] = (status, body, delay)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+
+@pytest.fixture
+def stub_server():
+    stub = StubServer()
+    threading.Thread(target=stub.server.serve_forever, daemon=True).start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def database():
+    from mongomock_motor import AsyncMongoMockClient
+
+    return AsyncMongoMockClient()["mk7_test"]
+
+
+@pytest.fixture
+def app_client(monkeypatch, database):
+    """TestClient on the real app with every repository on mongomock, a fake model and a seeded BTC/ETH snapshot"""
+    from fastapi.testclient import TestClient
+
+    import server
+    from analysis import FakeProvider
+    from cache import TTLCache
+    from market_data import MarketSnapshot
+    from passwords import PasswordHasher
+    from quotes import Quote
+    from repository import (
+        AdminSettingsRepository, AlertRepository, AnalysisRepository, BotRepository, JobRepository, UsageRepository,
+        UserRepository,
+    )
+
+    users_repo = UserRepository(database)
+    alerts_repo = AlertRepository(database)
+    analyses_repo = AnalysisRepository(database)
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "users_repo", users_repo)
+    monkeypatch.setattr(server, "bots_repo", BotRepository(database))
+    monkeypatch.setattr(server, "alerts_repo", alerts_repo)
+    monkeypatch.setattr(server, "analyses_repo", analyses_repo)
+    monkeypatch.setattr(server.admin_settings, "repository", AdminSettingsRepository(database))
+    monkeypatch.setattr(server.price_alerts, "repository", alerts_repo)
+    monkeypatch.setattr(server.user_importer, "users_repo", users_repo)
+    monkeypatch.setattr(server.admin_jobs, "users_repo", users_repo)
+    jobs_repo = JobRepository(database)
+    monkeypatch.setattr(server.admin_jobs, "repository", jobs_repo)
+    monkeypatch.setattr(server.backtest_jobs, "repository", jobs_repo)
+    monkeypatch.setattr(server.analysis_quota, "repository", UsageRepository(database))
+    monkeypatch.setattr(server.analysis_service, "store", analyses_repo)
+    monkeypatch.setattr(server.analysis_service, "provider", FakeProvider())
+    monkeypatch.setattr(server.analysis_service, "_cache", TTLCache(ttl=server.analysis_service.ttl))
+    server.principal_cache.clear()
+    # Shutdown closes these executors for good, so every app start gets fresh ones
+    monkeypatch.setattr(server, "password_hasher", PasswordHasher.from_env())
+    monkeypatch.setattr(server.user_importer, "_executor", None)
+    monkeypatch.setattr(server.backtest_jobs, "_executor", None)
+    monkeypatch.setattr(server.market_data, "start", lambda: None)
+    monkeypatch.setattr(server.market_data, "_snapshot", MarketSnapshot(
+        {"BTC": Quote("BTC", "crypto", 50000.0, 1.5, 9.8e11, ("coingecko",)),
+         "ETH": Quote("ETH", "crypto", 3000.0, -0.5, 3.6e11, ("coingecko",))},
+        time.time(), 1, server.market_data.registry,
+    ))
+    with TestClient(server.app) as client:
+        yield client
+    # The engine outlives the app; don't leak running bots into the next test
+    server.bot_engine.sync({})
+
+
+def register(client, email: str, user_type: str = None, database=None) -> dict:
+    """Register a user (optionally on another plan) and return its Authorization header"""
+    response = client.post("/api/auth/register", json={"email": email, "password": "secret123", "full_name": "Test"})
+    assert response.status_code == 200, response.text
+    if user_type is not None:
+        client.portal.call(database.users.update_one, {"email": email}, {"$set": {"user_type": user_type}})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
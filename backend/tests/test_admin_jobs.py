@@ -0,0 +1,124 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from admin_jobs import AdminJobManager
+from conftest import register
+from repository import JobRepository, UserRepository
+
+EPOCH = datetime(2024, 1, 1)
+
+
+class RecordingJobs(JobRepository):
+    """Keeps every progress write so a test can replay how a job advanced"""
+
+    def __init__(self, database):
+        super().__init__(database)
+        self.writes = []
+
+    async def update(self, job_id, fields):
+        self.writes.append(dict(fields))
+        await super().update(job_id, fields)
+
+
+class FailingUsers(UserRepository):
+    """Fails the write of the second chunk"""
+
+    calls = 0
+
+    async def update_many_by_ids(self, user_ids, fields, unless=None):
+        self.calls += 1
+        if self.calls == 2:
+            raise RuntimeError("write concern timeout")
+        return await super().update_many_by_ids(user_ids, fields, unless)
+
+
+def seed(database, plans):
+    async def insert():
+        await database.users.insert_many([
+            {"id": f"u{n}", "email": f"u{n}@example.com", "user_type": plan, "is_active": True,
+             "created_at": EPOCH + timedelta(seconds=n)}
+            for n, plan in enumerate(plans)
+        ])
+    return insert()
+
+
+def run_job(manager, **kwargs):
+    async def scenario():
+        job = await manager.change_plans("admin-1", "premium", **kwargs)
+        while job.status in ("queued", "running"):
+            await asyncio.sleep(0.01)
+        return await manager.get(job.id)
+    return scenario()
+
+
+def test_plan_change_records_progress_per_chunk(database):
+    jobs = RecordingJobs(database)
+    evicted = []
+    manager = AdminJobManager(UserRepository(database), jobs, on_users_changed=evicted.append, chunk_size=2)
+
+    async def scenario():
+        await seed(database, ["basic", "premium", "basic", "basic", "basic"])
+        return await run_job(manager, user_ids=["u0", "u1", "u2", "u3", "u4", "u0"])
+
+    job = asyncio.run(scenario())
+    assert (job["status"], job["total"], job["processed"], job["progress"]) == ("completed", 5, 5, 1.0)
+    # u1 was already premium
+    assert job["modified"] == 4
+    assert job["params"] == {"new_plan": "premium", "user_count": 6}
+    assert [write["processed"] for write in jobs.writes] == [0, 0, 2, 4, 5, 5]
+    assert evicted == [["u0", "u1"], ["u2", "u3"], ["u4"]]
+
+
+def test_plan_change_by_filter_counts_matching_users(database):
+    manager = AdminJobManager(UserRepository(database), JobRepository(database), on_users_changed=lambda ids: None)
+
+    async def scenario():
+        await seed(database, ["basic", "premium", "basic"])
+        job = await run_job(manager, query={"user_type": "basic"})
+        plans = {user["id"]: user["user_type"] async for user in database.users.find({}, {"_id": 0})}
+        return job, plans
+
+    job, plans = asyncio.run(scenario())
+    assert (job["status"], job["total"], job["modified"]) == ("completed", 2, 2)
+    assert job["params"]["filter"] == {"user_type": "basic"}
+    assert set(plans.values()) == {"premium"}
+
+
+def test_failed_chunk_fails_the_job_and_keeps_its_progress(database):
+    evicted = []
+    manager = AdminJobManager(FailingUsers(database), JobRepository(database), on_users_changed=evicted.append,
+                              chunk_size=2)
+
+    async def scenario():
+        await seed(database, ["basic"] * 5)
+        return await run_job(manager, user_ids=[f"u{n}" for n in range(5)])
+
+    job = asyncio.run(scenario())
+    assert (job["status"], job["error"]) == ("failed", "write concern timeout")
+    assert (job["processed"], job["modified"], job["progress"]) == (2, 2, 0.4)
+    assert job["finished_at"] is not None
+    assert evicted == [["u0", "u1"]]
+
+
+def test_bulk_plan_change_endpoint(app_client, database):
+    admin = register(app_client, "admin@example.com", "admin", database)
+    member = register(app_client, "member@example.com")
+    member_id = app_client.get("/api/auth/me", headers=member).json()["id"]
+
+    assert app_client.post("/api/admin/users/plan", json={"new_plan": "premium"}, headers=admin).status_code == 400
+    assert app_client.post("/api/admin/users/plan", json={"new_plan": "premium", "user_ids": [member_id]},
+                           headers=member).status_code == 403
+
+    response = app_client.post("/api/admin/users/plan", json={"new_plan": "premium", "user_ids": [member_id]},
+                               headers=admin)
+    assert response.status_code == 202
+    job = response.json()
+    deadline = time.monotonic() + 5
+    while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.01)
+        job = app_client.get(f"/api/admin/jobs/{job['job_id']}", headers=admin).json()
+    assert (job["status"], job["modified"]) == ("completed", 1)
+    # The member's cached principal was evicted with the chunk
+    assert app_client.get("/api/auth/me", headers=member).json()["user_type"] == "premium"
+    assert app_client.get("/api/admin/jobs/unknown", headers=admin).status_code == 404
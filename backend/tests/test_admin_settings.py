@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from admin_settings import DEFAULT_SETTINGS, SettingsService
+from conftest import register
+from repository import AdminSettingsRepository
+
+
+class LaggingRepository(AdminSettingsRepository):
+    """Reports the newest version but serves documents from a stale replica"""
+
+    def __init__(self, database, stale: dict):
+        super().__init__(database)
+        self.stale = stale
+
+    async def get(self, settings_type="general"):
+        return dict(self.stale)
+
+
+class DownRepository(AdminSettingsRepository):
+    async def ensure_defaults(self, defaults, settings_type="general"):
+        raise ConnectionError("mongo unreachable")
+
+
+def test_peer_writes_are_picked_up_by_polling(database):
+    async def scenario():
+        writer = SettingsService(AdminSettingsRepository(database))
+        reader = SettingsService(AdminSettingsRepository(database))
+        await writer.load()
+        await reader.load()
+        unchanged = await reader.refresh()
+        await writer.update({"basic_plan_price": 19.99})
+        changed = await reader.refresh()
+        again = await reader.refresh()
+        return reader.snapshot, unchanged, changed, again, await database.admin_settings.count_documents({})
+
+    snapshot, unchanged, changed, again, documents = asyncio.run(scenario())
+    assert (unchanged, changed, again) == (False, True, False)
+    assert snapshot.version == 1 and snapshot["basic_plan_price"] == 19.99
+    assert snapshot["premium_plan_price"] == DEFAULT_SETTINGS["premium_plan_price"]
+    # Both workers loaded, only one defaults document was created
+    assert documents == 1
+
+
+def test_stale_reads_never_move_the_version_back(database):
+    async def scenario():
+        writer = SettingsService(AdminSettingsRepository(database))
+        await writer.load()
+        stale = await AdminSettingsRepository(database).get()
+        await writer.update({"basic_plan_price": 19.99})
+        reader = SettingsService(AdminSettingsRepository(database))
+        await reader.load()
+        reader.repository = LaggingRepository(database, stale)
+        await writer.update({"basic_plan_price": 9.99})
+        return await reader.refresh(), reader.snapshot
+
+    changed, snapshot = asyncio.run(scenario())
+    assert changed is False
+    assert (snapshot.version, snapshot["basic_plan_price"]) == (1, 19.99)
+
+
+def test_snapshot_is_read_only():
+    service = SettingsService(repository=None)
+    snapshot = service.snapshot
+    with pytest.raises(TypeError):
+        snapshot.values["basic_plan_price"] = 0
+    with pytest.raises(TypeError):
+        snapshot["trading_api_keys"]["exchange"] = "secret"
+    thawed = snapshot.to_dict()
+    thawed["trading_api_keys"]["exchange"] = "secret"
+    assert dict(snapshot["trading_api_keys"]) == {}
+
+
+def test_failed_load_serves_defaults_until_a_poll_succeeds(database):
+    async def scenario():
+        service = SettingsService(DownRepository(database))
+        await service.load()
+        served = service.snapshot
+        service.repository = AdminSettingsRepository(database)
+        await AdminSettingsRepository(database).update({"basic_plan_price": 5.0})
+        return served, await service.refresh(), service.snapshot
+
+    served, changed, snapshot = asyncio.run(scenario())
+    assert served.version == 0 and served["basic_plan_price"] == DEFAULT_SETTINGS["basic_plan_price"]
+    assert changed and snapshot["basic_plan_price"] == 5.0
+
+
+def test_background_poller_follows_the_stored_version(database):
+    async def scenario():
+        service = SettingsService(AdminSettingsRepository(database), poll_interval=0.01)
+        await service.load()
+        service.start()
+        try:
+            await AdminSettingsRepository(database).update({"premium_plan_price": 79.0})
+            for _ in range(100):
+                if service.snapshot.version == 1:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await service.stop()
+        return service.snapshot
+
+    snapshot = asyncio.run(scenario())
+    assert (snapshot.version, snapshot["premium_plan_price"]) == (1, 79.0)
+
+
+def test_settings_endpoints_return_the_new_version(app_client, database):
+    admin = register(app_client, "admin@example.com", "admin", database)
+    body = dict(DEFAULT_SETTINGS, basic_plan_price=24.99)
+    first = app_client.put("/api/admin/settings", json=body, headers=admin).json()
+    second = app_client.put("/api/admin/settings", json=body, headers=admin).json()
+    assert second["version"] == first["version"] + 1
+
+    settings = app_client.get("/api/admin/settings", headers=admin).json()
+    assert (settings["version"], settings["basic_plan_price"]) == (second["version"], 24.99)
@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime
+
+from conftest import register
+from repository import AlertRepository
+
+
+def alert(n: int, user_id: str = "u1") -> dict:
+    now = datetime.utcnow()
+    return {"id": f"alert-{n}", "user_id": user_id, "symbol": "BTC", "metric": "price", "condition": "above",
+            "threshold": 100.0 + n, "status": "active", "created_at": now, "updated_at": now}
+
+
+def test_concurrent_creates_stop_at_the_limit(database):
+    repo = AlertRepository(database)
+
+    async def scenario():
+        created = await asyncio.gather(*(repo.create(alert(n), limit=5) for n in range(20)))
+        return sum(created), await database.price_alerts.count_documents({"user_id": "u1", "status": "active"})
+
+    assert asyncio.run(scenario()) == (5, 5)
+
+
+def test_cancelled_and_triggered_alerts_free_their_slots(database):
+    repo = AlertRepository(database)
+
+    async def scenario():
+        for n in range(3):
+            assert await repo.create(alert(n), limit=3)
+        assert not await repo.create(alert(3), limit=3)
+        assert await repo.cancel("u1", "alert-0")
+        # Cancelling twice frees one slot only
+        assert not await repo.cancel("u1", "alert-0")
+        assert await repo.mark_triggered(["alert-0", "alert-1"], 105.0, datetime.utcnow()) == 1
+        await repo.mark_triggered(["alert-1"], 105.0, datetime.utcnow())
+        return [await repo.create(alert(n), limit=3) for n in range(4, 7)]
+
+    assert asyncio.run(scenario()) == [True, True, False]
+
+
+def test_counters_are_backfilled_from_existing_alerts(database):
+    repo = AlertRepository(database)
+
+    async def scenario():
+        await database.price_alerts.insert_many([alert(n) for n in range(2)] + [alert(9, "u2")])
+        await repo.backfill_counters()
+        await repo.backfill_counters()
+        return await repo.create(alert(3), limit=3), await repo.create(alert(4), limit=3)
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_alert_endpoint_enforces_the_limit(app_client, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "ALERT_MAX_PER_USER", 2)
+    headers = register(app_client, "alerts@example.com")
+    body = {"symbol": "BTC", "condition": "above", "threshold": 60000}
+    statuses = [app_client.post("/api/alerts", json=body, headers=headers).status_code for _ in range(3)]
+    assert statuses == [201, 201, 429]
@@ -0,0 +1,112 @@
+import asyncio
+
+from analysis import AnalysisService, FakeProvider
+from repository import AnalysisRepository
+
+KEY = AnalysisService.make_key("btc", "1h", "technical")
+
+
+def test_identical_concurrent_requests_share_one_call():
+    provider = FakeProvider(delay=0.05)
+    service = AnalysisService(provider, ttl=60)
+
+    async def scenario():
+        return await asyncio.gather(*(service.analyze(KEY, "prompt") for _ in range(10)))
+
+    results = asyncio.run(scenario())
+    assert provider.calls == 1
+    assert {result.text for result in results} == {results[0].text}
+
+
+def test_results_are_served_from_cache_within_ttl():
+    provider = FakeProvider()
+    service = AnalysisService(provider, ttl=60)
+
+    async def scenario():
+        first = await service.analyze(KEY, "prompt")
+        second = await service.analyze(KEY, "prompt")
+        other = await service.analyze(AnalysisService.make_key("ETH", "1h", "technical"), "prompt")
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+    assert not first.cached
+    assert second.cached and second.text == first.text
+    assert not other.cached
+    assert provider.calls == 2
+
+
+def test_only_the_starting_caller_is_charged():
+    provider = FakeProvider(delay=0.05)
+    service = AnalysisService(provider, ttl=60)
+    charged = []
+
+    def charge_for(name):
+        async def charge():
+            charged.append(name)
+        return charge
+
+    async def scenario():
+        await asyncio.gather(*(service.analyze(KEY, "prompt", charge=charge_for(i)) for i in range(5)))
+
+    asyncio.run(scenario())
+    assert charged == [0]
+    assert provider.calls == 1
+
+
+def test_failed_charge_fails_only_its_caller():
+    provider = FakeProvider(delay=0.05)
+    service = AnalysisService(provider, ttl=60)
+    charged = []
+
+    def charge_for(name):
+        async def charge():
+            if name == "over-quota":
+                raise PermissionError("quota reached")
+            charged.append(name)
+        return charge
+
+    async def scenario():
+        return await asyncio.gather(
+            service.analyze(KEY, "prompt", charge=charge_for("over-quota")),
+            service.analyze(KEY, "prompt", charge=charge_for("follower")),
+            return_exceptions=True,
+        )
+
+    leader, follower = asyncio.run(scenario())
+    assert isinstance(leader, PermissionError)
+    assert not isinstance(follower, Exception)
+    assert charged == ["follower"]
+    assert provider.calls == 1
+
+
+def test_stored_analysis_is_reused_by_another_worker(database):
+    context = "BTC price: $50000"
+    content_key = AnalysisService.make_content_key(KEY, context)
+    first_provider, second_provider = FakeProvider(), FakeProvider()
+    first = AnalysisService(first_provider, ttl=60, store=AnalysisRepository(database))
+    second = AnalysisService(second_provider, ttl=60, store=AnalysisRepository(database))
+
+    async def scenario():
+        generated = await first.analyze(KEY, "prompt", content_key)
+        return generated, await second.lookup(KEY, content_key)
+
+    generated, reused = asyncio.run(scenario())
+    assert reused is not None and reused.cached
+    assert reused.text == generated.text
+    assert second_provider.calls == 0
+
+
+def test_stream_caches_only_completed_runs():
+    service = AnalysisService(FakeProvider(), ttl=60)
+
+    async def abandon():
+        async for _chunk in service.stream(KEY, "prompt"):
+            break
+
+    async def complete():
+        return "".join([chunk async for chunk in service.stream(KEY, "prompt")])
+
+    asyncio.run(abandon())
+    assert service.get_cached(KEY) is None
+    text = asyncio.run(complete())
+    assert service.get_cached(KEY).text == text
@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+import pytest
+
+from backtest import _find_exit, simulate
+from candles import Candle, CandleStore
+from conftest import register
+from strategies import SELL_CODE
+
+CONFIG = {"strategy": "aggressive", "risk_level": "high", "max_trade_amount": 1000.0,
+          "stop_loss": 5.0, "take_profit": 10.0}
+# Fifteen flat bars, then a rise that crosses the fast SMA over the slow one: BUY on bar 15 at 101
+FLAT = [100.0] * 15 + [101.0]
+
+
+def run(tail, **overrides):
+    closes = np.array(FLAT + tail)
+    times = np.arange(len(closes), dtype=np.int64) * 3600
+    return simulate(times, closes, dict(CONFIG, **overrides), initial_capital=10000.0)
+
+
+def test_find_exit_takes_the_first_hit():
+    closes = np.array([100.0, 101.0, 99.0, 96.0, 94.0, 112.0])
+    signals = np.zeros(len(closes), dtype=np.int8)
+    assert _find_exit(closes, signals, 0, stop_loss=5, take_profit=10) == 4
+    assert _find_exit(closes, signals, 0, stop_loss=50, take_profit=10) == 5
+    assert _find_exit(closes, signals, 0, stop_loss=50, take_profit=50) is None
+    signals[2] = SELL_CODE
+    assert _find_exit(closes, signals, 0, stop_loss=5, take_profit=10) == 2
+
+
+def test_find_exit_searches_past_the_first_window():
+    closes = np.full(40, 100.0)
+    closes[33] = 80.0
+    signals = np.zeros(len(closes), dtype=np.int8)
+    assert _find_exit(closes, signals, 3, stop_loss=5, take_profit=10, window=2) == 33
+
+
+def test_take_profit_exit():
+    result = run([112.0])
+    [trade] = result["trades"]
+    assert (trade["entry_time"], trade["exit_time"], trade["reason"]) == (15 * 3600, 16 * 3600, "take_profit")
+    assert trade["pnl"] == pytest.approx(1000 / 101 * 11)
+    assert result["final_equity"] == pytest.approx(10000 + trade["pnl"])
+    assert (result["total_trades"], result["win_rate_pct"]) == (1, 100.0)
+
+
+def test_stop_loss_exit():
+    result = run([95.0, 95.0])
+    [trade] = result["trades"]
+    assert (trade["exit_price"], trade["reason"]) == (95.0, "stop_loss")
+    assert result["win_rate_pct"] == 0.0
+    assert result["max_drawdown_pct"] == pytest.approx(trade["pnl"] / 10000 * 100)
+
+
+def test_sell_signal_exit():
+    result = run([100.5, 99.0, 98.0])
+    [trade] = result["trades"]
+    # 98 is 3% below the entry: neither level was hit, the crossover closed it
+    assert (trade["exit_time"], trade["reason"]) == (18 * 3600, "signal")
+
+
+def test_position_still_open_at_the_end():
+    result = run([102.0, 103.0], take_profit=50.0)
+    [trade] = result["trades"]
+    assert (trade["reason"], trade["exit_time"]) == ("open", None)
+    assert trade["pnl"] == pytest.approx(1000 / 101 * 2)
+    # Counted as a trade, not in the win rate
+    assert (result["total_trades"], result["win_rate_pct"]) == (1, 0.0)
+    assert result["final_equity"] == pytest.approx(10000 + trade["pnl"])
+
+
+def test_closes_are_resampled_from_the_stored_series(tmp_path):
+    store = CandleStore(str(tmp_path))
+    start = 14400 * 100000
+    for n in range(12):
+        store.append("BTC", "1h", Candle(start + n * 3600, 100 + n, 100 + n, 100 + n, 100 + n))
+    bars = store.closes("BTC", 14400)
+    assert bars["time"].tolist() == [start, start + 14400, start + 28800]
+    assert bars["close"].tolist() == [103.0, 107.0, 111.0]
+    assert store.closes("BTC", 14400, limit=2)["close"].tolist() == [107.0, 111.0]
+    assert len(store.closes("BTC", 90)["close"]) == 0
+
+
+def test_backtest_job_lifecycle(app_client, database):
+    import server
+
+    start = 14400 * 100000
+    # Only a 10% take profit banks the spike; the wider ones ride it back down
+    closes = FLAT + [112.0] + [100.0] * 10
+    for n, close in enumerate(np.repeat(closes, 4)):
+        server.candle_store.append("BTC", "1h", Candle(start + n * 3600, close, close, close, close))
+    trader = register(app_client, "trader@example.com", "premium", database)
+    other = register(app_client, "other@example.com", "premium", database)
+
+    request = {"tradingPairs": ["BTC/USD"], "timeframe": "4h", "strategy": "aggressive", "riskLevel": "high",
+               "maxTradeAmount": 1000, "stopLossGrid": [5, 50], "takeProfitGrid": [10, 100]}
+    response = app_client.post("/api/bot/backtest", json=request, headers=trader)
+    assert response.status_code == 202, response.text
+    job = response.json()
+    assert (job["status"], job["total"], job["results"]) == ("queued", 4, None)
+
+    deadline = time.monotonic() + 30
+    while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+        job = app_client.get(f"/api/bot/backtest/{job['job_id']}", headers=trader).json()
+    assert job["status"] == "completed", job
+    assert job["progress"] == 1.0 and len(job["results"]) == 4
+    assert all(result["bars"] == len(closes) for result in job["results"])
+    assert job["best"]["take_profit"] == 10 and job["best"]["trades"][0]["reason"] == "take_profit"
+    assert "trades" not in job["results"][0]
+
+    assert app_client.get(f"/api/bot/backtest/{job['job_id']}", headers=other).status_code == 404
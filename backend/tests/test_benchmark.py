@@ -0,0 +1,55 @@
+import os
+import random
+import sys
+
+import pytest
+from starlette.routing import Match
+
+# The benchmark and the smoke test live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend_benchmark import SCENARIOS, MK7Benchmark, analysis_body, compare, percentile, summarize  # noqa: E402
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert [percentile(values, pct) for pct in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) == 0.0
+
+
+def test_summary_counts_errors_and_statuses():
+    samples = [(0.010, 0.008, 200)] * 8 + [(0.100, 0.090, 503), (0.200, 0.010, None)]
+    summary = summarize(samples, elapsed=2.0)
+    assert (summary["requests"], summary["errors"], summary["error_rate"]) == (10, 2, 0.2)
+    assert summary["throughput_rps"] == 5.0
+    assert summary["status_codes"] == {"200": 8, "503": 1, "error": 1}
+    assert summary["latency_ms"]["p50"] == 10.0 and summary["latency_ms"]["max"] == 200.0
+    # Service time excludes the client-side wait before sending
+    assert summary["service_ms"]["p99"] == 90.0
+
+
+def test_baseline_comparison_flags_p95_regressions(capsys):
+    def report(p95):
+        return {"endpoints": {"me": {"requests": 10, "throughput_rps": 5.0, "latency_ms": {"p95": p95}}}}
+
+    assert compare(report(11.0), report(10.0), max_regression_pct=20)
+    assert not compare(report(13.0), report(10.0), max_regression_pct=20)
+    assert "REGRESSION" in capsys.readouterr().err
+
+
+def test_scenario_mix_is_parsed_and_validated():
+    assert MK7Benchmark.parse_mix("me:4, login") == [("me", 4.0), ("login", 1.0)]
+    with pytest.raises(SystemExit):
+        MK7Benchmark.parse_mix("me:1,nope:2")
+
+
+def test_every_scenario_targets_a_served_route():
+    import server
+
+    for name, (method, path, _plan, body) in SCENARIOS.items():
+        scope = {"type": "http", "method": method, "path": path.partition("?")[0]}
+        assert any(route.matches(scope)[0] == Match.FULL for route in server.app.routes), name
+        if body is not None:
+            assert isinstance(body(random.Random(1)), dict)
+    assert analysis_body(random.Random(1))["analysis_type"] == "technical"
@@ -0,0 +1,83 @@
+import time
+
+from bot_engine import BotEngine
+from conftest import register
+from candles import Candle, CandleStore
+from market_data import MarketSnapshot
+from quotes import Quote
+from symbols import default_registry
+
+CONFIG = {
+    "trading_pairs": ["BTC/USD"], "timeframe": "5m", "strategy": "balanced",
+    "stop_loss": 2.0, "take_profit": 5.0, "max_trade_amount": 100.0, "risk_level": "low",
+}
+
+
+def snapshot(price: float) -> MarketSnapshot:
+    return MarketSnapshot({"BTC": Quote("BTC", "crypto", price)}, time.time(), 1, default_registry())
+
+
+def test_stop_loss_and_take_profit_fire_between_bars():
+    engine = BotEngine(market_data=None)
+    events = []
+    engine.add_listener(events.append)
+    bot = engine.activate("u1", CONFIG)
+
+    engine.broker.buy(bot, "BTC/USD", 100.0, 10.0)
+    engine.on_snapshot(snapshot(101.0))
+    assert "BTC/USD" in bot.positions
+    engine.on_snapshot(snapshot(97.9))
+    assert "BTC/USD" not in bot.positions
+    assert events[-1]["type"] == "stop_loss" and events[-1]["trade"]["price"] == 97.9
+
+    engine.broker.buy(bot, "BTC/USD", 100.0, 10.0)
+    engine.on_snapshot(snapshot(105.0))
+    assert events[-1]["type"] == "take_profit"
+
+
+def test_history_is_seeded_from_stored_candles(tmp_path):
+    store = CandleStore(str(tmp_path))
+    start = 1_700_000_000 - 1_700_000_000 % 3600
+    for i in range(60):
+        store.append("BTC", "1m", Candle(start + 60 * i, 1, 1, 1, 100.0 + i))
+
+    engine = BotEngine(market_data=None, candle_store=store)
+    engine.activate("u1", CONFIG)
+    closes = list(engine._closes[("BTC/USD", "5m")])
+    # The close of each 5m bar is the close of its last 1m bar
+    assert closes == [104.0 + 5 * i for i in range(12)]
+
+
+def test_missing_history_starts_empty(tmp_path):
+    engine = BotEngine(market_data=None, candle_store=CandleStore(str(tmp_path)))
+    engine.activate("u1", dict(CONFIG, timeframe="4h"))
+    assert list(engine._closes[("BTC/USD", "4h")]) == []
+
+
+def test_unknown_trading_pairs_are_rejected(app_client, database):
+    headers = register(app_client, "trader@example.com", "premium", database)
+    config = {"tradingPairs": ["BTC/USD", "XYZ/USD"], "timeframe": "1h"}
+    response = app_client.put("/api/bot/config", json=config, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown trading pairs: XYZ/USD"
+
+    # A config stored before validation existed cannot be started either
+    user_id = app_client.get("/api/auth/me", headers=headers).json()["id"]
+    legacy = {"user_id": user_id, "config": dict(CONFIG, trading_pairs=["XYZ/USD"]), "active": False}
+    app_client.portal.call(database.bots.insert_one, legacy)
+    assert app_client.post("/api/bot/start", headers=headers).status_code == 400
+
+
+def test_sync_stops_bots_of_downgraded_users(app_client, database):
+    import server
+
+    headers = register(app_client, "trader@example.com", "premium", database)
+    user_id = app_client.get("/api/auth/me", headers=headers).json()["id"]
+    assert app_client.post("/api/bot/start", headers=headers).status_code == 200
+    app_client.portal.call(server.sync_active_bots)
+    assert server.bot_engine.get(user_id) is not None
+
+    app_client.portal.call(database.users.update_one, {"id": user_id}, {"$set": {"user_type": "basic"}})
+    app_client.portal.call(server.sync_active_bots)
+    assert server.bot_engine.get(user_id) is None
+    assert app_client.portal.call(database.bots.find_one, {"user_id": user_id})["active"] is False
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+from candles import Candle, CandleBuilder, CandleStore
+
+HOUR = 3600
+
+
+def bar(time: int, close: float) -> Candle:
+    return Candle(time, close - 1, close + 1, close - 2, close, 10.0)
+
+
+def test_range_queries_binary_search_the_time_column(tmp_path):
+    store = CandleStore(str(tmp_path))
+    for i in range(10):
+        store.append("BTC", "1h", bar(i * HOUR, 100.0 + i))
+
+    bars = store.query("btc", "1h", start=2 * HOUR, end=6 * HOUR)
+    assert bars["time"].tolist() == [2 * HOUR, 3 * HOUR, 4 * HOUR, 5 * HOUR]
+    assert bars["close"].tolist() == [102.0, 103.0, 104.0, 105.0]
+    assert store.query("BTC", "1h", limit=2)["close"].tolist() == [108.0, 109.0]
+    assert store.query("BTC", "1h", start=2 * HOUR, end=6 * HOUR, limit=1)["time"].tolist() == [5 * HOUR]
+    assert store.symbols() == ["BTC"]
+
+
+def test_missing_and_invalid_series_have_no_bars(tmp_path):
+    store = CandleStore(str(tmp_path))
+    assert len(store.query("ETH", "1h")["time"]) == 0
+    assert len(store.query("../etc", "1h")["time"]) == 0
+    assert len(store.query("BTC", "5m")["time"]) == 0
+    with pytest.raises(ValueError):
+        store.append("../etc", "1h", bar(0, 1.0))
+    # Lookups of junk never create directories
+    assert os.listdir(tmp_path) == []
+
+
+def test_partial_append_is_repaired(tmp_path):
+    store = CandleStore(str(tmp_path))
+    for i in range(3):
+        store.append("BTC", "1m", bar(60 * i, 100.0 + i))
+    # A crash after writing some columns of the fourth row
+    for name in ("open", "high"):
+        with open(tmp_path / "BTC" / "1m" / f"{name}.bin", "ab") as f:
+            f.write(np.array([1.0]).tobytes())
+
+    assert len(store.query("BTC", "1m")["time"]) == 3
+    reopened = CandleStore(str(tmp_path))
+    reopened.append("BTC", "1m", bar(180, 103.0))
+    bars = reopened.query("BTC", "1m")
+    assert bars["close"].tolist() == [100.0, 101.0, 102.0, 103.0]
+    assert bars["open"].tolist() == [99.0, 100.0, 101.0, 102.0]
+
+
+def test_builder_rolls_ticks_up_to_every_timeframe(tmp_path):
+    store = CandleStore(str(tmp_path))
+    builder = CandleBuilder(store)
+    closed = []
+    builder.add_listener(lambda symbol, timeframe, candle: closed.append((timeframe, candle.time, candle.close)))
+
+    start = 10 * 86400
+    for minute, price in enumerate([100.0, 105.0, 95.0]):
+        builder.add_tick("BTC", price, start + 60 * minute)
+        builder.add_tick("BTC", price + 1, start + 60 * minute + 30)
+    builder.add_tick("BTC", 90.0, start + HOUR)
+
+    minutes = store.query("BTC", "1m")
+    assert minutes["close"].tolist() == [101.0, 106.0, 96.0]
+    assert minutes["high"].tolist() == [101.0, 106.0, 96.0]
+    assert minutes["low"].tolist() == [100.0, 105.0, 95.0]
+    # The hour closes once a bar of the next hour arrives
+    assert ("1h", start, 96.0) not in closed
+    builder.add_tick("BTC", 91.0, start + HOUR + 60)
+    assert ("1h", start, 96.0) in closed
+    hour = store.query("BTC", "1h")
+    assert (hour["open"][0], hour["high"][0], hour["low"][0]) == (100.0, 106.0, 95.0)
+    assert builder.open_candle("BTC", "1d").time == start
+
+
+def test_replica_builders_do_not_write(tmp_path):
+    store = CandleStore(str(tmp_path))
+    builder = CandleBuilder(store, persist=False)
+    for minute in range(3):
+        builder.add_tick("BTC", 100.0, 60 * minute)
+    assert store.symbols() == []
+
+
+def test_candles_endpoint_validates_its_input(app_client):
+    assert app_client.get("/api/market/candles", params={"symbol": "BTC", "timeframe": "5m"}).status_code == 400
+    assert app_client.get("/api/market/candles", params={"symbol": "NOPE"}).status_code == 404
+    response = app_client.get("/api/market/candles", params={"symbol": "BTC", "timeframe": "1d"})
+    assert response.status_code == 200
+    assert response.json()["symbol"] == "BTC"
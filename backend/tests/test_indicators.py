@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from candles import Candle, CandleStore, base_timeframe
+from conftest import register
+from indicators import IndicatorTracker, StreamingIndicators, bollinger, rsi, sma, summarize
+
+
+def random_walks(symbols: int, bars: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, (symbols, bars)), axis=1)
+    spread = rng.uniform(0.1, 1.0, (symbols, bars))
+    return close + spread, close - spread, close
+
+
+def test_simple_series_have_known_values():
+    assert np.allclose(sma([1, 2, 3, 4, 5], 3), [np.nan, np.nan, 2, 3, 4], equal_nan=True)
+    # Only gains: RSI saturates once the first window is full
+    assert np.isnan(rsi(np.arange(1.0, 20.0))[:14]).all()
+    assert rsi(np.arange(1.0, 20.0))[14:].tolist() == [100.0] * 5
+    upper, middle, lower = bollinger(np.full(30, 5.0))
+    assert upper[-1] == middle[-1] == lower[-1] == 5.0
+
+
+def test_batch_rows_match_one_symbol_at_a_time():
+    high, low, close = random_walks(3, 120)
+    together = summarize(high, low, close)
+    for row in range(3):
+        alone = summarize(high[row], low[row], close[row])
+        for name, values in together.items():
+            assert values[row] == pytest.approx(alone[name][0]), name
+
+
+def test_streaming_matches_batch():
+    high, low, close = random_walks(2, 300)
+    batch = summarize(high, low, close)
+    for row in range(2):
+        streamed = StreamingIndicators.from_history(high[row], low[row], close[row]).latest()
+        for name, value in streamed.items():
+            # latest() rounds to 6 decimals
+            assert value == pytest.approx(batch[name][row], abs=1e-6), name
+
+
+def test_streaming_reports_missing_history_as_none():
+    state = StreamingIndicators()
+    state.update(101.0, 99.0, 100.0)
+    latest = state.latest()
+    assert latest["close"] == 100.0
+    assert latest["sma_20"] is None and latest["rsi_14"] is None and latest["macd"] is None
+
+
+def test_tracker_follows_its_own_timeframe(tmp_path):
+    store = CandleStore(str(tmp_path))
+    for i in range(30):
+        store.append("BTC", "1h", Candle(3600 * i, 100, 101, 99, 100.0 + i))
+    tracker = IndicatorTracker(timeframe="1h")
+    tracker.warm_up(store)
+    assert tracker.latest("btc")["bars"] == 30
+
+    tracker.on_candle("BTC", "1m", Candle(0, 1, 1, 1, 1.0))
+    tracker.on_candle("BTC", "1h", Candle(3600 * 30, 130, 131, 129, 130.0))
+    assert tracker.latest("BTC")["bars"] == 31
+    assert tracker.latest("BTC")["close"] == 130.0
+
+
+def test_base_timeframe_picks_the_coarsest_tiling_bar():
+    assert [base_timeframe(s) for s in (60, 300, 3600, 14400, 86400, 30)] == ["1m", "1m", "1h", "1h", "1d", None]
+
+
+def test_analysis_context_uses_bars_of_the_requested_timeframe(app_client, monkeypatch):
+    import server
+
+    hourly = IndicatorTracker(timeframe="1h")
+    for i in range(30):
+        hourly.update("BTC", 101.0 + i, 99.0 + i, 100.0 + i)
+    monkeypatch.setitem(server.indicator_trackers, "1h", hourly)
+    monkeypatch.setitem(server.indicator_trackers, "1d", IndicatorTracker(timeframe="1d"))
+    headers = register(app_client, "bars@example.com")
+
+    def context(timeframe):
+        body = {"symbol": "BTC", "timeframe": timeframe}
+        return app_client.post("/api/analysis/gemini", json=body, headers=headers).json()["analysis"]
+
+    assert "Computed indicators on 1h bars: close=129.0" in context("4h")
+    assert "No 1d indicator history available yet" in context("1d")
+
+    response = app_client.get("/api/market/indicators", params={"symbols": "BTC", "timeframe": "1h"})
+    assert response.json()["BTC"]["bars"] == 30
+    assert app_client.get("/api/market/indicators", params={"timeframe": "4h"}).status_code == 400
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from analysis import format_quote_context
+from conftest import register
+from market_data import MarketDataService, MarketDataUnavailable
+from quotes import CoinGeckoProvider, Quote, QuoteAggregator
+from symbols import SymbolRegistry
+
+PRICES = {
+    "bitcoin": {"usd": 50000.0, "usd_24h_change": 1.5, "usd_market_cap": 9.8e11},
+    "ethereum": {"usd": 3000.0, "usd_24h_change": -0.5, "usd_market_cap": 3.6e11},
+}
+
+
+def crypto_registry() -> SymbolRegistry:
+    registry = SymbolRegistry()
+    registry.register("BTC", "bitcoin")
+    registry.register("ETH", "ethereum")
+    return registry
+
+
+def service(stub_server, **kwargs) -> MarketDataService:
+    aggregator = QuoteAggregator([CoinGeckoProvider(stub_server.url("/simple/price"))], timeout=1.0)
+    return MarketDataService(aggregator, crypto_registry(), **kwargs)
+
+
+def test_refresh_builds_snapshot_from_feed(stub_server):
+    stub_server.route("/simple/price", PRICES)
+    market = service(stub_server)
+
+    async def scenario():
+        try:
+            return await market.get_snapshot()
+        finally:
+            await market.aggregator.close()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot.quote("BTC").price == 50000.0
+    assert snapshot.quote("ETH").change_24h_pct == -0.5
+    assert snapshot.updated == {"BTC", "ETH"}
+
+
+def test_failed_refresh_keeps_last_good_snapshot(stub_server):
+    stub_server.route("/simple/price", PRICES)
+    market = service(stub_server)
+
+    async def scenario():
+        try:
+            first = await market.refresh()
+            stub_server.route("/simple/price", {"error": "rate limited"}, status=429)
+            second = await market.refresh()
+            return first, second, await market.get_snapshot()
+        finally:
+            await market.aggregator.close()
+
+    first, second, served = asyncio.run(scenario())
+    assert second is first
+    assert served is first
+    assert market.last_error is not None
+
+
+def test_cold_start_outage_fails_fast(stub_server):
+    stub_server.route("/simple/price", {}, status=503)
+    market = service(stub_server, failure_backoff=60.0)
+
+    async def scenario():
+        outcomes = []
+        try:
+            for _ in range(2):
+                results = await asyncio.gather(*(market.get_snapshot() for _ in range(5)), return_exceptions=True)
+                outcomes.extend(results)
+        finally:
+            await market.aggregator.close()
+        return outcomes
+
+    outcomes = asyncio.run(scenario())
+    assert all(isinstance(outcome, MarketDataUnavailable) for outcome in outcomes)
+    # One attempt reached the feed; the other nine requests were answered from the failure
+    assert stub_server.hits["/simple/price"] == 1
+
+
+def test_crypto_prices_served_from_snapshot(app_client):
+    response = app_client.get("/api/market/crypto-prices")
+    assert response.status_code == 200
+    assert response.json()["bitcoin"]["usd"] == 50000.0
+    assert "X-Data-Version" in response.headers
+
+
+def test_analysis_runs_without_market_data(app_client, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server.market_data, "_snapshot", None)
+    monkeypatch.setattr(server.market_data, "last_error_at", time.time())
+    headers = register(app_client, "cold@example.com")
+    response = app_client.post("/api/analysis/gemini", json={"symbol": "BTC"}, headers=headers)
+    assert response.status_code == 200
+    # The fake model echoes the prompt
+    assert "No current quote available for BTC" in response.json()["analysis"]
+
+
+def test_analysis_prompt_carries_only_the_requested_symbol(app_client):
+    headers = register(app_client, "slice@example.com")
+    response = app_client.post("/api/analysis/gemini", json={"symbol": "eth"}, headers=headers)
+    assert response.status_code == 200
+    analysis = response.json()["analysis"]
+    assert "ETH price: $3000.0, 24h change: -0.50%, market cap: $360,000,000,000" in analysis
+    assert "BTC" not in analysis and "50000" not in analysis
+
+
+def test_unregistered_symbol_gets_a_plain_description(app_client):
+    headers = register(app_client, "plain@example.com")
+    response = app_client.post("/api/analysis/gemini", json={"symbol": "NOPE", "timeframe": "1h"}, headers=headers)
+    assert "Analyzing NOPE in 1h timeframe" in response.json()["analysis"]
+
+
+def test_quote_context_formats_each_asset_class():
+    assert format_quote_context("EURUSD", Quote("EURUSD", "forex", 1.0845678)) == "EURUSD rate: 1.08457"
+    assert format_quote_context("BTC", Quote("BTC", "crypto", 50000.0, 1.5)) == "BTC price: $50000.0, 24h change: 1.50%"
+    assert format_quote_context("BTC", None) == "No current quote available for BTC"
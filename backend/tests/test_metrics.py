@@ -0,0 +1,84 @@
+import time
+
+from cache import TTLCache
+from conftest import register
+from metrics import Registry
+
+
+def test_peek_neither_counts_nor_serves_expired_entries():
+    cache = TTLCache(ttl=60)
+    cache.set("a", 1)
+    cache.set("old", 2, ttl=-1)
+    assert (cache.peek("a"), cache.peek("old"), cache.peek("missing")) == (1, None, None)
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert cache.get("a") == 1 and (cache.hits, cache.misses) == (1, 0)
+
+
+def test_analysis_cache_counts_one_lookup_per_request(app_client):
+    import server
+
+    headers = register(app_client, "metrics@example.com")
+    for _ in range(2):
+        response = app_client.post("/api/analysis/gemini", json={"symbol": "BTC"}, headers=headers)
+        assert response.status_code == 200
+    assert server.analysis_service.cache_stats() == {"hit": 1, "miss": 1}
+
+    body = app_client.get("/api/metrics").text
+    assert 'cache_requests_total{cache="analysis",result="hit"} 1.0' in body
+    assert 'cache_requests_total{cache="analysis",result="miss"} 1.0' in body
+
+
+def test_routes_are_labelled_by_template(app_client):
+    sample = 'http_request_duration_seconds_count{method="GET",route="/api/bot/backtest/{job_id}",status="404"} '
+
+    def count(body: str) -> float:
+        # The registry is process-wide: other tests may have hit this route too
+        return next((float(line[len(sample):]) for line in body.splitlines() if line.startswith(sample)), 0.0)
+
+    headers = register(app_client, "labels@example.com")
+    before = count(app_client.get("/api/metrics").text)
+    for job_id in ("first", "second"):
+        assert app_client.get(f"/api/bot/backtest/{job_id}", headers=headers).status_code == 404
+
+    body = app_client.get("/api/metrics").text
+    assert count(body) == before + 2
+    assert "/api/bot/backtest/first" not in body
+
+
+def test_metrics_token_is_enforced(app_client, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "METRICS_TOKEN", "scrape-me")
+    assert app_client.get("/api/metrics").status_code == 401
+    response = app_client.get("/api/metrics", headers={"Authorization": "Bearer scrape-me"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.callback("queue_depth", "Queued jobs", "gauge", lambda: [({"queue": 'a"b'}, 3)])
+
+    def broken():
+        raise RuntimeError("collector down")
+
+    registry.callback("broken", "Never rendered", "gauge", broken)
+    requests.inc(route="/x")
+    requests.inc(2, route="/x")
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    with latency.time():
+        time.sleep(0.001)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/x"} 3.0' in lines
+    assert [line for line in lines if line.startswith("latency_seconds_bucket")] == [
+        'latency_seconds_bucket{le="0.1"} 2.0', 'latency_seconds_bucket{le="1.0"} 3.0',
+        'latency_seconds_bucket{le="+Inf"} 4.0',
+    ]
+    assert "latency_seconds_count 4.0" in lines
+    assert 'queue_depth{queue="a\\"b"} 3.0' in lines
+    assert not any(line.startswith("# HELP broken") for line in lines)
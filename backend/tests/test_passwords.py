@@ -0,0 +1,61 @@
+import asyncio
+
+from conftest import register
+from passwords import PasswordHasher
+from provisioning import hash_passwords
+
+
+def test_verify_and_update_flags_hashes_of_another_cost():
+    hasher = PasswordHasher(rounds=4, max_workers=2)
+    [old_hash] = hash_passwords(["secret"], rounds=5)
+
+    async def scenario():
+        current_hash = await hasher.hash("secret")
+        return (
+            await hasher.verify_and_update("secret", old_hash),
+            await hasher.verify_and_update("secret", current_hash),
+            await hasher.verify_and_update("wrong", old_hash),
+        )
+
+    try:
+        (valid, new_hash), current, wrong = asyncio.run(scenario())
+    finally:
+        hasher.close()
+    assert valid and new_hash.startswith("$2b$04$")
+    assert current == (True, None)
+    assert wrong == (False, None)
+
+
+def stored_password(client, database, email: str) -> str:
+    return client.portal.call(database.users.find_one, {"email": email})["password"]
+
+
+def set_fields(client, database, email: str, fields: dict):
+    client.portal.call(database.users.update_one, {"email": email}, {"$set": fields})
+
+
+def test_login_rehashes_an_outdated_hash(app_client, database):
+    register(app_client, "rehash@example.com")
+    [old_hash] = hash_passwords(["secret123"], rounds=5)
+    set_fields(app_client, database, "rehash@example.com", {"password": old_hash})
+
+    response = app_client.post("/api/auth/login", json={"email": "rehash@example.com", "password": "secret123"})
+    assert response.status_code == 200
+    new_hash = stored_password(app_client, database, "rehash@example.com")
+    assert new_hash != old_hash and new_hash.startswith("$2b$04$")
+    # The new hash keeps working and needs no further update
+    response = app_client.post("/api/auth/login", json={"email": "rehash@example.com", "password": "secret123"})
+    assert response.status_code == 200
+    assert stored_password(app_client, database, "rehash@example.com") == new_hash
+
+
+def test_disabled_account_is_not_rehashed(app_client, database):
+    register(app_client, "off@example.com")
+    [old_hash] = hash_passwords(["secret123"], rounds=5)
+    set_fields(app_client, database, "off@example.com", {"password": old_hash, "is_active": False})
+
+    wrong = app_client.post("/api/auth/login", json={"email": "off@example.com", "password": "nope"})
+    right = app_client.post("/api/auth/login", json={"email": "off@example.com", "password": "secret123"})
+    assert (wrong.status_code, wrong.json()["detail"]) == (400, "Invalid email or password")
+    assert (right.status_code, right.json()["detail"]) == (400, "Account is disabled")
+    assert stored_password(app_client, database, "off@example.com") == old_hash
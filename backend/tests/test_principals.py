@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from conftest import register
+
+
+def me(client, headers):
+    return client.get("/api/auth/me", headers=headers)
+
+
+def test_plan_change_and_deactivation_evict_the_cached_principal(app_client, database):
+    import server
+
+    admin = register(app_client, "admin@example.com", "admin", database)
+    member = register(app_client, "member@example.com")
+    member_id = me(app_client, member).json()["id"]
+    assert member_id in server.principal_cache._data
+
+    app_client.put(f"/api/admin/users/{member_id}/upgrade", params={"new_plan": "premium"}, headers=admin)
+    assert me(app_client, member).json()["user_type"] == "premium"
+
+    app_client.put(f"/api/admin/users/{member_id}/status", params={"is_active": False}, headers=admin)
+    assert me(app_client, member).status_code == 401
+
+
+def test_changes_made_through_another_worker_are_polled(app_client, database):
+    import server
+
+    member = register(app_client, "member@example.com")
+    member_id = me(app_client, member).json()["id"]
+    # Another worker's write: this worker's cache does not see it yet
+    app_client.portal.call(database.users.update_one, {"email": "member@example.com"},
+                           {"$set": {"user_type": "premium", "updated_at": datetime.utcnow()}})
+    assert me(app_client, member).json()["user_type"] == "basic"
+
+    polled_at = app_client.portal.call(server.evict_changed_principals, datetime.utcnow() - timedelta(seconds=5))
+    assert me(app_client, member).json()["user_type"] == "premium"
+    # The next window starts at this poll, so unchanged users stay cached
+    app_client.portal.call(server.evict_changed_principals, polled_at)
+    assert member_id in server.principal_cache._data
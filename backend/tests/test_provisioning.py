@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from conftest import register
+from provisioning import hash_passwords, iter_ndjson
+
+[HASHED] = hash_passwords(["hashed-pw"], rounds=4)
+
+
+def ndjson(*rows) -> bytes:
+    return b"\n".join(row if isinstance(row, bytes) else json.dumps(row).encode() for row in rows) + b"\n"
+
+
+def test_ndjson_lines_split_across_chunks():
+    async def chunks():
+        for chunk in (b'{"email": "a@exa', b'mple.com"}\n\n{"email"', b': "b@example.com"}\nnot json'):
+            yield chunk
+
+    async def scenario():
+        return [row async for row in iter_ndjson(chunks())]
+
+    rows = asyncio.run(scenario())
+    assert [(line, row) for line, row, _error in rows[:2]] == [
+        (1, {"email": "a@example.com"}), (3, {"email": "b@example.com"}),
+    ]
+    line, row, error = rows[2]
+    assert (line, row) == (4, None) and error.startswith("invalid JSON")
+
+
+def test_import_reports_bad_rows_without_aborting(app_client, database):
+    admin = register(app_client, "admin@example.com", "admin", database)
+    body = ndjson(
+        {"email": "ok@example.com", "password": "pw1", "full_name": "Ok"},
+        b"{not json",
+        {"email": "not-an-email", "password": "pw"},
+        {"email": 123, "password": "pw"},
+        {"email": {"a": 1}, "password": "pw"},
+        {"email": "plan@example.com", "password": "pw", "user_type": "gold"},
+        {"email": "off@example.com", "password": "pw", "is_active": "false"},
+        {"email": "flag@example.com", "password": "pw", "is_active": "maybe"},
+        {"email": "ok@example.com", "password": "pw2"},
+        {"email": "admin@example.com", "password": "pw"},
+        {"email": "nopass@example.com"},
+        {"email": "hashed@example.com", "password_hash": HASHED, "user_type": "premium"},
+        ["not", "an", "object"],
+        {"email": "short@example.com", "password_hash": "$2b$04$tooshort"},
+        {"email": "cost@example.com", "password_hash": "$2b$99$" + HASHED[7:], "password": "pw"},
+    )
+    response = app_client.post("/api/admin/users/import", content=body, headers=admin)
+    assert response.status_code == 200, response.text
+    report = response.json()
+
+    assert report["received"] == 15
+    assert report["inserted"] == 3
+    assert report["failed"] == 12
+    assert report["by_plan"] == {"basic": 2, "premium": 1}
+    errors = {error["line"]: (error["email"], error["error"]) for error in report["errors"]}
+    assert errors[2][1].startswith("invalid JSON")
+    assert errors[3] == ("not-an-email", "invalid email")
+    # Non-string emails are echoed back as JSON text
+    assert errors[4] == ("123", "invalid email")
+    assert errors[5] == ('{"a": 1}', "invalid email")
+    assert errors[6] == ("plan@example.com", "invalid user_type 'gold'")
+    assert errors[8] == ("flag@example.com", "invalid is_active 'maybe'")
+    assert errors[9] == ("ok@example.com", "duplicate email in import")
+    assert errors[10] == ("admin@example.com", "email already registered")
+    assert errors[11] == ("nopass@example.com", "password is required")
+    assert errors[13] == (None, "row must be a JSON object")
+    # A malformed hash is an error even when a plaintext password comes with it
+    assert errors[14] == ("short@example.com", "invalid password_hash")
+    assert errors[15] == ("cost@example.com", "invalid password_hash")
+
+    users = {user["email"]: user for user in app_client.portal.call(
+        lambda: database.users.find({}, {"_id": 0}).to_list(None))}
+    assert users["off@example.com"]["is_active"] is False
+    assert users["hashed@example.com"]["password"] == HASHED
+    assert users["ok@example.com"]["password"].startswith("$2")
+    login = app_client.post("/api/auth/login", json={"email": "hashed@example.com", "password": "hashed-pw"})
+    assert login.status_code == 200
+
+
+def test_import_requires_admin(app_client):
+    member = register(app_client, "member@example.com")
+    response = app_client.post("/api/admin/users/import", content=ndjson({"email": "x@example.com"}), headers=member)
+    assert response.status_code == 403
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from analysis import AnalysisService, FakeProvider
+from conftest import register
+from quota import QuotaExceeded, UsageQuota
+from repository import AnalysisRepository, UsageRepository
+
+KEY = AnalysisService.make_key("BTC", "1h", "technical")
+BASIC = {"id": "u1", "user_type": "basic"}
+
+
+def test_counter_stops_at_its_limit(database):
+    repo = UsageRepository(database)
+    expires_at = datetime.utcnow() + timedelta(days=1)
+
+    async def scenario():
+        return [await repo.increment("analysis:u1:0", 3, expires_at) for _ in range(5)]
+
+    assert asyncio.run(scenario()) == [1, 2, 3, None, None]
+
+
+def test_quota_is_per_user_and_per_plan(database):
+    quota = UsageQuota(UsageRepository(database), "analysis", {"basic": 2, "premium": 5, "admin": None})
+
+    async def scenario():
+        used = [await quota.consume(BASIC) for _ in range(2)]
+        with pytest.raises(QuotaExceeded) as exceeded:
+            await quota.consume(BASIC)
+        other = await quota.consume({"id": "u2", "user_type": "basic"})
+        admin = await quota.consume({"id": "u3", "user_type": "admin"})
+        return used, exceeded.value, other, admin
+
+    used, exceeded, other, admin = asyncio.run(scenario())
+    assert [usage["remaining"] for usage in used] == [1, 0]
+    assert exceeded.limit == 2 and 1 <= exceeded.retry_after <= 86401
+    assert other["remaining"] == 1
+    assert admin is None
+
+
+def test_quota_limits_from_env(monkeypatch, database):
+    monkeypatch.setenv("ANALYSIS_QUOTA_BASIC", "7")
+    monkeypatch.setenv("ANALYSIS_QUOTA_PREMIUM", "0")
+    monkeypatch.setenv("ANALYSIS_QUOTA_WINDOW", "3600")
+    quota = UsageQuota.from_env(UsageRepository(database), "analysis", {"basic": 20, "premium": 200, "admin": 0})
+    assert quota.limits == {"basic": 7, "premium": None, "admin": None}
+    assert quota.window == 3600
+
+
+def test_over_quota_analysis_is_refused(app_client, monkeypatch):
+    import server
+
+    monkeypatch.setitem(server.analysis_quota.limits, "basic", 1)
+    headers = register(app_client, "quota@example.com")
+    first = app_client.post("/api/analysis/gemini", json={"symbol": "BTC"}, headers=headers)
+    assert first.status_code == 200
+    assert (first.headers["X-Quota-Limit"], first.headers["X-Quota-Remaining"]) == ("1", "0")
+    # A cache hit is free
+    assert app_client.post("/api/analysis/gemini", json={"symbol": "BTC"}, headers=headers).status_code == 200
+
+    refused = app_client.post("/api/analysis/gemini", json={"symbol": "ETH"}, headers=headers)
+    assert refused.status_code == 429
+    assert int(refused.headers["Retry-After"]) >= 1
+    assert server.analysis_service.provider.calls == 1
+
+
+def test_stored_analysis_is_reused_only_for_the_same_context(database):
+    store = AnalysisRepository(database)
+    old_key = AnalysisService.make_content_key(KEY, "BTC price: $50000")
+    new_key = AnalysisService.make_content_key(KEY, "BTC price: $51000")
+    assert old_key != new_key
+
+    async def scenario():
+        await AnalysisService(FakeProvider(), ttl=60, store=store).analyze(KEY, "prompt", old_key)
+        # Fresh services stand in for other workers with empty memory caches
+        same = await AnalysisService(FakeProvider(), ttl=60, store=store).lookup(KEY, old_key)
+        moved = await AnalysisService(FakeProvider(), ttl=60, store=store).lookup(KEY, new_key)
+        return same, moved
+
+    same, moved = asyncio.run(scenario())
+    assert same is not None and same.cached
+    assert moved is None
+
+
+def test_expired_analysis_is_not_reused_but_stays_in_history(database):
+    store = AnalysisRepository(database)
+    content_key = AnalysisService.make_content_key(KEY, "BTC price: $50000")
+    generated_at = datetime.utcnow() - timedelta(minutes=10)
+
+    async def scenario():
+        await store.save({"key": content_key, "symbol": "BTC", "timeframe": "1h", "analysis_type": "technical",
+                          "text": "stale", "analyst": "fake", "generated_at": generated_at,
+                          "valid_until": generated_at + timedelta(minutes=5),
+                          "expires_at": generated_at + timedelta(days=7)})
+        reused = await AnalysisService(FakeProvider(), ttl=300, store=store).lookup(KEY, content_key)
+        return reused, await store.recent("BTC", 10)
+
+    reused, history = asyncio.run(scenario())
+    assert reused is None
+    assert [entry["text"] for entry in history] == ["stale"]
+
+
+def test_history_lists_newest_first(app_client):
+    headers = register(app_client, "history@example.com")
+    for timeframe in ("1h", "4h"):
+        app_client.post("/api/analysis/gemini", json={"symbol": "BTC", "timeframe": timeframe}, headers=headers)
+
+    response = app_client.get("/api/analysis/history", params={"symbol": "btc", "limit": 5}, headers=headers)
+    assert response.status_code == 200
+    assert [entry["timeframe"] for entry in response.json()] == ["4h", "1h"]
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import pytest
+
+from quotes import (
+    CircuitBreaker, CoinCapProvider, CoinGeckoProvider, OpenErApiProvider, ProviderError, QuoteAggregator,
+)
+from symbols import SymbolRegistry
+
+COINGECKO = {
+    "bitcoin": {"usd": 50000.0, "usd_24h_change": 1.5, "usd_market_cap": 9.8e11},
+    "ethereum": {"usd": 3000.0, "usd_24h_change": -0.5, "usd_market_cap": 3.6e11},
+}
+COINCAP = {"data": [
+    {"id": "bitcoin", "priceUsd": "50100.0", "changePercent24Hr": "1.4", "marketCapUsd": "980000000000"},
+    {"id": "ethereum", "priceUsd": "3010.0", "changePercent24Hr": "-0.6", "marketCapUsd": "360000000000"},
+]}
+
+
+def registry() -> SymbolRegistry:
+    symbols = SymbolRegistry()
+    symbols.register("BTC", "bitcoin")
+    symbols.register("ETH", "ethereum")
+    return symbols
+
+
+def crypto_aggregator(stub_server, **kwargs) -> QuoteAggregator:
+    providers = [CoinGeckoProvider(stub_server.url("/simple/price")), CoinCapProvider(stub_server.url("/v2/assets"))]
+    return QuoteAggregator(providers, **kwargs)
+
+
+def fetch(aggregator: QuoteAggregator, symbols: SymbolRegistry, times: int = 1):
+    """Run fetch `times` times on one loop; returns each result or exception"""
+    async def scenario():
+        outcomes = []
+        try:
+            for _ in range(times):
+                try:
+                    outcomes.append(await aggregator.fetch(symbols))
+                except ProviderError as e:
+                    outcomes.append(e)
+        finally:
+            await aggregator.close()
+        return outcomes
+
+    return asyncio.run(scenario())
+
+
+def test_primary_provider_answers_alone(stub_server):
+    stub_server.route("/simple/price", COINGECKO)
+    stub_server.route("/v2/assets", COINCAP)
+    [quotes] = fetch(crypto_aggregator(stub_server), registry())
+    assert quotes["BTC"].price == 50000.0
+    assert quotes["BTC"].sources == ("coingecko",)
+    assert stub_server.hits["/v2/assets"] == 0
+
+
+def test_failed_provider_fails_over_to_the_next(stub_server):
+    stub_server.route("/simple/price", {"error": "boom"}, status=500)
+    stub_server.route("/v2/assets", COINCAP)
+    [quotes] = fetch(crypto_aggregator(stub_server, hedge_delay=5.0), registry())
+    assert quotes["ETH"].price == 3010.0
+    assert quotes["ETH"].sources == ("coincap",)
+
+
+def test_slow_provider_is_hedged(stub_server):
+    stub_server.route("/simple/price", COINGECKO, delay=1.0)
+    stub_server.route("/v2/assets", COINCAP)
+    aggregator = crypto_aggregator(stub_server, hedge_delay=0.05, timeout=3.0)
+    started = time.monotonic()
+    [quotes] = fetch(aggregator, registry())
+    assert time.monotonic() - started < 0.8
+    assert quotes["BTC"].sources == ("coincap",)
+    # Losing the race is not a failure
+    assert aggregator.breakers["coingecko"].failures == 0
+    assert aggregator.status() == {"coingecko": "closed", "coincap": "closed"}
+
+
+def test_partial_answer_is_completed_and_merged(stub_server):
+    stub_server.route("/simple/price", {"bitcoin": {"usd": 50000.0}})
+    stub_server.route("/v2/assets", COINCAP)
+    [quotes] = fetch(crypto_aggregator(stub_server, hedge_delay=5.0), registry())
+    # BTC keeps the primary's price with the gaps filled in; ETH comes from the fallback alone
+    assert quotes["BTC"].price == 50000.0
+    assert quotes["BTC"].change_24h_pct == 1.4
+    assert quotes["BTC"].sources == ("coingecko", "coincap")
+    assert quotes["ETH"].sources == ("coincap",)
+
+
+def test_breaker_opens_and_skips_a_failing_provider(stub_server):
+    stub_server.route("/simple/price", {"error": "boom"}, status=500)
+    stub_server.route("/v2/assets", COINCAP)
+    aggregator = crypto_aggregator(stub_server, failure_threshold=2, reset_timeout=60)
+    outcomes = fetch(aggregator, registry(), times=4)
+    assert all(quotes["BTC"].sources == ("coincap",) for quotes in outcomes)
+    assert stub_server.hits["/simple/price"] == 2
+    assert aggregator.status()["coingecko"] == "open"
+
+
+def test_deadline_timeout_counts_as_failure(stub_server):
+    stub_server.route("/simple/price", COINGECKO, delay=1.0)
+    aggregator = QuoteAggregator([CoinGeckoProvider(stub_server.url("/simple/price"))],
+                                 timeout=0.1, failure_threshold=2, reset_timeout=60)
+    outcomes = fetch(aggregator, registry(), times=3)
+    assert all(isinstance(outcome, ProviderError) for outcome in outcomes)
+    assert "timed out" in str(outcomes[0])
+    assert aggregator.status()["coingecko"] == "open"
+    # The third round was refused by the open breaker without a request
+    assert stub_server.hits["/simple/price"] == 2
+
+
+def test_forex_rates_are_crossed_through_usd(stub_server):
+    stub_server.route("/v6/latest/USD", {"result": "success", "rates": {"EUR": 0.8, "GBP": 0.5, "JPY": 150.0}})
+    aggregator = QuoteAggregator([OpenErApiProvider(stub_server.url("/v6/latest"))])
+    symbols = SymbolRegistry()
+    for pair in ("EURUSD", "GBPUSD", "USDJPY", "EURGBP"):
+        symbols.register(pair, pair, "forex")
+    [quotes] = fetch(aggregator, symbols)
+    assert quotes["EURUSD"].price == pytest.approx(1.25)
+    assert quotes["USDJPY"].price == pytest.approx(150.0)
+    assert quotes["EURGBP"].price == pytest.approx(0.625)
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    # A failed probe re-opens straight away
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
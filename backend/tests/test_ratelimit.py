@@ -0,0 +1,115 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from ratelimit import InMemoryBucketBackend, RateLimitMiddleware, RateLimitRule
+
+
+async def ok(request):
+    return JSONResponse({"ok": True})
+
+
+async def slow(request):
+    await asyncio.sleep(0.2)
+    return JSONResponse({"ok": True})
+
+
+async def principal(scope):
+    """Callers identify themselves as "<user>:<plan>" in an X-User header"""
+    for name, value in scope["headers"]:
+        if name == b"x-user":
+            user, plan = value.decode().split(":")
+            return user, plan
+    return None
+
+
+def limited_app(rules, backend=None):
+    app = Starlette(routes=[Route("/login", ok, methods=["POST"]), Route("/analysis", ok, methods=["POST"]),
+                            Route("/slow", slow), Route("/open", ok)])
+    return RateLimitMiddleware(app, rules, backend=backend or InMemoryBucketBackend(), principal=principal)
+
+
+def send(app, requests):
+    """Send (method, path, headers) requests concurrently; returns the responses in order"""
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await asyncio.gather(*(client.request(method, path, headers=headers)
+                                          for method, path, headers in requests))
+    return asyncio.run(scenario())
+
+
+def test_anonymous_callers_are_limited_by_ip():
+    app = limited_app([RateLimitRule("login", ["POST"], ["/login"], rate=0.01, burst=3)])
+    responses = send(app, [("POST", "/login", {})] * 4 + [("GET", "/open", {})])
+    assert [r.status_code for r in responses] == [200, 200, 200, 429, 200]
+    assert int(responses[3].headers["retry-after"]) >= 1
+
+
+def test_user_buckets_scale_by_plan():
+    rule = RateLimitRule("analysis", ["POST"], ["/analysis"], rate=0.01, burst=2, per="user",
+                         plan_scale={"basic": 1, "premium": 2, "admin": None})
+    app = limited_app([rule])
+
+    def statuses(user):
+        return [r.status_code for r in send(app, [("POST", "/analysis", {"X-User": user})] * 6)]
+
+    assert statuses("a:basic").count(200) == 2
+    assert statuses("b:premium").count(200) == 4
+    assert statuses("c:admin").count(200) == 6
+    # Buckets are per user, not per plan
+    assert statuses("d:basic").count(200) == 2
+
+
+def test_saturated_route_sheds_load_with_503():
+    rule = RateLimitRule("slow", ["GET"], ["/slow"], rate=100, burst=100, max_concurrent=1, max_waiting=1,
+                         wait_timeout=5.0)
+    responses = send(limited_app([rule]), [("GET", "/slow", {})] * 3)
+    assert sorted(r.status_code for r in responses) == [200, 200, 503]
+    assert all("retry-after" in r.headers for r in responses if r.status_code == 503)
+
+
+def test_broken_backend_fails_open():
+    class Broken:
+        async def take(self, key, rate, burst, cost=1.0):
+            raise ConnectionError("limiter store down")
+
+    app = limited_app([RateLimitRule("login", ["POST"], ["/login"], rate=0.01, burst=1)], backend=Broken())
+    assert [r.status_code for r in send(app, [("POST", "/login", {})] * 3)] == [200, 200, 200]
+
+
+def test_in_memory_bucket_reports_refill_time():
+    backend = InMemoryBucketBackend(max_keys=2)
+
+    async def scenario():
+        allowed = await backend.take("a", rate=10, burst=1)
+        wait = await backend.take("a", rate=10, burst=1)
+        for key in ("b", "c"):
+            await backend.take(key, rate=10, burst=1)
+        return allowed, wait
+
+    allowed, wait = asyncio.run(scenario())
+    assert allowed == 0.0
+    assert 0.0 < wait <= 0.1
+    # The least recently used bucket was evicted
+    assert list(backend._buckets) == ["b", "c"]
+
+
+def test_excluded_paths_are_never_limited():
+    rule = RateLimitRule("api", ["GET"], ["/api/"], rate=1, burst=1, exclude=["/api/health", "/api/internal/"])
+    assert rule.matches("GET", "/api/users")
+    assert not rule.matches("GET", "/api/health")
+    assert rule.matches("GET", "/api/healthz")
+    assert not rule.matches("GET", "/api/internal/jobs")
+
+
+def test_probes_and_metrics_skip_the_catch_all_rule():
+    import server
+
+    def rule_for(path):
+        return next((rule.name for rule in server.RATE_LIMIT_RULES if rule.matches("GET", path)), None)
+
+    assert [rule_for(path) for path in ("/api/health", "/api/health/ready", "/api/metrics")] == [None] * 3
+    assert rule_for("/api/market/crypto-prices") == "api"
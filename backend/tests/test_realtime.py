@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import time
+
+from market_data import MarketSnapshot
+from quotes import Quote
+from realtime import MarketHub
+from symbols import SymbolRegistry
+
+
+class FakeSocket:
+    """Records what was sent; a cleared gate holds every send, as a client that stopped reading would"""
+
+    def __init__(self, fail: bool = False):
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.fail = fail
+
+    async def send_text(self, text: str):
+        if self.fail:
+            raise ConnectionResetError("peer went away")
+        await self.gate.wait()
+        self.sent.append(json.loads(text))
+
+
+def hub() -> MarketHub:
+    registry = SymbolRegistry()
+    registry.register("BTC", "bitcoin")
+    registry.register("ETH", "ethereum")
+    return MarketHub(registry)
+
+
+def snapshot(market: MarketHub, **prices) -> MarketSnapshot:
+    quotes = {symbol: Quote(symbol, "crypto", price) for symbol, price in prices.items()}
+    return MarketSnapshot(quotes, time.time(), 1, market.registry)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_prices_fan_out_to_subscribers_of_the_symbol():
+    async def scenario():
+        market = hub()
+        sockets = [FakeSocket() for _ in range(3)]
+        subscribers = [market.connect(socket, f"user-{n}") for n, socket in enumerate(sockets)]
+        senders = [market.start_sender(subscriber) for subscriber in subscribers]
+        market.subscribe(subscribers[0], ["btc"])
+        market.subscribe(subscribers[1], ["BTC", "ETH"])
+        market.subscribe(subscribers[2], ["ETH"])
+
+        market.on_snapshot(snapshot(market, BTC=50000.0, ETH=3000.0))
+        await settle()
+        # Unchanged quotes are not republished
+        market.on_snapshot(snapshot(market, BTC=50000.0, ETH=3100.0))
+        await settle()
+        for sender in senders:
+            sender.cancel()
+        return [[sorted(message["data"]) for message in socket.sent] for socket in sockets]
+
+    sent = asyncio.run(scenario())
+    assert sent[0] == [["BTC"]]
+    assert sent[1] == [["BTC", "ETH"], ["ETH"]]
+    assert sent[2] == [["ETH"], ["ETH"]]
+
+
+def test_late_subscriber_gets_the_current_quote():
+    async def scenario():
+        market = hub()
+        market.on_snapshot(snapshot(market, BTC=50000.0))
+        socket = FakeSocket()
+        subscriber = market.connect(socket, "user-1")
+        sender = market.start_sender(subscriber)
+        market.subscribe(subscriber, ["BTC"])
+        await settle()
+        sender.cancel()
+        return socket.sent
+
+    [message] = asyncio.run(scenario())
+    assert message["data"]["BTC"]["price"] == 50000.0
+    assert message["data"]["BTC"]["id"] == "bitcoin"
+
+
+def test_slow_subscriber_gets_latest_prices_and_a_drop_count():
+    async def scenario():
+        market = hub()
+        market.max_events = 3
+        slow = FakeSocket()
+        slow.gate.clear()
+        subscriber = market.connect(slow, "user-1")
+        market.subscribe(subscriber, ["BTC"])
+        sender = market.start_sender(subscriber)
+
+        market.on_bot_event({"user_id": "user-1", "type": "trade", "n": 0})
+        await settle()
+        # Stuck sending event 0: prices coalesce, events beyond the mailbox drop oldest first
+        for n in range(1, 6):
+            market.on_snapshot(snapshot(market, BTC=50000.0 + n))
+            market.on_bot_event({"user_id": "user-1", "type": "trade", "n": n})
+        slow.gate.set()
+        await settle()
+        sender.cancel()
+        return slow.sent
+
+    sent = asyncio.run(scenario())
+    events = [message["event"] for message in sent if message["type"] == "bot"]
+    assert [event["n"] for event in events] == [0, 3, 4, 5]
+    assert events[1]["dropped_before"] == 2 and "dropped_before" not in events[2]
+    [prices] = [message for message in sent if message["type"] == "prices"]
+    assert prices["data"]["BTC"]["price"] == 50005.0
+
+
+def test_failed_sender_is_logged_and_unregistered(caplog):
+    async def scenario():
+        market = hub()
+        subscriber = market.connect(FakeSocket(fail=True), "user-1")
+        market.subscribe(subscriber, ["BTC"])
+        sender = market.start_sender(subscriber)
+        market.on_bot_event({"user_id": "user-1", "type": "trade"})
+        await settle()
+        return market, sender
+
+    with caplog.at_level(logging.WARNING, logger="realtime"):
+        market, sender = asyncio.run(scenario())
+    assert sender.done() and isinstance(sender.exception(), ConnectionResetError)
+    assert market.connection_count() == 0
+    assert not market._by_symbol and not market._by_user
+    assert "peer went away" in caplog.text
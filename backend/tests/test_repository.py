@@ -0,0 +1,210 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from conftest import register
+from repository import INDEXES, BotRepository, UserRepository, ensure_indexes, find_collection_scans, pool_options
+
+EPOCH = datetime(2024, 1, 1)
+
+
+def user(n: int, created_at: datetime) -> dict:
+    return {"id": f"user-{n:03d}", "email": f"user{n}@example.com", "full_name": "User",
+            "user_type": "premium" if n % 3 == 0 else "basic", "is_active": True, "created_at": created_at}
+
+
+def test_ensure_indexes_creates_every_index(database):
+    async def scenario():
+        await ensure_indexes(database)
+        # Running it again is a no-op
+        await ensure_indexes(database)
+        return {collection: await database[collection].index_information() for collection, _keys, _options in INDEXES}
+
+    existing = asyncio.run(scenario())
+    for collection, keys, options in INDEXES:
+        index = existing[collection][options["name"]]
+        assert index["key"] == keys
+        assert index.get("unique", False) == options.get("unique", False)
+
+
+def test_unique_email_index_rejects_duplicates(database):
+    repo = UserRepository(database)
+
+    async def scenario():
+        await ensure_indexes(database)
+        await repo.create(user(1, EPOCH))
+        await repo.create(dict(user(2, EPOCH), email="user1@example.com"))
+
+    with pytest.raises(DuplicateKeyError):
+        asyncio.run(scenario())
+
+
+class ExplainOnly:
+    """Answers explain with a canned winning plan per collection"""
+
+    def __init__(self, plans: dict):
+        self.plans = plans
+
+    async def command(self, name, spec, verbosity=None):
+        return {"queryPlanner": {"winningPlan": self.plans[spec["find"]]}}
+
+
+def test_collection_scans_are_reported():
+    index_scan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    collection_scan = {"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}
+    plans = {"users": index_scan, "admin_settings": index_scan, "bots": index_scan,
+             "analyses": index_scan, "jobs": index_scan, "price_alerts": collection_scan}
+
+    offenders = asyncio.run(find_collection_scans(ExplainOnly(plans)))
+    assert offenders and all(offender.startswith("price_alerts ") for offender in offenders)
+
+
+def test_keyset_pages_cover_every_user_once(database):
+    repo = UserRepository(database)
+    # Ties on created_at are broken by id
+    users = [user(n, EPOCH + timedelta(seconds=n // 4)) for n in range(25)]
+
+    async def scenario():
+        await database.users.insert_many([dict(u) for u in users])
+        pages, after = [], None
+        while True:
+            page = await repo.list_page({}, {"_id": 0, "id": 1, "created_at": 1}, 10, after)
+            pages.append(page)
+            if len(page) < 10:
+                return pages
+            after = page[-1]["created_at"], page[-1]["id"]
+
+    pages = asyncio.run(scenario())
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [u["id"] for page in pages for u in page] == [u["id"] for u in users]
+
+
+def test_keyset_pages_apply_filters(database):
+    repo = UserRepository(database)
+
+    async def scenario():
+        await database.users.insert_many([user(n, EPOCH + timedelta(seconds=n)) for n in range(12)])
+        query = repo.build_filter(user_type="premium")
+        first = await repo.list_page(query, {"_id": 0, "id": 1, "created_at": 1}, 2)
+        rest = await repo.list_page(query, {"_id": 0, "id": 1, "created_at": 1}, 10,
+                                    (first[-1]["created_at"], first[-1]["id"]))
+        return first + rest
+
+    assert [u["id"] for u in asyncio.run(scenario())] == ["user-000", "user-003", "user-006", "user-009"]
+
+
+def test_admin_users_endpoint_pages_with_cursor(app_client, database):
+    admin = register(app_client, "admin@example.com", "admin", database)
+    for n in range(4):
+        register(app_client, f"member{n}@example.com")
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = app_client.get("/api/admin/users", params=params, headers=admin)
+        assert response.status_code == 200
+        seen.extend(u["email"] for u in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(["admin@example.com"] + [f"member{n}@example.com" for n in range(4)])
+
+    response = app_client.get("/api/admin/users", params={"cursor": "not-a-cursor"}, headers=admin)
+    assert response.status_code == 400
+
+
+def test_user_repository_round_trip(database):
+    repo = UserRepository(database)
+
+    async def scenario():
+        await repo.create(dict(user(1, EPOCH), password="hash"))
+        found = await repo.find_by_email("user1@example.com", {"_id": 0, "id": 1, "user_type": 1})
+        updated = await repo.update_fields("user-001", {"user_type": "premium"})
+        missing = await repo.update_fields("nobody", {"user_type": "premium"})
+        return found, updated, missing, await repo.find_by_id("user-001", {"_id": 0}), await repo.count_by_plan()
+
+    found, updated, missing, stored, by_plan = asyncio.run(scenario())
+    # Projections return only the requested fields
+    assert found == {"id": "user-001", "user_type": "basic"}
+    assert updated and not missing
+    assert stored["user_type"] == "premium" and stored["password"] == "hash"
+    assert by_plan == {"premium": 1}
+
+
+def test_insert_many_reports_rejected_users(database):
+    repo = UserRepository(database)
+
+    async def scenario():
+        await ensure_indexes(database)
+        await repo.create(user(1, EPOCH))
+        failures = await repo.insert_many([user(2, EPOCH), dict(user(3, EPOCH), email="user1@example.com"),
+                                           user(4, EPOCH)])
+        return failures, await repo.count({})
+
+    failures, total = asyncio.run(scenario())
+    assert failures == [(1, "email already registered")]
+    # Unordered: the users after the duplicate were still written
+    assert total == 3
+
+
+def test_bot_repository_tracks_active_bots(database):
+    repo = BotRepository(database)
+
+    async def scenario():
+        await repo.save_config("u1", {"strategy": "balanced"})
+        await repo.save_config("u2", {"strategy": "aggressive"})
+        await repo.set_active("u2", True)
+        # Saving a config again keeps the run state
+        await repo.save_config("u2", {"strategy": "conservative"})
+        return [bot async for bot in repo.iter_active()], await repo.get("u1")
+
+    active, idle = asyncio.run(scenario())
+    assert [(bot["user_id"], bot["config"]) for bot in active] == [("u2", {"strategy": "conservative"})]
+    assert idle["active"] is False
+
+
+def test_pool_options_read_the_environment(monkeypatch):
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "25")
+    monkeypatch.delenv("MONGO_MIN_POOL_SIZE", raising=False)
+    options = pool_options()
+    assert options["maxPoolSize"] == 25
+    assert options["minPoolSize"] == 10
+
+
+def test_admin_users_endpoint_filters_and_projects(app_client, database):
+    admin = register(app_client, "admin@example.com", "admin", database)
+    register(app_client, "alice@example.com", "premium", database)
+    register(app_client, "albert@example.com")
+    register(app_client, "bob@example.com", "premium", database)
+    app_client.portal.call(database.users.update_one, {"email": "bob@example.com"}, {"$set": {"is_active": False}})
+
+    def emails(**params):
+        response = app_client.get("/api/admin/users", params=params, headers=admin)
+        assert response.status_code == 200
+        return sorted(u["email"] for u in response.json())
+
+    assert emails(user_type="premium") == ["alice@example.com", "bob@example.com"]
+    assert emails(user_type="premium", is_active=True) == ["alice@example.com"]
+    assert emails(email_prefix="al") == ["albert@example.com", "alice@example.com"]
+    # Regex metacharacters in the prefix are literal
+    assert emails(email_prefix=".*") == []
+
+    [row] = app_client.get("/api/admin/users", params={"email_prefix": "bob"}, headers=admin).json()
+    assert set(row) == {"id", "email", "full_name", "user_type", "is_active", "created_at"}
+
+
+def test_admin_users_ndjson_export_streams_the_filtered_set(app_client, database):
+    admin = register(app_client, "admin@example.com", "admin", database)
+    for n in range(3):
+        register(app_client, f"member{n}@example.com")
+
+    response = app_client.get("/api/admin/users", params={"format": "ndjson", "user_type": "basic", "limit": 1},
+                              headers=admin)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    # The export ignores paging and returns every match, without password hashes
+    assert [row["email"] for row in rows] == [f"member{n}@example.com" for n in range(3)]
+    assert all("password" not in row for row in rows)
@@ -0,0 +1,62 @@
+from datetime import datetime
+from decimal import Decimal
+from types import MappingProxyType
+
+import numpy as np
+import orjson
+import pytest
+from bson import Decimal128, ObjectId
+
+from candles import Candle
+from conftest import register
+from responses import dumps
+
+
+def test_documents_with_bson_and_numpy_values_encode():
+    oid = ObjectId("65a1b2c3d4e5f60718293a4b")
+    document = {
+        "_id": oid,
+        "price": Decimal128("101.25"),
+        "fee": Decimal("0.5"),
+        "settings": MappingProxyType({"keys": MappingProxyType({"exchange": "k"})}),
+        "tags": frozenset(["a"]),
+        "closes": np.array([1.5, 2.5]),
+        "count": np.int64(3),
+        "at": datetime(2024, 1, 2, 3, 4, 5),
+        1: "non-string key",
+    }
+    assert orjson.loads(dumps(document)) == {
+        "_id": str(oid), "price": 101.25, "fee": 0.5, "settings": {"keys": {"exchange": "k"}}, "tags": ["a"],
+        "closes": [1.5, 2.5], "count": 3, "at": "2024-01-02T03:04:05", "1": "non-string key",
+    }
+
+
+def test_unknown_types_still_fail_loudly():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+
+def test_response_models_drop_private_fields(app_client, database):
+    headers = register(app_client, "private@example.com")
+    profile = app_client.get("/api/auth/me", headers=headers).json()
+    assert profile["email"] == "private@example.com"
+    assert "password" not in profile and "_id" not in profile
+
+    admin = register(app_client, "admin@example.com", "admin", database)
+    users = app_client.get("/api/admin/users", headers=admin).json()
+    assert users and all("password" not in user and "_id" not in user for user in users)
+
+
+def test_candle_columns_are_served_from_arrays(app_client):
+    import server
+
+    start = 86400 * 20000
+    for n in range(3):
+        server.candle_store.append("ETH", "1d", Candle(start + n * 86400, 10.0 + n, 11.0 + n, 9.0 + n, 10.5 + n, 100.0))
+
+    response = app_client.get("/api/market/candles", params={"symbol": "eth", "timeframe": "1d", "limit": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["symbol"], body["timeframe"]) == ("ETH", "1d")
+    assert body["time"] == [start + 86400, start + 2 * 86400]
+    assert body["close"] == [11.5, 12.5] and body["volume"] == [100.0, 100.0]
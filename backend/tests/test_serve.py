@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+from admin_jobs import AdminJobManager
+from repository import JobRepository
+from serve import PrimaryLock, worker_environment
+
+
+class BlockingUsers:
+    """Users repository whose writes wait for a go-ahead, so a job can be observed mid-run"""
+
+    def __init__(self):
+        self.proceed = asyncio.Event()
+
+    async def update_many_by_ids(self, user_ids, fields, unless=None):
+        await self.proceed.wait()
+        return len(user_ids)
+
+
+def workers(database, users):
+    """Two managers on one jobs collection, standing in for two worker processes"""
+    return [AdminJobManager(users, JobRepository(database), on_users_changed=lambda ids: None, chunk_size=2)
+            for _ in range(2)]
+
+
+def test_job_state_is_visible_from_another_worker(database):
+    async def scenario():
+        users = BlockingUsers()
+        owner, peer = workers(database, users)
+        job = await owner.change_plans("admin-1", "premium", user_ids=["a", "b", "c"])
+        await asyncio.sleep(0.01)
+        running = await peer.get(job.id)
+        users.proceed.set()
+        while (await peer.get(job.id))["status"] == "running":
+            await asyncio.sleep(0.01)
+        return running, await peer.get(job.id)
+
+    running, finished = asyncio.run(scenario())
+    assert running["status"] == "running" and running["total"] == 3
+    assert finished["status"] == "completed"
+    assert (finished["processed"], finished["modified"], finished["progress"]) == (3, 3, 1.0)
+    assert finished["owner_id"] == "admin-1"
+
+
+def test_shutdown_records_interrupted_jobs(database):
+    async def scenario():
+        owner, peer = workers(database, BlockingUsers())
+        job = await owner.change_plans("admin-1", "premium", user_ids=["a", "b", "c"])
+        await asyncio.sleep(0.01)
+        await owner.shutdown()
+        return await peer.get(job.id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "cancelled"
+    assert job["error"] == "interrupted by a worker shutdown"
+    assert job["finished_at"] is not None
+
+
+def test_backtest_jobs_are_not_served_as_admin_jobs(database):
+    async def scenario():
+        jobs = JobRepository(database)
+        await jobs.create({"job_id": "bt-1", "kind": "backtest", "owner_id": "u1", "status": "running"})
+        admin, _ = workers(database, BlockingUsers())
+        return await admin.get("bt-1"), await jobs.count_active("u1", "backtest")
+
+    assert asyncio.run(scenario()) == (None, 1)
+
+
+def test_pool_budget_is_split_across_workers(monkeypatch):
+    monkeypatch.setenv("MONGO_POOL_BUDGET", "100")
+    monkeypatch.setenv("MONGO_MIN_POOL_SIZE", "10")
+    assert worker_environment(4) == {
+        "WEB_CONCURRENCY": "4", "MONGO_MAX_POOL_SIZE": "25", "MONGO_MIN_POOL_SIZE": "10",
+    }
+    assert worker_environment(20)["MONGO_MIN_POOL_SIZE"] == "5"
+    monkeypatch.delenv("MONGO_POOL_BUDGET")
+    assert worker_environment(2) == {"WEB_CONCURRENCY": "2"}
+
+
+def test_primary_lock_has_one_holder(tmp_path):
+    path = os.path.join(tmp_path, "primary.lock")
+    first, second = PrimaryLock(path), PrimaryLock(path)
+    assert first.acquire() and first.held
+    assert not second.acquire() and not second.held
+    first.release()
+    assert second.acquire()
+    second.release()
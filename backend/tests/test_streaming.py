@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+from analysis import AnalysisService, FakeProvider
+from conftest import register
+
+
+class FailingProvider(FakeProvider):
+    """Streams one chunk, then fails"""
+
+    async def stream(self, prompt):
+        self.calls += 1
+        yield "partial "
+        raise RuntimeError("upstream reset")
+
+
+class TrackingProvider(FakeProvider):
+    """Records whether its stream was closed before finishing"""
+
+    closed = False
+
+    async def stream(self, prompt):
+        try:
+            async for chunk in super().stream(prompt):
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def read_events(response) -> list:
+    """(event name, data) for each SSE event in the body"""
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+def test_stream_sends_deltas_then_done(app_client):
+    import server
+
+    headers = register(app_client, "stream@example.com")
+    response = app_client.post("/api/analysis/gemini/stream", json={"symbol": "BTC"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = read_events(response)
+    deltas = [data["delta"] for name, data in events if name == "message"]
+    assert len(deltas) > 1
+    name, done = events[-1]
+    assert name == "done"
+    assert done["symbol"] == "BTC" and done["cached"] is False
+    # A completed stream is cached for the next caller
+    key = server.analysis_service.make_key("BTC", "1d", "technical")
+    assert server.analysis_service.get_cached(key).text == "".join(deltas)
+
+
+def test_cached_analysis_streams_as_one_delta(app_client):
+    import server
+
+    headers = register(app_client, "stream@example.com")
+    first = app_client.post("/api/analysis/gemini", json={"symbol": "ETH"}, headers=headers).json()
+    response = app_client.post("/api/analysis/gemini/stream", json={"symbol": "ETH"}, headers=headers)
+
+    events = read_events(response)
+    assert events[0] == ("message", {"delta": first["analysis"]})
+    assert events[-1][0] == "done" and events[-1][1]["cached"] is True
+    assert server.analysis_service.provider.calls == 1
+
+
+def test_provider_failure_ends_stream_with_error_event(app_client, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server.analysis_service, "provider", FailingProvider())
+    headers = register(app_client, "stream@example.com")
+    response = app_client.post("/api/analysis/gemini/stream", json={"symbol": "BTC"}, headers=headers)
+
+    events = read_events(response)
+    assert events[0] == ("message", {"delta": "partial "})
+    assert events[-1][0] == "error"
+    assert "upstream reset" in events[-1][1]["detail"]
+    assert server.analysis_service.get_cached(server.analysis_service.make_key("BTC", "1d", "technical")) is None
+
+
+def test_closing_the_stream_closes_the_provider():
+    provider = TrackingProvider(delay=0.01)
+    service = AnalysisService(provider, ttl=60)
+
+    async def scenario():
+        chunks = service.stream(service.make_key("BTC", "1h", "technical"), "a long prompt to stream")
+        await chunks.__anext__()
+        await chunks.aclose()
+
+    asyncio.run(scenario())
+    assert provider.closed
+
+
+def test_failed_preparation_is_a_json_error_like_the_plain_route(app_client, monkeypatch):
+    import server
+
+    async def store_down(key, content_key):
+        raise RuntimeError("store unavailable")
+
+    monkeypatch.setattr(server.analysis_service, "lookup", store_down)
+    headers = register(app_client, "stream@example.com")
+    plain = app_client.post("/api/analysis/gemini", json={"symbol": "BTC"}, headers=headers)
+    streamed = app_client.post("/api/analysis/gemini/stream", json={"symbol": "BTC"}, headers=headers)
+
+    assert streamed.status_code == plain.status_code == 500
+    assert streamed.json() == plain.json() == {"detail": "Analysis failed: store unavailable"}
+    assert "X-Quota-Remaining" not in streamed.headers
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for the MK7 Trading Bot API
+
+Drives the backend_test.py scenarios (register, login, me, crypto prices,
+Gemini analysis, admin users/settings) concurrently from an asyncio client.
+By default it starts its own server on a local MongoDB. A stub market feed
+stands in for CoinGecko, and the fake analysis provider stands in for
+Gemini. Per-endpoint p50/p95/p99 latency, throughput and error rate are
+written as JSON. Pass --baseline to compare against an earlier run.
+
+    python backend_benchmark.py --duration 30 --rps 200 --concurrency 64 --output run.json
+    python backend_benchmark.py --target http://localhost:8001 --scenarios me:5,crypto_prices:5,login:1
+    python backend_benchmark.py --startup 5 --workers 4      # import time and time to first request
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from pymongo import MongoClient
+
+from backend_test import ANALYSIS_REQUEST, API_PREFIX, DEMO_USERS, ENDPOINTS
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+ANALYSIS_SYMBOLS = ["BTC", "ETH", "SOL", "EURUSD", "GBPUSD"]
+ANALYSIS_TIMEFRAMES = ["1h", "4h", "1d"]
+
+
+def register_body(_):
+    return {"email": f"bench-{uuid.uuid4().hex[:12]}@mk7.com", "password": "benchpass123", "full_name": "Bench User"}
+
+
+def login_body(_):
+    email, password, _name = DEMO_USERS["basic"]
+    return {"email": email, "password": password}
+
+
+def analysis_body(rng):
+    return dict(ANALYSIS_REQUEST, symbol=rng.choice(ANALYSIS_SYMBOLS), timeframe=rng.choice(ANALYSIS_TIMEFRAMES))
+
+
+def scenario(name, plan=None, body=None, query=""):
+    """A backend_test.py endpoint as a benchmark scenario"""
+    method, path = ENDPOINTS[name]
+    return method, f"{API_PREFIX}{path}{query}", plan, body
+
+
+# name -> (method, path, auth plan or None, body factory or None)
+SCENARIOS = {
+    "health": scenario("health"),
+    "register": scenario("register", body=register_body),
+    "login": scenario("login", body=login_body),
+    "me": scenario("me", "basic"),
+    "crypto_prices": scenario("crypto_prices"),
+    "gemini_analysis": scenario("gemini_analysis", "premium", analysis_body),
+    "admin_users": scenario("admin_users", "admin", query="?limit=50"),
+    "admin_settings": scenario("admin_settings", "admin"),
+    # Large payloads: a full admin page and a long candle series
+    "admin_users_page": scenario("admin_users", "admin", query="?limit=1000"),
+    "candles": ("GET", "/api/market/candles?symbol=BTC&timeframe=1m&limit=10000", None, None),
+}
+
+DEFAULT_MIX = "login:1,me:4,crypto_prices:4,gemini_analysis:1,admin_users:1,admin_settings:1"
+
+
+class StubMarketFeed:
+    """Quote provider stand-ins on a background thread, with a random walk per coin and pair
+
+    Serves CoinGecko /simple/price, CoinCap /v2/assets, Frankfurter /latest
+    and open.er-api /v6/latest/USD so no benchmark traffic leaves the host.
+    """
+
+    PROVIDER_VARS = ("MARKET_FEED_URL", "MARKET_FALLBACK_FEED_URL", "FOREX_FEED_URL", "FOREX_FALLBACK_FEED_URL")
+
+    def __init__(self, port: int, latency: float = 0.0):
+        self.port = port
+        self.latency = latency
+        self.prices = {}
+        feed = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if feed.latency:
+                    time.sleep(feed.latency)
+                path, _, query = self.path.partition("?")
+                query = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+                body = json.dumps(feed.respond(path, {k: v.replace("%2C", ",") for k, v in query.items()})).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+    def walk(self, key: str, start: float) -> float:
+        price = self.prices.get(key, start) * (1 + random.gauss(0, 0.001))
+        self.prices[key] = price
+        return price
+
+    def quote(self, coin: str) -> dict:
+        price = self.walk(coin, 100.0)
+        return {"usd": round(price, 4), "usd_24h_change": random.uniform(-5, 5), "usd_market_cap": price * 1e7}
+
+    def rate(self, currency: str) -> float:
+        return round(self.walk(currency, 1.0), 6)
+
+    def respond(self, path: str, query: dict):
+        ids = [item for item in query.get("ids", "").split(",") if item]
+        if path.endswith("/v2/assets"):
+            assets = []
+            for coin in ids:
+                quote = self.quote(coin)
+                assets.append({"id": coin, "priceUsd": str(quote["usd"]),
+                               "changePercent24Hr": str(quote["usd_24h_change"]),
+                               "marketCapUsd": str(quote["usd_market_cap"])})
+            return {"data": assets}
+        if path.endswith("/latest"):
+            targets = [item for item in query.get("to", "").split(",") if item]
+            return {"base": query.get("from", "EUR"), "rates": {currency: self.rate(currency) for currency in targets}}
+        if path.endswith("/latest/USD"):
+            return {"result": "success", "rates": {currency: self.rate(currency) for currency in ("EUR", "GBP", "JPY")}}
+        return {coin: self.quote(coin) for coin in ids}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v3/simple/price"
+
+    def provider_env(self) -> dict:
+        base = f"http://127.0.0.1:{self.port}"
+        urls = (self.url, f"{base}/v2/assets", f"{base}/latest", f"{base}/v6/latest")
+        return dict(zip(self.PROVIDER_VARS, urls))
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, elapsed: float) -> dict:
+    """samples: [(latency_s, service_s, status or None)]"""
+    latencies = sorted(s[0] * 1000 for s in samples)
+    service = sorted(s[1] * 1000 for s in samples)
+    errors = sum(1 for s in samples if s[2] is None or s[2] >= 400)
+    statuses = {}
+    for _latency, _service, code in samples:
+        key = str(code) if code is not None else "error"
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        # From the scheduled send time, so client-side queueing is not hidden
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        },
+        # From the actual send time: what the server itself took
+        "service_ms": {
+            "p50": round(percentile(service, 50), 2),
+            "p95": round(percentile(service, 95), 2),
+            "p99": round(percentile(service, 99), 2),
+        },
+        "status_codes": statuses,
+    }
+
+
+class MK7Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.target or f"http://127.0.0.1:{args.port}"
+        self.tokens = {}
+        self.mix = self.parse_mix(args.scenarios)
+        self.rng = random.Random(args.seed)
+        self.samples = {name: [] for name, _weight in self.mix}
+        self.server = None
+        self.feed = None
+
+    @staticmethod
+    def parse_mix(spec: str):
+        mix = []
+        for part in spec.split(","):
+            name, _, weight = part.strip().partition(":")
+            if name not in SCENARIOS:
+                raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+            mix.append((name, float(weight or 1)))
+        return mix
+
+    # Environment ------------------------------------------------------------
+
+    def start_stack(self):
+        """Stub feed + a server configured for benchmarking"""
+        self.start_feed()
+        self.launch_server()
+
+    def start_feed(self):
+        try:
+            MongoClient(self.args.mongo_url, serverSelectionTimeoutMS=2000).admin.command("ping")
+        except Exception as e:
+            raise SystemExit(f"MongoDB not reachable at {self.args.mongo_url}: {e}")
+        self.feed = StubMarketFeed(self.args.feed_port, self.args.feed_latency)
+        self.feed.start()
+
+    def launch_server(self):
+        self.server = subprocess.Popen(
+            [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(self.args.port),
+             "--workers", str(self.args.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.server_env(),
+        )
+
+    def server_env(self) -> dict:
+        env = dict(
+            os.environ,
+            MONGO_URL=self.args.mongo_url,
+            JWT_SECRET_KEY=os.getenv("JWT_SECRET_KEY", "benchmark-secret"),
+            ANALYSIS_PROVIDER="fake",
+            FAKE_ANALYSIS_DELAY=str(self.args.llm_delay),
+            ANALYSIS_QUOTA_BASIC="0",
+            ANALYSIS_QUOTA_PREMIUM="0",
+            RATE_LIMIT_ENABLED="true" if self.args.rate_limit else "false",
+            BCRYPT_ROUNDS=str(self.args.bcrypt_rounds),
+        )
+        if self.feed is not None:
+            env.update(self.feed.provider_env())
+        else:
+            # Nothing listens on the discard port: every provider fails fast
+            env.update(dict.fromkeys(StubMarketFeed.PROVIDER_VARS, "http://127.0.0.1:9/"))
+        if self.args.no_analysis_cache:
+            env["ANALYSIS_CACHE_TTL"] = "0"
+        return env
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait(timeout=30)
+            self.server = None
+
+    def stop_stack(self):
+        self.stop_server()
+        if self.feed is not None:
+            self.feed.stop()
+
+    # Startup ----------------------------------------------------------------
+
+    def measure_import(self) -> float:
+        """Seconds to import server:app in a fresh interpreter"""
+        code = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+        output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=self.server_env(),
+                                capture_output=True, text=True, check=True).stdout
+        return float(output.strip().splitlines()[-1])
+
+    def measure_boot(self) -> dict:
+        """Seconds from spawning serve.py to the first /api/health 200, and to /api/health/ready 200"""
+        started = time.monotonic()
+        self.launch_server()
+        result = {"live_s": None, "ready_s": None}
+        try:
+            with httpx.Client(base_url=self.base_url, timeout=2.0) as client:
+                for path, key in (("/api/health", "live_s"), ("/api/health/ready", "ready_s")):
+                    while result[key] is None and time.monotonic() - started < 60:
+                        try:
+                            if client.get(path).status_code == 200:
+                                result[key] = round(time.monotonic() - started, 3)
+                                break
+                        except httpx.TransportError:
+                            pass
+                        time.sleep(0.01)
+        finally:
+            self.stop_server()
+        return result
+
+    def run_startup(self, runs: int) -> dict:
+        imports = [self.measure_import() for _ in range(runs)]
+        self.start_feed()
+        try:
+            boots = [self.measure_boot() for _ in range(runs)]
+        finally:
+            self.stop_stack()
+
+        def stats(values):
+            values = sorted(v for v in values if v is not None)
+            if not values:
+                return None
+            return {"p50": round(percentile(values, 50), 3), "max": round(values[-1], 3), "runs": len(values)}
+
+        return {
+            "started_at": datetime.utcnow().isoformat(),
+            "config": {"workers": self.args.workers, "runs": runs},
+            "import_s": stats(imports),
+            "time_to_live_s": stats([boot["live_s"] for boot in boots]),
+            "time_to_ready_s": stats([boot["ready_s"] for boot in boots]),
+        }
+
+    async def wait_ready(self, client: httpx.AsyncClient, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/health/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+        raise SystemExit(f"Server at {self.base_url} did not become ready")
+
+    async def seed_users(self, client: httpx.AsyncClient):
+        """Register/log in the demo accounts and give them their plans"""
+        mongo = MongoClient(self.args.mongo_url) if not self.args.target else None
+        for plan, (email, password, full_name) in DEMO_USERS.items():
+            await client.post("/api/auth/register", json={"email": email, "password": password, "full_name": full_name})
+            if mongo is not None:
+                mongo.get_default_database().users.update_one({"email": email}, {"$set": {"user_type": plan}})
+            response = await client.post("/api/auth/login", json={"email": email, "password": password})
+            if response.status_code != 200:
+                raise SystemExit(f"Could not log in as {email}: HTTP {response.status_code} {response.text}")
+            self.tokens[plan] = response.json()["access_token"]
+
+    # Load -------------------------------------------------------------------
+
+    async def call(self, client: httpx.AsyncClient, name: str, scheduled: float, record: bool):
+        method, path, plan, body = SCENARIOS[name]
+        headers = {"Authorization": f"Bearer {self.tokens[plan]}"} if plan else None
+        payload = body(self.rng) if body else None
+        sent = time.monotonic()
+        try:
+            response = await client.request(method, path, json=payload, headers=headers)
+            code = response.status_code
+        except httpx.HTTPError:
+            code = None
+        done = time.monotonic()
+        if record:
+            self.samples[name].append((done - scheduled, done - sent, code))
+
+    def pick(self):
+        names = [name for name, _weight in self.mix]
+        weights = [weight for _name, weight in self.mix]
+        while True:
+            yield self.rng.choices(names, weights)[0]
+
+    async def open_loop(self, client, start: float, measure_from: float, end: float):
+        """Fixed arrival rate; in-flight requests capped by --concurrency"""
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        tasks = set()
+
+        async def run(name, scheduled):
+            async with semaphore:
+                await self.call(client, name, scheduled, scheduled >= measure_from)
+
+        scenarios = self.pick()
+        for i in itertools.count():
+            scheduled = start + i / self.args.rps
+            if scheduled >= end:
+                break
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(run(next(scenarios), scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    async def closed_loop(self, client, measure_from: float, end: float):
+        """--concurrency workers sending back to back"""
+        scenarios = self.pick()
+
+        async def worker():
+            while time.monotonic() < end:
+                scheduled = time.monotonic()
+                await self.call(client, next(scenarios), scheduled, scheduled >= measure_from)
+
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.args.timeout) as client:
+            await self.wait_ready(client)
+            await self.seed_users(client)
+            start = time.monotonic()
+            measure_from = start + self.args.warmup
+            end = measure_from + self.args.duration
+            if self.args.rps > 0:
+                await self.open_loop(client, start, measure_from, end)
+            else:
+                await self.closed_loop(client, measure_from, end)
+            elapsed = time.monotonic() - measure_from
+
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        return {
+            "started_at": datetime.utcnow().isoformat(),
+            "config": {
+                "target": self.base_url,
+                "mix": dict(self.mix),
+                "rps": self.args.rps,
+                "concurrency": self.args.concurrency,
+                "duration_s": self.args.duration,
+                "warmup_s": self.args.warmup,
+                "workers": None if self.args.target else self.args.workers,
+                "llm_delay_s": self.args.llm_delay,
+                "feed_latency_s": self.args.feed_latency,
+                "rate_limit": self.args.rate_limit,
+            },
+            "elapsed_s": round(elapsed, 3),
+            "endpoints": {name: summarize(samples, elapsed) for name, samples in self.samples.items()},
+            "total": summarize(all_samples, elapsed),
+        }
+
+
+def compare(report: dict, baseline: dict, max_regression_pct: float) -> bool:
+    """Print p95/throughput deltas per endpoint; False when a p95 regressed past the threshold"""
+    ok = True
+    print(f"\n{'endpoint':<18}{'p95 base':>10}{'p95 now':>10}{'delta':>9}{'rps base':>10}{'rps now':>10}", file=sys.stderr)
+    for name, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous or not previous["requests"] or not current["requests"]:
+            continue
+        before, after = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        delta = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if delta > max_regression_pct:
+            ok = False
+            flag = "  REGRESSION"
+        print(f"{name:<18}{before:>10.1f}{after:>10.1f}{delta:>8.1f}%"
+              f"{previous['throughput_rps']:>10.1f}{current['throughput_rps']:>10.1f}{flag}", file=sys.stderr)
+    return ok
+
+
+def print_summary(report: dict):
+    print(f"\n{'endpoint':<18}{'reqs':>8}{'rps':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}", file=sys.stderr)
+    for name, stats in list(report["endpoints"].items()) + [("TOTAL", report["total"])]:
+        latency = stats["latency_ms"]
+        print(f"{name:<18}{stats['requests']:>8}{stats['throughput_rps']:>9.1f}{stats['error_rate'] * 100:>6.1f}%"
+              f"{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--scenarios", default=DEFAULT_MIX, help="Comma-separated name[:weight] list")
+    parser.add_argument("--rps", type=float, default=100.0, help="Total arrival rate; 0 runs closed-loop")
+    parser.add_argument("--concurrency", type=int, default=64, help="Max requests in flight")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the scenario mix")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started server")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017/mk7_benchmark")
+    parser.add_argument("--feed-port", type=int, default=8012)
+    parser.add_argument("--feed-latency", type=float, default=0.05, help="Stub CoinGecko response delay")
+    parser.add_argument("--llm-delay", type=float, default=1.0, help="Fake analysis provider delay")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--no-analysis-cache", action="store_true", help="Send every analysis to the provider")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the rate limiter on")
+    parser.add_argument("--startup", type=int, metavar="RUNS",
+                        help="Instead of load, measure import time and time to first request over RUNS cold starts")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Allowed p95 increase in percent")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    benchmark = MK7Benchmark(args)
+    if args.startup:
+        if args.target:
+            raise SystemExit("--startup starts its own servers; it cannot be combined with --target")
+        report = benchmark.run_startup(args.startup)
+        print(f"\nimport {report['import_s']}\nlive   {report['time_to_live_s']}\nready  {report['time_to_ready_s']}",
+              file=sys.stderr)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+        return 0
+    if not args.target:
+        benchmark.start_stack()
+    try:
+        report = asyncio.run(benchmark.run())
+    finally:
+        benchmark.stop_stack()
+
+    print_summary(report)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            if not compare(report, json.load(f), args.max_regression):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
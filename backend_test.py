@@ -11,7 +11,44 @@ from datetime import datetime
 
 # Use the frontend environment URL for testing
 BACKEND_URL = "http://localhost:8001"
-API_BASE = f"{BACKEND_URL}/api"
+API_PREFIX = "/api"
+API_BASE = f"{BACKEND_URL}{API_PREFIX}"
+
+# Scenario definitions shared with backend_benchmark.py: name -> (method, path under API_BASE)
+ENDPOINTS = {
+    "health": ("GET", "/health"),
+    "register": ("POST", "/auth/register"),
+    "login": ("POST", "/auth/login"),
+    "me": ("GET", "/auth/me"),
+    "crypto_prices": ("GET", "/market/crypto-prices"),
+    "gemini_analysis": ("POST", "/analysis/gemini"),
+    "admin_users": ("GET", "/admin/users"),
+    "admin_settings": ("GET", "/admin/settings"),
+}
+
+# Same accounts as create_demo_users.py: plan -> (email, password, full name)
+DEMO_USERS = {
+    "admin": ("admin@mk7.com", "admin123", "Admin User"),
+    "premium": ("premium@mk7.com", "premium123", "Premium User"),
+    "basic": ("basic@mk7.com", "basic123", "Basic User"),
+}
+
+TEST_USER = {
+    "email": "testuser@mk7.com",
+    "password": "testpass123",
+    "full_name": "Test User"
+}
+
+ANALYSIS_REQUEST = {
+    "symbol": "BTC",
+    "timeframe": "1d",
+    "analysis_type": "technical"
+}
+
+
+def endpoint_url(name):
+    return f"{API_BASE}{ENDPOINTS[name][1]}"
+
 
 class MK7BackendTester:
     def __init__(self):
@@ -39,7 +76,7 @@ class MK7BackendTester:
     def test_health_check(self):
         """Test basic health endpoint"""
         try:
-            response = self.session.get(f"{API_BASE}/health")
+            response = self.session.get(endpoint_url("health"))
             if response.status_code == 200:
                 data = response.json()
                 if data.get("status") == "healthy":
@@ -55,14 +92,8 @@ class MK7BackendTester:
     
     def test_user_registration(self):
         """Test user registration endpoint"""
-        test_user = {
-            "email": "testuser@mk7.com",
-            "password": "testpass123",
-            "full_name": "Test User"
-        }
-        
         try:
-            response = self.session.post(f"{API_BASE}/auth/register", json=test_user)
+            response = self.session.post(endpoint_url("register"), json=TEST_USER)
             if response.status_code == 200:
                 data = response.json()
                 if "access_token" in data and "user" in data:
@@ -83,7 +114,7 @@ class MK7BackendTester:
         """Test user login and return token"""
         try:
             login_data = {"email": email, "password": password}
-            response = self.session.post(f"{API_BASE}/auth/login", json=login_data)
+            response = self.session.post(endpoint_url("login"), json=login_data)
             
             if response.status_code == 200:
                 data = response.json()
@@ -109,7 +140,7 @@ class MK7BackendTester:
         """Test /auth/me endpoint with token"""
         try:
             headers = {"Authorization": f"Bearer {token}"}
-            response = self.session.get(f"{API_BASE}/auth/me", headers=headers)
+            response = self.session.get(endpoint_url("me"), headers=headers)
             
             if response.status_code == 200:
                 data = response.json()
@@ -127,7 +158,7 @@ class MK7BackendTester:
     def test_crypto_prices(self):
         """Test cryptocurrency prices endpoint"""
         try:
-            response = self.session.get(f"{API_BASE}/market/crypto-prices")
+            response = self.session.get(endpoint_url("crypto_prices"))
             
             if response.status_code == 200:
                 data = response.json()
@@ -150,14 +181,8 @@ class MK7BackendTester:
         """Test Gemini AI analysis endpoint"""
         try:
             headers = {"Authorization": f"Bearer {token}"}
-            analysis_request = {
-                "symbol": "BTC",
-                "timeframe": "1d",
-                "analysis_type": "technical"
-            }
-            
-            response = self.session.post(f"{API_BASE}/analysis/gemini", 
-                                       json=analysis_request, headers=headers)
+            response = self.session.post(endpoint_url("gemini_analysis"),
+                                       json=ANALYSIS_REQUEST, headers=headers)
             
             if response.status_code == 200:
                 data = response.json()
@@ -180,7 +205,7 @@ class MK7BackendTester:
         """Test getting admin settings"""
         try:
             headers = {"Authorization": f"Bearer {admin_token}"}
-            response = self.session.get(f"{API_BASE}/admin/settings", headers=headers)
+            response = self.session.get(endpoint_url("admin_settings"), headers=headers)
             
             if response.status_code == 200:
                 data = response.json()
@@ -206,7 +231,7 @@ class MK7BackendTester:
                 "payment_api_keys": {"stripe": "test_key"}
             }
             
-            response = self.session.put(f"{API_BASE}/admin/settings", 
+            response = self.session.put(endpoint_url("admin_settings"), 
                                       json=settings_update, headers=headers)
             
             if response.status_code == 200:
@@ -226,7 +251,7 @@ class MK7BackendTester:
         """Test getting all users (admin only)"""
         try:
             headers = {"Authorization": f"Bearer {admin_token}"}
-            response = self.session.get(f"{API_BASE}/admin/users", headers=headers)
+            response = self.session.get(endpoint_url("admin_users"), headers=headers)
             
             if response.status_code == 200:
                 data = response.json()
@@ -266,7 +291,7 @@ class MK7BackendTester:
         """Test that admin endpoints reject non-admin users"""
         try:
             # Try to access admin endpoint without token
-            response = self.session.get(f"{API_BASE}/admin/settings")
+            response = self.session.get(endpoint_url("admin_settings"))
             if response.status_code == 401:
                 self.log_test("Unauthorized Access", True, "Admin endpoint properly protected")
                 return True
@@ -291,13 +316,13 @@ class MK7BackendTester:
         self.test_user_registration()
         
         # Login with demo users
-        self.admin_token = self.test_user_login("admin@mk7.com", "admin123", "admin")
-        self.premium_token = self.test_user_login("premium@mk7.com", "premium123", "premium")
-        self.basic_token = self.test_user_login("basic@mk7.com", "basic123", "basic")
+        self.admin_token = self.test_user_login(*DEMO_USERS["admin"][:2], "admin")
+        self.premium_token = self.test_user_login(*DEMO_USERS["premium"][:2], "premium")
+        self.basic_token = self.test_user_login(*DEMO_USERS["basic"][:2], "basic")
         
         # Test auth/me endpoint
         if self.admin_token:
-            self.test_auth_me(self.admin_token, "admin@mk7.com")
+            self.test_auth_me(self.admin_token, DEMO_USERS["admin"][0])
         
         # 3. Market data tests
         print("\n📊 Testing Market Data...")
@@ -320,7 +345,7 @@ class MK7BackendTester:
                 # Find testuser to upgrade
                 test_user_id = None
                 for user in users_data:
-                    if user.get("email") == "testuser@mk7.com":
+                    if user.get("email") == TEST_USER["email"]:
                         test_user_id = user.get("id")
                         break
                 
@@ -1,73 +1,124 @@
 #!/usr/bin/env python3
 """
 Script to create demo users for MK7 Trading Bot
+
+Writes straight to MongoDB through the same bulk importer as
+POST /api/admin/users/import: passwords are hashed on a process pool, users
+are inserted in unordered batches, and plans are assigned in the same pass.
+
+    python create_demo_users.py                              # admin/premium/basic demo accounts
+    python create_demo_users.py --file users.ndjson          # fixture: NDJSON lines or a JSON array
+    python create_demo_users.py --generate 100000 --premium-share 0.2 --rounds 4
 """
-import sys
+import argparse
+import asyncio
+import json
 import os
-sys.path.append('/app/backend')
-
-import requests
-from datetime import datetime
-
-API_URL = "http://localhost:8001"
-
-def create_demo_users():
-    """Create demo users with different plan types"""
-    
-    demo_users = [
-        {
-            "email": "admin@mk7.com",
-            "password": "admin123",
-            "full_name": "Admin User",
-            "user_type": "admin"
-        },
-        {
-            "email": "premium@mk7.com", 
-            "password": "premium123",
-            "full_name": "Premium User",
-            "user_type": "premium"
-        },
-        {
-            "email": "basic@mk7.com",
-            "password": "basic123", 
-            "full_name": "Basic User",
-            "user_type": "basic"
+import random
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.append(BACKEND_DIR)
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+
+from repository import create_client, UserRepository, ensure_indexes
+from provisioning import UserImporter, iter_ndjson, iter_rows
+
+DEMO_USERS = [
+    {"email": "admin@mk7.com", "password": "admin123", "full_name": "Admin User", "user_type": "admin"},
+    {"email": "premium@mk7.com", "password": "premium123", "full_name": "Premium User", "user_type": "premium"},
+    {"email": "basic@mk7.com", "password": "basic123", "full_name": "Basic User", "user_type": "basic"},
+]
+
+
+def generated_users(count: int, premium_share: float, seed: int = 7):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "email": f"user{i:06d}@staging.mk7.com",
+            "password": f"staging-{i:06d}",
+            "full_name": f"Staging User {i}",
+            "user_type": "premium" if rng.random() < premium_share else "basic",
         }
-    ]
-    
-    print("Creating demo users...")
-    
-    for user_data in demo_users:
+
+
+async def read_file(path: str):
+    """Stream an NDJSON file in chunks; a file starting with '[' is read as one JSON array"""
+    with open(path, "rb") as f:
+        if f.read(1) == b"[":
+            f.seek(0)
+            async for row in iter_rows(json.load(f)):
+                yield row
+            return
+        f.seek(0)
+
+        async def chunks():
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    return
+                yield chunk
+
+        async for row in iter_ndjson(chunks()):
+            yield row
+
+
+async def create_demo_users(args) -> dict:
+    client = create_client(args.mongo_url)
+    try:
+        database = client.get_database()
+        await ensure_indexes(database)
+        importer = UserImporter(
+            UserRepository(database), rounds=args.rounds, batch_size=args.batch_size, max_workers=args.workers
+        )
+        if args.file:
+            rows = read_file(args.file)
+        elif args.generate:
+            rows = iter_rows(generated_users(args.generate, args.premium_share))
+        else:
+            rows = iter_rows(DEMO_USERS)
         try:
-            # Register user
-            response = requests.post(f"{API_URL}/api/auth/register", json={
-                "email": user_data["email"],
-                "password": user_data["password"],
-                "full_name": user_data["full_name"]
-            })
-            
-            if response.status_code == 200:
-                print(f"✅ Created user: {user_data['email']}")
-                
-                # For admin user, upgrade the plan
-                if user_data["user_type"] != "basic":
-                    token = response.json()["access_token"]
-                    
-                    # First, we need to create an admin token to upgrade users
-                    # For now, let's just note that manual upgrade will be needed
-                    print(f"   Note: {user_data['email']} needs manual upgrade to {user_data['user_type']}")
-                    
-            else:
-                print(f"❌ Failed to create user {user_data['email']}: {response.text}")
-                
-        except Exception as e:
-            print(f"❌ Error creating user {user_data['email']}: {str(e)}")
-    
-    print("\nDemo users created! Use these credentials to test:")
-    print("- Admin: admin@mk7.com / admin123")
-    print("- Premium: premium@mk7.com / premium123") 
-    print("- Basic: basic@mk7.com / basic123")
-    print("\nNote: Admin will need to manually upgrade premium user in the admin dashboard.")
+            return await importer.import_rows(rows, default_plan=args.plan)
+        finally:
+            importer.shutdown()
+    finally:
+        client.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--file", help="NDJSON (or JSON array) of users: email, password or password_hash, full_name, user_type")
+    source.add_argument("--generate", type=int, help="Create this many synthetic staging users")
+    parser.add_argument("--premium-share", type=float, default=0.1, help="Fraction of generated users on premium")
+    parser.add_argument("--plan", default="basic", choices=["basic", "premium", "admin"], help="Plan for rows without user_type")
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL"), help="Defaults to MONGO_URL from backend/.env")
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")), help="bcrypt cost")
+    parser.add_argument("--workers", type=int, help="Hashing processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    if not args.mongo_url:
+        parser.error("MONGO_URL is not set; pass --mongo-url")
+
+    print("Creating demo users...")
+    report = asyncio.run(create_demo_users(args))
+    print(f"✅ Inserted {report['inserted']} of {report['received']} users in {report['elapsed_s']}s "
+          f"({', '.join(f'{plan}: {count}' for plan, count in sorted(report['by_plan'].items())) or 'none'})")
+    for error in report["errors"][:20]:
+        print(f"❌ line {error['line']} {error['email'] or ''}: {error['error']}")
+    if report["failed"] > 20:
+        print(f"   ... {report['failed'] - 20} more rejected rows")
+
+    if not args.file and not args.generate:
+        print("\nDemo users created! Use these credentials to test:")
+        print("- Admin: admin@mk7.com / admin123")
+        print("- Premium: premium@mk7.com / premium123")
+        print("- Basic: basic@mk7.com / basic123")
+    return 0
+
 
 if __name__ == "__main__":
-    create_demo_users()
\ No newline at end of file
+    sys.exit(main())
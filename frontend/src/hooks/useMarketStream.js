@@ -0,0 +1,66 @@
+import { useEffect, useRef } from 'react';
+import { useAuth } from '../context/AuthContext';
+
+const API_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+const RECONNECT_DELAY_MS = 5000;
+
+// Merge streamed quotes (keyed by ticker, carrying the CoinGecko id) into
+// the id-keyed shape returned by /api/market/crypto-prices
+export const mergeQuotesById = (current, prices) => {
+  const next = { ...current };
+  Object.values(prices).forEach(({ id, ...quote }) => {
+    if (id) {
+      next[id] = quote;
+    }
+  });
+  return next;
+};
+
+export const useMarketStream = (symbols, { onPrices, onBotEvent } = {}) => {
+  const { token } = useAuth();
+  const handlers = useRef({ onPrices, onBotEvent });
+  handlers.current = { onPrices, onBotEvent };
+  const symbolKey = symbols.join(',');
+
+  useEffect(() => {
+    if (!token) {
+      return undefined;
+    }
+
+    let socket = null;
+    let reconnectTimer = null;
+    let closed = false;
+
+    const connect = () => {
+      const url = `${API_URL.replace(/^http/, 'ws')}/ws/market?token=${encodeURIComponent(token)}`;
+      socket = new WebSocket(url);
+      socket.onopen = () => {
+        if (symbolKey) {
+          socket.send(JSON.stringify({ action: 'subscribe', symbols: symbolKey.split(',') }));
+        }
+      };
+      socket.onmessage = (message) => {
+        const payload = JSON.parse(message.data);
+        if (payload.type === 'prices' && handlers.current.onPrices) {
+          handlers.current.onPrices(payload.data);
+        } else if (payload.type === 'bot' && handlers.current.onBotEvent) {
+          handlers.current.onBotEvent(payload.event);
+        }
+      };
+      socket.onclose = () => {
+        if (!closed) {
+          reconnectTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      if (socket) {
+        socket.close();
+      }
+    };
+  }, [token, symbolKey]);
+};
@@ -18,6 +18,8 @@ const AdminDashboard = () => {
   const { user } = useAuth();
   const [activeTab, setActiveTab] = useState('overview');
   const [users, setUsers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [userSummary, setUserSummary] = useState({ total: 0, by_plan: {} });
   const [settings, setSettings] = useState({
     basic_plan_price: 29.99,
     premium_plan_price: 99.99,
@@ -30,23 +32,37 @@ const AdminDashboard = () => {
   const API_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
   useEffect(() => {
-    if (activeTab === 'users') {
+    if (activeTab === 'overview') {
+      fetchUserSummary();
+    } else if (activeTab === 'users') {
       fetchUsers();
     } else if (activeTab === 'settings') {
       fetchSettings();
     }
   }, [activeTab]);
 
-  const fetchUsers = async () => {
+  const fetchUsers = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API_URL}/api/admin/users`);
-      setUsers(response.data);
+      const response = await axios.get(`${API_URL}/api/admin/users`, {
+        params: cursor ? { limit: 100, cursor } : { limit: 100 }
+      });
+      setUsers(cursor ? [...users, ...response.data] : response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Failed to fetch users:', error);
       toast.error('Failed to fetch users');
     }
   };
 
+  const fetchUserSummary = async () => {
+    try {
+      const response = await axios.get(`${API_URL}/api/admin/users/summary`);
+      setUserSummary(response.data);
+    } catch (error) {
+      console.error('Failed to fetch user summary:', error);
+    }
+  };
+
   const fetchSettings = async () => {
     try {
       const response = await axios.get(`${API_URL}/api/admin/settings`);
@@ -112,12 +128,13 @@ const AdminDashboard = () => {
     toast.success('API key removed (click Save Settings to persist)');
   };
 
+  const basicUsers = userSummary.by_plan.basic || 0;
+  const premiumUsers = userSummary.by_plan.premium || 0;
   const adminStats = {
-    totalUsers: users.length,
-    basicUsers: users.filter(u => u.user_type === 'basic').length,
-    premiumUsers: users.filter(u => u.user_type === 'premium').length,
-    revenue: users.filter(u => u.user_type === 'premium').length * settings.premium_plan_price +
-             users.filter(u => u.user_type === 'basic').length * settings.basic_plan_price
+    totalUsers: userSummary.total,
+    basicUsers,
+    premiumUsers,
+    revenue: premiumUsers * settings.premium_plan_price + basicUsers * settings.basic_plan_price
   };
 
   const tabs = [
@@ -308,6 +325,17 @@ const AdminDashboard = () => {
                 </tbody>
               </table>
             </div>
+            
+            {nextCursor && (
+              <div className="mt-4 text-center">
+                <button
+                  onClick={() => fetchUsers(nextCursor)}
+                  className="btn-secondary"
+                >
+                  Load more
+                </button>
+              </div>
+            )}
           </div>
         )}
 
@@ -10,6 +10,9 @@ import {
   ClockIcon
 } from '@heroicons/react/24/outline';
 import axios from 'axios';
+import { useMarketStream, mergeQuotesById } from '../hooks/useMarketStream';
+
+const STREAM_SYMBOLS = ['BTC', 'ETH', 'BNB', 'ADA', 'SOL', 'MATIC', 'LINK', 'LTC'];
 
 const Dashboard = () => {
   const { user, isPremium } = useAuth();
@@ -23,6 +26,11 @@ const Dashboard = () => {
     fetchCryptoPrices();
   }, []);
 
+  // Live updates after the initial fetch
+  useMarketStream(STREAM_SYMBOLS, {
+    onPrices: (prices) => setCryptoPrices((current) => mergeQuotesById(current, prices))
+  });
+
   const fetchCryptoPrices = async () => {
     try {
       const response = await axios.get(`${API_URL}/api/market/crypto-prices`);
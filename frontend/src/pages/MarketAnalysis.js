@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { 
   ChartBarIcon, 
@@ -9,12 +9,16 @@ import {
   InformationCircleIcon
 } from '@heroicons/react/24/outline';
 import axios from 'axios';
+import { useMarketStream, mergeQuotesById } from '../hooks/useMarketStream';
 import toast from 'react-hot-toast';
 
+const STREAM_SYMBOLS = ['BTC', 'ETH', 'BNB', 'ADA', 'SOL', 'MATIC', 'LINK', 'LTC'];
+
 const MarketAnalysis = () => {
   const { user, isPremium } = useAuth();
   const [analysisData, setAnalysisData] = useState(null);
   const [loading, setLoading] = useState(false);
+  const streamController = useRef(null);
   const [symbol, setSymbol] = useState('BTC');
   const [timeframe, setTimeframe] = useState('1d');
   const [analysisType, setAnalysisType] = useState('technical');
@@ -26,6 +30,11 @@ const MarketAnalysis = () => {
     fetchCryptoPrices();
   }, []);
 
+  // Live updates after the initial fetch
+  useMarketStream(STREAM_SYMBOLS, {
+    onPrices: (prices) => setCryptoPrices((current) => mergeQuotesById(current, prices))
+  });
+
   const fetchCryptoPrices = async () => {
     try {
       const response = await axios.get(`${API_URL}/api/market/crypto-prices`);
@@ -41,24 +50,85 @@ const MarketAnalysis = () => {
       return;
     }
 
+    if (streamController.current) {
+      streamController.current.abort();
+    }
+    const controller = new AbortController();
+    streamController.current = controller;
+
     setLoading(true);
+    setAnalysisData({
+      symbol,
+      timeframe,
+      analysis: '',
+      generated_at: new Date().toISOString(),
+      analyst: 'AI Analyst'
+    });
     try {
-      const response = await axios.post(`${API_URL}/api/analysis/gemini`, {
-        symbol,
-        timeframe,
-        analysis_type: analysisType
+      // Server-sent events: render text deltas as they arrive, metadata comes last
+      const response = await fetch(`${API_URL}/api/analysis/gemini/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: axios.defaults.headers.common['Authorization']
+        },
+        body: JSON.stringify({ symbol, timeframe, analysis_type: analysisType }),
+        signal: controller.signal
       });
-      
-      setAnalysisData(response.data);
+      if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || 'Analysis failed');
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        events.forEach((raw) => {
+          const eventLine = raw.split('\n').find((line) => line.startsWith('event: '));
+          const dataLine = raw.split('\n').find((line) => line.startsWith('data: '));
+          if (!dataLine) {
+            return;
+          }
+          const event = eventLine ? eventLine.slice(7) : 'message';
+          const data = JSON.parse(dataLine.slice(6));
+          if (event === 'error') {
+            throw new Error(data.detail);
+          } else if (event === 'done') {
+            setAnalysisData((current) => ({ ...current, ...data }));
+          } else {
+            setAnalysisData((current) => ({ ...current, analysis: current.analysis + data.delta }));
+          }
+        });
+      }
       toast.success('Analysis completed successfully!');
     } catch (error) {
-      console.error('Analysis failed:', error);
-      toast.error(error.response?.data?.detail || 'Analysis failed');
+      if (error.name !== 'AbortError') {
+        console.error('Analysis failed:', error);
+        toast.error(error.message || 'Analysis failed');
+      }
     } finally {
-      setLoading(false);
+      if (streamController.current === controller) {
+        streamController.current = null;
+        setLoading(false);
+      }
     }
   };
 
+  // Closing the stream on unmount also stops generation server-side
+  useEffect(() => () => {
+    if (streamController.current) {
+      streamController.current.abort();
+    }
+  }, []);
+
   const symbols = [
     { value: 'BTC', label: 'Bitcoin (BTC)' },
     { value: 'ETH', label: 'Ethereum (ETH)' },
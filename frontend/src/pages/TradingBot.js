@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { 
   CpuChipIcon, 
@@ -12,7 +12,9 @@ import {
   ShieldCheckIcon,
   ClockIcon
 } from '@heroicons/react/24/outline';
+import axios from 'axios';
 import toast from 'react-hot-toast';
+import { useMarketStream } from '../hooks/useMarketStream';
 
 const TradingBot = () => {
   const { user, isPremium } = useAuth();
@@ -27,6 +29,37 @@ const TradingBot = () => {
     timeframe: '1h'
   });
 
+  const API_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+
+  useEffect(() => {
+    fetchBotState();
+  }, []);
+
+  useMarketStream([], {
+    onBotEvent: (event) => {
+      if (event.type === 'status') {
+        setBotActive(event.active);
+      } else if (event.trade) {
+        const { side, pair, price } = event.trade;
+        const label = event.type === 'fill' ? 'Filled' : event.type.replace('_', ' ');
+        toast(`${label}: ${side} ${pair} @ $${Number(price).toFixed(2)}`);
+      }
+    }
+  });
+
+  const fetchBotState = async () => {
+    try {
+      const [configResponse, statusResponse] = await Promise.all([
+        axios.get(`${API_URL}/api/bot/config`),
+        axios.get(`${API_URL}/api/bot/status`)
+      ]);
+      setBotConfig(configResponse.data);
+      setBotActive(statusResponse.data.active);
+    } catch (error) {
+      console.error('Failed to fetch bot state:', error);
+    }
+  };
+
   const handleConfigChange = (field, value) => {
     setBotConfig({
       ...botConfig,
@@ -34,18 +67,30 @@ const TradingBot = () => {
     });
   };
 
-  const toggleBot = () => {
+  const toggleBot = async () => {
     if (!isPremium) {
       toast.error('Trading Bot requires Premium subscription');
       return;
     }
     
-    setBotActive(!botActive);
-    toast.success(botActive ? 'Trading Bot stopped' : 'Trading Bot started');
+    try {
+      const response = await axios.post(`${API_URL}/api/bot/${botActive ? 'stop' : 'start'}`);
+      setBotActive(response.data.active);
+      toast.success(response.data.message);
+    } catch (error) {
+      console.error('Failed to toggle bot:', error);
+      toast.error(error.response?.data?.detail || 'Failed to update Trading Bot');
+    }
   };
 
-  const saveConfiguration = () => {
-    toast.success('Bot configuration saved successfully');
+  const saveConfiguration = async () => {
+    try {
+      await axios.put(`${API_URL}/api/bot/config`, botConfig);
+      toast.success('Bot configuration saved successfully');
+    } catch (error) {
+      console.error('Failed to save bot configuration:', error);
+      toast.error('Failed to save bot configuration');
+    }
   };
 
   const strategies = [